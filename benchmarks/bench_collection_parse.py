@@ -0,0 +1,73 @@
+"""コレクションのページ解析のベンチマーク
+
+ET.fromstringでページ全体の木を作ってから各entryを読む場合と、parse_page（iterparse）で
+entryを読み終えるたびに破棄する場合の時間・最大メモリを比較する。
+
+    python benchmarks/bench_collection_parse.py --entries 2000 --content-kb 20
+"""
+
+import argparse
+import io
+import time
+import tracemalloc
+import xml.etree.ElementTree as ET
+
+from cha2hatena.hatena_collection import ATOM, RemoteEntry, parse_page
+from cha2hatena.hatenablog_poster import entry_fields
+
+BASE = "https://blog.hatena.ne.jp/user/blog.hatenablog.com/atom/entry"
+
+
+def build_feed(entries: int, content_kb: int) -> bytes:
+    body = "本文" * (content_kb * 512 // 3)
+    parts = [
+        '<?xml version="1.0" encoding="utf-8"?>',
+        '<feed xmlns="http://www.w3.org/2005/Atom" xmlns:app="http://www.w3.org/2007/app">',
+        f'<link rel="next" href="{BASE}?page=2"/>',
+    ]
+    for n in range(entries):
+        parts.append(
+            f'<entry><link rel="edit" href="{BASE}/{n}"/>'
+            f'<link rel="alternate" href="https://user.hatenablog.com/entry/{n}"/>'
+            f"<author><name>user</name></author><title>記事{n}</title>"
+            f"<updated>2026-01-01T10:00:00+09:00</updated><content>{body}</content>"
+            f'<category term="Python"/><app:control><app:draft>no</app:draft></app:control></entry>'
+        )
+    parts.append("</feed>")
+    return "".join(parts).encode("utf-8")
+
+
+def fromstring(feed: bytes) -> list[RemoteEntry]:
+    root = ET.fromstring(feed)
+    return [RemoteEntry.model_validate(entry_fields(elem)) for elem in root.findall(f"{ATOM}entry")]
+
+
+def iterparse(feed: bytes) -> list[RemoteEntry]:
+    return parse_page(io.BytesIO(feed))[0]
+
+
+def measure(label: str, func, feed: bytes) -> list[RemoteEntry]:
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = func(feed)
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"{label:>10}: {elapsed:.3f} s  peak {peak / 1024 / 1024:.1f} MB")
+    return result
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--entries", type=int, default=2000)
+    parser.add_argument("--content-kb", type=int, default=20)
+    args = parser.parse_args()
+
+    feed = build_feed(args.entries, args.content_kb)
+    print(f"feed: {len(feed) / 1024 / 1024:.1f} MB, {args.entries} entries")
+    expected = measure("fromstring", fromstring, feed)
+    assert measure("iterparse", iterparse, feed) == expected
+
+
+if __name__ == "__main__":
+    main()
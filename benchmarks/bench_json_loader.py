@@ -0,0 +1,98 @@
+"""json_loaderの読み込み方式比較ベンチマーク
+
+全体デコード（json.loads）と末尾走査（load_tail_messages）について、
+経過時間とピークRSSを別プロセスで計測する。
+
+    python benchmarks/bench_json_loader.py --days 365 --per-day 200
+"""
+
+import argparse
+import json
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+
+from cha2hatena import json_loader as jl
+from cha2hatena.timestamps import DT_FORMAT
+
+
+def make_export(path: Path, days: int, per_day: int, say_len: int) -> None:
+    """1日1セッションの合成エクスポートを作成"""
+    rng = random.Random(0)
+    dt = datetime(2025, 1, 1, 9)
+    messages = []
+    for _ in range(days):
+        for i in range(per_day):
+            dt += timedelta(minutes=rng.randint(1, 3))
+            text = "".join(rng.choice('あいうえおabc {}"\n') for _ in range(say_len))
+            messages.append(
+                {"role": "Prompt" if i % 2 == 0 else "Response", "time": dt.strftime(DT_FORMAT), "say": text}
+            )
+        dt = dt.replace(hour=9, minute=0) + timedelta(days=1)
+    data = {"metadata": {"title": "bench", "link": "https://example.com/bench"}, "messages": messages}
+    path.write_text(json.dumps(data, ensure_ascii=False, indent=2), encoding="utf-8")
+
+
+def peak_rss_mb() -> float:
+    try:
+        import resource
+    except ImportError:  # Windows
+        return float("nan")
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss / 1024 / 1024 if sys.platform == "darwin" else rss / 1024
+
+
+def run_once(mode: str, path: Path) -> dict:
+    start = time.perf_counter()
+    if mode == "full":
+        messages = json.loads(path.read_text(encoding="utf-8"))["messages"]
+    else:
+        messages = jl.load_tail_messages(path)
+    logs, _ = jl.convert_to_str(messages, "Claude")
+    return {"mode": mode, "seconds": time.perf_counter() - start, "peak_rss_mb": peak_rss_mb(), "logs": len(logs)}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--days", type=int, default=365)
+    parser.add_argument("--per-day", type=int, default=200)
+    parser.add_argument("--say-len", type=int, default=1000)
+    parser.add_argument("--run", choices=["make", "full", "tail"], help=argparse.SUPPRESS)
+    parser.add_argument("--file", type=Path, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run == "make":
+        make_export(args.file, args.days, args.per_day, args.say_len)
+        return
+    if args.run:
+        print(json.dumps(run_once(args.run, args.file)))
+        return
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = Path(tmp) / "Claude-bench.json"
+        # 親プロセスのRSSが子に引き継がれないよう、生成も別プロセスで行う
+        subprocess.run(
+            [sys.executable, __file__, "--run", "make", "--file", str(path)]
+            + ["--days", str(args.days), "--per-day", str(args.per_day), "--say-len", str(args.say_len)],
+            check=True,
+        )
+        print(f"file: {path.stat().st_size / 1024 / 1024:.1f} MB, messages: {args.days * args.per_day}")
+        for mode in ("full", "tail"):
+            out = subprocess.run(
+                [sys.executable, __file__, "--run", mode, "--file", str(path)],
+                capture_output=True,
+                text=True,
+                check=True,
+            ).stdout
+            result = json.loads(out.strip().splitlines()[-1])
+            print(
+                f"{mode:>5}: {result['seconds']:.3f} s  peak RSS {result['peak_rss_mb']:.1f} MB  logs {result['logs']}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+"""json_loaderの逐次読み込みとプロセスプールによる並列読み込みの比較ベンチマーク
+
+各ファイルのメッセージをすべて同じ日付にし、ファイル全体が要約対象になる（重い）ケースを計測する。
+
+    python benchmarks/bench_parallel_loader.py --files 16 --messages 20000
+
+使えるCPUが1つの環境では逐次読み込み同士の比較になる（倍率は誤差のみ）。
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import logging
+import random
+import tempfile
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+
+from cha2hatena import json_loader as jl
+from cha2hatena.timestamps import DT_FORMAT
+
+
+def make_exports(directory: Path, files: int, messages: int, say_len: int) -> list[Path]:
+    rng = random.Random(0)
+    paths = []
+    for idx in range(files):
+        dt = datetime(2025, 11, 20, 0, 0)
+        items = []
+        for i in range(messages):
+            dt += timedelta(seconds=rng.randint(1, 4))
+            text = "".join(rng.choice("あいうえおabc \n") for _ in range(say_len))
+            items.append({"role": "Prompt" if i % 2 == 0 else "Response", "time": dt.strftime(DT_FORMAT), "say": text})
+        path = directory / f"Claude-bench{idx:02}.json"
+        data = {"metadata": {"link": f"https://example.com/{idx}"}, "messages": items}
+        path.write_text(json.dumps(data, ensure_ascii=False), encoding="utf-8")
+        paths.append(path)
+    return paths
+
+
+def timed_load(paths: list[Path], max_workers: int | None) -> tuple[float, str]:
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        result = jl.json_loader(paths, max_workers=max_workers)
+    return time.perf_counter() - start, result
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--files", type=int, default=16)
+    parser.add_argument("--messages", type=int, default=20000)
+    parser.add_argument("--say-len", type=int, default=200)
+    parser.add_argument("--workers", type=int, default=None)
+    args = parser.parse_args()
+
+    logging.getLogger("cha2hatena").setLevel(logging.ERROR)
+    jl.PARALLEL_MIN_BYTES = 0
+
+    with tempfile.TemporaryDirectory() as tmp:
+        paths = make_exports(Path(tmp), args.files, args.messages, args.say_len)
+        total_mb = sum(p.stat().st_size for p in paths) / 1024 / 1024
+        workers = jl.parallel_workers(len(paths), int(total_mb * 1024 * 1024), args.workers)
+        print(f"files: {len(paths)}, total: {total_mb:.1f} MB, cpus: {jl.available_cpus()}, workers: {workers}")
+        if workers == 1:
+            print("並列読み込みの条件を満たさないため、両方とも逐次読み込みになります（比較にはCPUが複数必要）")
+
+        serial_sec, serial = timed_load(paths, max_workers=1)
+        parallel_sec, parallel = timed_load(paths, max_workers=args.workers)
+        assert parallel == serial, "並列読み込みの結果が逐次読み込みと一致しません"
+
+        print(f"  serial: {serial_sec:.3f} s")
+        print(f"parallel: {parallel_sec:.3f} s  (x{serial_sec / parallel_sec:.2f})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,51 @@
+"""料金計算のベンチマーク
+
+履歴の各回をTokenStatsで1件ずつ計算する場合と、PricingEngine.fee_arraysで一括計算する場合を比較する。
+
+    python benchmarks/bench_pricing.py --runs 200000
+"""
+
+import argparse
+import random
+import time
+
+import numpy as np
+
+from cha2hatena.llm.llm_stats import TokenStats
+from cha2hatena.llm.pricing import default_engine
+
+MODELS = ["deepseek-chat", "deepseek-reasoner", "gemini-2.5-flash", "gemini-2.5-pro"]
+
+
+def timed(label: str, func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    print(f"{label:>12}: {time.perf_counter() - start:.3f} s")
+    return result
+
+
+def per_run(runs: list[tuple]) -> list[float]:
+    return [TokenStats(i, t, o, 0, 0, model, cache_hit_tokens=h).total_fee for model, i, t, o, h in runs]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", type=int, default=200_000)
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    runs = []
+    for _ in range(args.runs):
+        input_tokens = rng.randint(1_000, 400_000)
+        hit = rng.randint(0, input_tokens)
+        runs.append((rng.choice(MODELS), input_tokens, rng.randint(0, 4_000), rng.randint(100, 8_000), hit))
+    models, inputs, thoughts, outputs, hits = map(list, zip(*runs))
+    engine = default_engine()
+
+    expected = timed("per_run", per_run, runs)
+    fees = timed("fee_arrays", engine.fee_arrays, models, inputs, thoughts, outputs, hits)
+    assert np.allclose(fees["total"], expected)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+"""会話ログからプロンプトを組み立てるまでのメモリ使用量ベンチマーク
+
+変更前の組み立て（ファイルごと・会話ごと・プロンプトごとに連結し直す）と、
+断片を積んで1回だけ連結する現在の組み立てについて、ピークメモリを別プロセスで計測する。
+
+    python benchmarks/bench_prompt_memory.py --files 4 --messages 50000
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import logging
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+
+from bench_parallel_loader import make_exports
+
+from cha2hatena import json_loader as jl
+from cha2hatena.llm.conversational_ai import BlogPost, LlmConfig
+from cha2hatena.llm.deepseek_client import DeepseekClient
+
+PROMPT = "以下の会話ログを学習記録のブログ記事にしてください。"
+
+
+def legacy_prompt(paths: list[Path], model: str) -> str:
+    """変更前の組み立て（比較用）"""
+    conversations = []
+    for idx, (path, ai_name) in enumerate(zip(paths, jl.ai_names_from_paths(paths)), 1):
+        logs, _ = jl.convert_to_str(jl.load_messages(path), ai_name)
+        text = "\n".join(logs[::-1])
+        conversations.append(f"{'=' * 20} {idx}個目の会話 {'=' * 20}\n\n" + "\n" + text)
+    conversation = "\n\n\n".join(conversations)
+    statement = f"またその最後には、「この記事は {model} により自動生成されています」と目立つように注記してください。"
+    prompt = PROMPT + statement + "\n\n" + conversation  # 旧ConversationalAi.__init__
+    schema = (
+        f"次の行から示すプロンプトはこのPydanticモデルに合うJSONで出力してください: {BlogPost.model_json_schema()}\n"
+    )
+    return schema + prompt  # 旧DeepseekClient.get_summaryでの再連結
+
+
+def current_prompt(paths: list[Path], model: str) -> str:
+    conversation = jl.json_loader(paths)
+    return DeepseekClient(LlmConfig(prompt=PROMPT, model=model, api_key="dummy", conversation=conversation)).prompt
+
+
+def peak_rss_mb() -> float:
+    try:
+        import resource
+    except ImportError:  # Windows
+        return float("nan")
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss / 1024 / 1024 if sys.platform == "darwin" else rss / 1024
+
+
+def run_once(mode: str, paths: list[Path]) -> dict:
+    logging.getLogger("cha2hatena").setLevel(logging.ERROR)
+    build = legacy_prompt if mode == "legacy" else current_prompt
+    tracemalloc.start()
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        prompt = build(paths, "deepseek-chat")
+    seconds = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return {
+        "mode": mode,
+        "seconds": seconds,
+        "peak_traced_mb": peak / 1024 / 1024,
+        "peak_rss_mb": peak_rss_mb(),
+        "prompt_chars": len(prompt),
+        "prompt_hash": hash(prompt),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--files", type=int, default=4)
+    parser.add_argument("--messages", type=int, default=50000)
+    parser.add_argument("--say-len", type=int, default=200)
+    parser.add_argument("--run", choices=["make", "legacy", "current"], help=argparse.SUPPRESS)
+    parser.add_argument("--dir", type=Path, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run == "make":
+        make_exports(args.dir, args.files, args.messages, args.say_len)
+        return
+    if args.run:
+        print(json.dumps(run_once(args.run, sorted(args.dir.glob("*.json")))))
+        return
+
+    with tempfile.TemporaryDirectory() as tmp:
+        # 親プロセスのRSSが子に引き継がれないよう、生成も別プロセスで行う
+        common = ["--files", str(args.files), "--messages", str(args.messages), "--say-len", str(args.say_len)]
+        subprocess.run([sys.executable, __file__, "--run", "make", "--dir", tmp] + common, check=True)
+        total_mb = sum(p.stat().st_size for p in Path(tmp).glob("*.json")) / 1024 / 1024
+        print(f"files: {args.files}, total: {total_mb:.1f} MB")
+
+        results = []
+        for mode in ("legacy", "current"):
+            out = subprocess.run(
+                [sys.executable, __file__, "--run", mode, "--dir", tmp],
+                capture_output=True,
+                text=True,
+                check=True,
+                env={**os.environ, "PYTHONHASHSEED": "0"},
+            ).stdout
+            result = json.loads(out.strip().splitlines()[-1])
+            results.append(result)
+            print(
+                f"{mode:>8}: {result['seconds']:.3f} s  peak traced {result['peak_traced_mb']:.1f} MB"
+                f"  peak RSS {result['peak_rss_mb']:.1f} MB  prompt {result['prompt_chars']} chars"
+            )
+        assert results[0]["prompt_hash"] == results[1]["prompt_hash"], "変更前とプロンプトが一致しません"
+
+
+if __name__ == "__main__":
+    main()
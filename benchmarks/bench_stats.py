@@ -0,0 +1,81 @@
+"""cha2hatena statsの集計のベンチマーク
+
+合成した実行履歴（既定で20万件）をSQLiteに書き込み、読み込み・集計の時間を計測する。
+
+    python benchmarks/bench_stats.py --runs 200000
+"""
+
+import argparse
+import random
+import tempfile
+import time
+from datetime import date, datetime, timedelta
+from pathlib import Path
+
+import pandas  # noqa: F401  インポート時間を計測に含めないため先に読み込む
+
+from cha2hatena.run_history import RECORD_COLUMNS, RunHistory
+from cha2hatena.stats import LOAD_COLUMNS, StatsSettings, build_report
+
+MODELS = ["deepseek-chat", "deepseek-reasoner", "gemini-2.5-flash", "gemini-2.5-pro"]
+AI_NAMES = ["Claude", "ChatGPT", "Gemini"]
+
+
+def make_records(count: int) -> list[dict]:
+    rng = random.Random(0)
+    start = datetime(2024, 1, 1)
+    records = []
+    for i in range(count):
+        record = {key: None for key in RECORD_COLUMNS}
+        record.update(
+            {
+                "timestamp": (start + timedelta(minutes=5 * i)).isoformat(),
+                "model": rng.choice(MODELS),
+                "AI_name": rng.choice(AI_NAMES),
+                "input_tokens": rng.randint(1_000, 200_000),
+                "output_tokens": rng.randint(100, 4_000),
+                "total_fee (USD)": rng.random() / 10,
+            }
+        )
+        records.append(record)
+    return records
+
+
+def timed(label: str, func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    print(f"{label:>12}: {time.perf_counter() - start:.3f} s")
+    return result
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", type=int, default=200_000)
+    args = parser.parse_args()
+
+    records = make_records(args.runs)
+    rng = random.Random(1)
+    latencies = [rng.uniform(5, 120) for _ in records]
+    last_day = date.fromisoformat(records[-1]["timestamp"][:10])
+
+    with tempfile.TemporaryDirectory() as tmp:
+        history = RunHistory(Path(tmp) / "history.sqlite3")
+        timed("write", history.add_many, records, latencies)
+        runs = timed("read_frame", history.read_frame, LOAD_COLUMNS)
+        print(f"{'rows':>12}: {len(runs)}")
+        report = timed(
+            "build_report",
+            build_report,
+            history,
+            StatsSettings(monthly_budget_usd=100.0),
+            ["day", "model", "ai"],
+            None,
+            None,
+            None,
+            last_day,
+        )
+        print(report.splitlines()[0])
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+"""convert_to_strの時刻変換・区切り判定のマイクロベンチマーク
+
+従来のstrptimeによる1件ずつの判定と、固定位置の切り出し・NumPyによる一括判定を比較する。
+
+    python benchmarks/bench_timestamps.py --messages 100000
+"""
+
+import argparse
+import logging
+import random
+import time
+from datetime import datetime, timedelta
+
+import numpy  # noqa: F401  インポート時間を計測に含めないため先に読み込む
+
+from cha2hatena import json_loader as jl
+from cha2hatena import timestamps as ts
+
+
+def make_messages(count: int) -> list[dict]:
+    rng = random.Random(0)
+    dt = datetime(2025, 1, 1, 0, 0)
+    messages = []
+    for i in range(count):
+        dt += timedelta(seconds=rng.randint(1, 60))
+        messages.append({"role": "Prompt" if i % 2 == 0 else "Response", "time": dt.strftime(ts.DT_FORMAT), "say": "x"})
+    return messages
+
+
+def strptime_convert_to_str(messages: list[dict], ai_name: str) -> tuple[list, str | None]:
+    """変更前のconvert_to_str（比較用）"""
+    latest = messages[-1].get("time", "")
+    latest_dt = datetime.strptime(latest, ts.DT_FORMAT) if latest else None
+    logs = []
+    previous_dt = latest_dt
+    for message in reversed(messages):
+        timestamp = message.get("time", None)
+        if timestamp:
+            msg_dt = datetime.strptime(timestamp, ts.DT_FORMAT)
+            if ts.is_session_break(msg_dt, latest_dt, previous_dt):
+                break
+        agent = jl.get_agent(message, ai_name)
+        text = message.get("say", "").replace("\n\n", "\n")
+        logs.append(f"date: {timestamp} \nagent: {agent}\n[message]\n{text}{jl.MESSAGE_SEPARATOR}")
+        if timestamp:
+            previous_dt = msg_dt
+    return logs, timestamp
+
+
+def timed(label: str, func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    print(f"{label:>28}: {time.perf_counter() - start:.3f} s")
+    return result
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--messages", type=int, default=100_000)
+    args = parser.parse_args()
+
+    logging.getLogger("cha2hatena").setLevel(logging.ERROR)
+    messages = make_messages(args.messages)
+    stamps = [m["time"] for m in messages]
+    print(f"messages: {len(messages)}")
+
+    timed("strptime", lambda: [datetime.strptime(s, ts.DT_FORMAT) for s in stamps])
+    timed("parse_timestamp", lambda: [ts.parse_timestamp(s) for s in stamps])
+    timed("to_seconds", lambda: [ts.to_seconds(s) for s in stamps])
+
+    ts.VECTORIZE_MIN = 10**12
+    python_start = timed("find_session_start (python)", ts.find_session_start, stamps)
+    ts.VECTORIZE_MIN = 1
+    numpy_start = timed("find_session_start (numpy)", ts.find_session_start, stamps)
+    assert python_start == numpy_start
+
+    old = timed("convert_to_str (strptime)", strptime_convert_to_str, messages, "Claude")
+    new = timed("convert_to_str", jl.convert_to_str, messages, "Claude")
+    assert old == new, "変更前のconvert_to_strと結果が一致しません"
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+"""投稿リクエストの組み立て・投稿結果の解析のベンチマーク
+
+変更前のElementTreeで組み立ててET.tostringする方法・XPathでfindを繰り返す解析と、
+テンプレートへの埋め込み・子要素を1回だけ走査する解析を比較する。
+
+    python benchmarks/bench_xml_entry.py --entries 2000 --content-kb 50
+"""
+
+import argparse
+import time
+import xml.etree.ElementTree as ET
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+
+from cha2hatena.hatenablog_poster import parse_response, xml_unparser
+
+NS = {"atom": "http://www.w3.org/2005/Atom", "app": "http://www.w3.org/2007/app"}
+UPDATED = datetime(2026, 1, 1, tzinfo=timezone(timedelta(hours=9)))
+
+
+def tree_unparser(title: str, content: str, categories: list, is_draft: bool) -> bytes:
+    """変更前のxml_unparser（比較用。リクエストの本文にするためエンコードまで含める）"""
+    root = ET.Element("entry", attrib={"xmlns": NS["atom"], "xmlns:app": NS["app"]})
+    ET.SubElement(root, "title").text = title
+    ET.SubElement(root, "updated").text = UPDATED.isoformat()
+    ET.SubElement(ET.SubElement(root, "author"), "name").text = None
+    ET.SubElement(root, "content", attrib={"type": "text/x-markdown"}).text = content
+    control = ET.SubElement(root, "app:control")
+    ET.SubElement(control, "app:draft").text = "yes" if is_draft else "no"
+    ET.SubElement(control, "app:preview").text = "no"
+    for cat in categories:
+        ET.SubElement(root, "category", attrib={"term": cat})
+    return ET.tostring(root, encoding="unicode").encode("utf-8")
+
+
+def tree_parse(text: str) -> dict:
+    """変更前のparse_response（比較用）"""
+    root = ET.fromstring(text)
+
+    def find(key, attr=None):
+        elem = root.find(key, NS)
+        return "" if elem is None else (elem.get(attr) if attr else elem.text)
+
+    link_edit = find("atom:link[@rel='edit']", "href")
+    return {
+        "title": find("atom:title"),
+        "author": find("atom:author/atom:name"),
+        "content": find("atom:content"),
+        "time": datetime.fromisoformat(find("atom:updated")),
+        "link_edit": link_edit,
+        "link_edit_user": str(link_edit).replace("atom/entry/", "edit?entry="),
+        "link_alternate": find("atom:link[@rel='alternate']", "href"),
+        "categories": [c.get("term") for c in root.findall("atom:category", NS) if c.get("term", "")],
+        "is_draft": find("app:control/app:draft") == "yes",
+    }
+
+
+def response_body(n: int, content: str) -> bytes:
+    return (
+        f'<entry xmlns="{NS["atom"]}" xmlns:app="{NS["app"]}">'
+        f"<id>tag:blog.hatena.ne.jp,2013:blog-user-{n}</id>"
+        f'<link rel="edit" href="https://blog.hatena.ne.jp/user/blog/atom/entry/{n}"/>'
+        f'<link rel="alternate" type="text/html" href="https://user.hatenablog.com/entry/{n}"/>'
+        f"<author><name>user</name></author><title>記事{n}</title>"
+        f"<updated>{UPDATED.isoformat()}</updated><published>{UPDATED.isoformat()}</published>"
+        f'<summary type="text">{content[:100]}</summary><content type="text/x-markdown">{content}</content>'
+        f'<category term="Python"/><category term="自動投稿"/>'
+        f"<app:control><app:draft>no</app:draft><app:preview>no</app:preview></app:control></entry>"
+    ).encode("utf-8")
+
+
+def timed(label: str, func, items: list):
+    start = time.perf_counter()
+    result = [func(item) for item in items]
+    print(f"{label:>18}: {time.perf_counter() - start:.3f} s")
+    return result
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--entries", type=int, default=2000)
+    parser.add_argument("--content-kb", type=int, default=50)
+    args = parser.parse_args()
+
+    body = ("## 見出し\n\nif a < b && c > d: `code`\n" * 40)[: args.content_kb * 1024 // 3]
+    posts = [(f"記事{n} <&>", body, ["Python", "自動投稿"], n % 2 == 0) for n in range(args.entries)]
+
+    expected = timed("ET.tostring", lambda p: tree_unparser(*p), posts)
+    actual = timed("template", lambda p: xml_unparser(*p[:3], updated=UPDATED, is_draft=p[3]), posts)
+    assert actual == expected
+
+    responses = [response_body(n, body.replace("&", "&amp;").replace("<", "&lt;")) for n in range(args.entries)]
+    expected = timed("find", lambda r: tree_parse(r.decode("utf-8")), responses)
+    actual = timed("single pass", lambda r: parse_response(SimpleNamespace(status_code=201, content=r)), responses)
+    assert [{k: v for k, v in result.items() if k != "status_code"} for result in actual] == expected
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,208 @@
+import asyncio
+import logging
+import time
+from pathlib import Path
+
+import yaml
+from pydantic import BaseModel, Field
+
+from . import main as app
+from . import retry
+from .entry_index import conversation_digest
+from .json_loader import NoNewMessagesError
+from .llm.llm_stats import TokenStats
+from .llm.summary_cache import SummaryCache
+from .side_effects import SideEffectTask
+
+logger = logging.getLogger(__name__)
+
+
+class BatchJob(BaseModel):
+    name: str = Field(default="", description="ジョブ名（ログ表示用）")
+    paths: list[Path] = Field(min_length=1, description="1回の投稿にまとめる会話ログ")
+
+
+class StageConcurrency(BaseModel):
+    llm: int = Field(ge=1, default=4, description="読み込み・要約の同時実行数")
+    hatena: int = Field(ge=1, default=2, description="はてなブログ投稿の同時実行数")
+    line: int = Field(ge=1, default=2, description="LINE通知の同時実行数")
+    sheets: int = Field(ge=1, default=1, description="記録（CSV・スプレッドシート）の同時実行数")
+
+
+class BatchManifest(BaseModel):
+    jobs: list[BatchJob] = Field(min_length=1, description="ジョブ一覧")
+    concurrency: StageConcurrency = Field(default_factory=StageConcurrency)
+
+
+def load_manifest(path: Path) -> BatchManifest:
+    """マニフェスト(YAML)を読み込み、相対パスはマニフェストの場所を基準に解決"""
+    manifest = BatchManifest.model_validate(yaml.safe_load(path.read_text(encoding="utf-8")))
+    for idx, job in enumerate(manifest.jobs, 1):
+        job.name = job.name or f"job{idx}"
+        job.paths = [p if p.is_absolute() else path.parent / p for p in job.paths]
+    return manifest
+
+
+class BatchRunner:
+    """ステージごとに同時実行数を制限しながら、複数ジョブを非同期に処理"""
+
+    def __init__(
+        self,
+        concurrency: StageConcurrency,
+        is_draft: bool = False,
+        cache: SummaryCache | None = None,
+        incremental: bool = False,
+    ):
+        self.is_draft = is_draft
+        self.cache = cache
+        self.incremental = incremental
+        self.semaphores = {stage: asyncio.Semaphore(limit) for stage, limit in concurrency.model_dump().items()}
+        self._dy_rate: asyncio.Task | None = None
+        self._csv_lock = asyncio.Lock()  # record.csvへの追記は直列化
+        # 投稿後に失敗した処理（flushで再試行キューへ保存し、次回のmainの実行時に再試行）
+        self.deferred: list[SideEffectTask] = []
+
+    # 外部呼び出しが1回だけのステージ（再試行で関数全体を再実行しても、成功済みの呼び出しを繰り返さない）
+    DEFERRED_RETRY_STAGES = frozenset({"hatena", "line", "sheets"})
+
+    async def in_stage(self, stage: str, func, *args, **kwargs):
+        """同期関数をステージの同時実行数の範囲内でスレッド実行
+
+        DEFERRED_RETRY_STAGESでは、外部サービスの一時的なエラーの待機中にステージの枠とスレッドを空けて
+        他のジョブを進める。llm（読み込みと、分割した要約の複数回の呼び出し）は、完了した要約を再度呼び出さないよう
+        各呼び出しの中で待って再試行する。
+        """
+
+        async def attempt():
+            async with self.semaphores[stage]:
+                return await asyncio.to_thread(func, *args, **kwargs)
+
+        if stage not in self.DEFERRED_RETRY_STAGES:
+            return await attempt()
+        return await retry.policy().call_async(attempt, name=stage)
+
+    def summarize(self, paths: list[Path], state) -> tuple[dict, TokenStats, str]:
+        """会話履歴を読み込んで要約し、会話のハッシュ（投稿済みの記事を更新する際のキー）も返す"""
+        conversation = app.load_conversation(paths, state)
+        llm_outputs, llm_stats = app.summarize_conversation(conversation, app.app_context().llm_config, self.cache)
+        return llm_outputs, llm_stats, conversation_digest(conversation)
+
+    async def side_effect(self, job: BatchJob, stage: str, task: SideEffectTask) -> bool:
+        """投稿後の処理を1つ実行。失敗した場合は再試行キューに回してFalse（ジョブの失敗にはしない）"""
+        try:
+            await self.in_stage(stage, app.SIDE_EFFECT_HANDLERS[task.name], **task.payload)
+        except (Exception, SystemExit) as e:
+            logger.error(f"[{job.name}] {task.name}の処理に失敗しました。次回の実行時に再試行します。")
+            logger.info(f"[{job.name}] 詳細: {e!r}", exc_info=True)
+            self.deferred.append(task.model_copy(update={"attempts": 1, "last_error": repr(e)}))
+            return False
+        return True
+
+    async def after_post(self, job: BatchJob, blogpost_result: dict, llm_stats: TokenStats, started: float) -> list:
+        """LINE通知・ファイル出力・実行履歴・スプレッドシート出力。失敗した処理の名前を返す"""
+        line = SideEffectTask(name="line", payload={"line_text": app.build_line_text(blogpost_result)})
+        failed = [] if await self.side_effect(job, "line", line) else [line.name]
+
+        # 為替レートはバッチ全体で1回だけ取得
+        dy_rate = await self._dy_rate
+        csv_data = app.build_record(job.paths, blogpost_result, llm_stats, dy_rate)
+        title = blogpost_result.get("title", "")
+        content = blogpost_result.get("content", "")
+        outputs = SideEffectTask(name="outputs", payload={"csv_data": csv_data, "title": title, "content": content})
+        async with self._csv_lock:
+            if not await self.side_effect(job, "sheets", outputs):
+                failed.append(outputs.name)
+        history = SideEffectTask(
+            name="history", payload={"csv_data": csv_data, "latency_seconds": time.perf_counter() - started}
+        )
+        if not await self.side_effect(job, "sheets", history):
+            failed.append(history.name)
+        # スプレッドシートへはflushでまとめて送信（失敗した行はflushで再試行キューへ）
+        await self.in_stage("sheets", app.record_to_spreadsheet, csv_data, False)
+        return failed
+
+    async def run_job(self, job: BatchJob) -> dict:
+        started = time.perf_counter()
+        state = app.build_ingest_state(self.incremental)
+        try:
+            llm_outputs, llm_stats, conversation_key = await self.in_stage("llm", self.summarize, job.paths, state)
+            blogpost_result = await self.in_stage(
+                "hatena", app.post_to_hatena, llm_outputs, self.is_draft, conversation_key
+            )
+            if state is not None:
+                state.commit()
+        except NoNewMessagesError:
+            logger.warning(f"[{job.name}] 新しいメッセージがないためスキップしました。")
+            return {"name": job.name, "ok": True, "url": "", "seconds": time.perf_counter() - started}
+        # 要約クライアントは致命的なエラーでsys.exitするため、他のジョブを止めないよう捕捉
+        except (Exception, SystemExit) as e:
+            logger.error(f"[{job.name}] 処理に失敗しました。")
+            logger.info(f"[{job.name}] 詳細: {e!r}", exc_info=True)
+            return {"name": job.name, "ok": False, "url": "", "seconds": time.perf_counter() - started}
+
+        # 投稿後の失敗はジョブの失敗にしない（マニフェストを再実行すると二重に投稿されるため）
+        try:
+            deferred = await self.after_post(job, blogpost_result, llm_stats, started)
+        except (Exception, SystemExit) as e:
+            logger.error(f"[{job.name}] 投稿後の記録に失敗しました（投稿は完了しています）。")
+            logger.info(f"[{job.name}] 詳細: {e!r}", exc_info=True)
+            deferred = ["record"]
+        if deferred:
+            logger.warning(f"[{job.name}] 投稿済み（再試行キューに回した処理: {', '.join(deferred)}）")
+        else:
+            logger.warning(f"[{job.name}] 完了: {blogpost_result.get('link_edit_user', '')}")
+        return {
+            "name": job.name,
+            "ok": True,
+            "url": blogpost_result.get("link_alternate", ""),
+            "seconds": time.perf_counter() - started,
+            "deferred": deferred,
+        }
+
+    async def flush(self) -> None:
+        """スプレッドシートへまとめて送信し、失敗した処理を再試行キューへ保存"""
+        rows = await self.in_stage("sheets", app.flush_spreadsheet)
+        self.deferred += [SideEffectTask(name="sheets", payload={"csv_data": row}, attempts=1) for row in rows]
+        deferred, self.deferred = self.deferred, []
+        if deferred:
+            await asyncio.to_thread(app.defer_side_effects, deferred)
+
+    def refresh_dy_rate(self) -> None:
+        """為替レートの取得を開始（取得中の場合はその結果を待つ）"""
+        if self._dy_rate is None or self._dy_rate.done():
+            self._dy_rate = asyncio.create_task(asyncio.to_thread(app.fetch_usd_jpy))
+
+    async def run(self, jobs: list[BatchJob]) -> list[dict]:
+        self.refresh_dy_rate()
+        results = await asyncio.gather(*(self.run_job(job) for job in jobs))
+        await self.flush()
+        return results
+
+
+def run_batch(manifest_path: Path, use_cache: bool = True, incremental: bool = False) -> int:
+    """バッチモードのエントリーポイント。全ジョブ成功で0を返す"""
+
+    manifest = load_manifest(manifest_path)
+    logger.warning(f"{len(manifest.jobs)}件のジョブをバッチ処理します: {manifest_path}")
+
+    runner = BatchRunner(
+        manifest.concurrency,
+        is_draft=app.app_context().debug,
+        cache=app.build_summary_cache(use_cache),
+        incremental=incremental,
+    )
+    results = asyncio.run(runner.run(manifest.jobs))
+
+    print("=" * 60)
+    for result in results:
+        mark = "✓" if result["ok"] else "✗"
+        deferred = f" （再試行キュー: {', '.join(result['deferred'])}）" if result.get("deferred") else ""
+        print(f"{mark} {result['name']} ({result['seconds']:.1f}秒) {result['url']}{deferred}")
+    print("=" * 60)
+
+    failed = sum(not result["ok"] for result in results)
+    if failed:
+        logger.error(f"{failed}/{len(results)}件のジョブが失敗しました。詳細はapp.logを確認してください")
+        return 1
+    logger.warning(f"☑ {len(results)}件のジョブがすべて完了しました。")
+    return 0
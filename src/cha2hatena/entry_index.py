@@ -0,0 +1,97 @@
+import hashlib
+import json
+import logging
+import os
+import threading
+from datetime import datetime
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+# 同一プロセス内（バッチモード）での同時書き込みを防ぐ
+_LOCK = threading.Lock()
+
+
+def conversation_digest(conversation: str) -> str:
+    """読み込んだ会話を識別するハッシュ（同じ会話の再実行で同じ記事を更新するためのキー）"""
+    return hashlib.sha256(conversation.encode("utf-8")).hexdigest()
+
+
+def content_digest(title: str, content: str, categories: list, is_draft: bool) -> str:
+    """投稿内容を識別するハッシュ（カテゴリーの順序は区別しない）"""
+    material = json.dumps([title, content, sorted(categories), is_draft], ensure_ascii=False)
+    return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+
+class EntryIndex:
+    """投稿済みエントリーの索引（JSON）。会話・投稿内容のハッシュから編集用URI（link_edit）を引く
+
+    entries: link_edit → 投稿結果と現在の投稿内容のハッシュ
+    contents: 投稿内容のハッシュ → link_edit（更新したエントリーの古い内容は削除）
+    conversations: 会話のハッシュ → link_edit
+    """
+
+    def __init__(self, path: Path):
+        self.path = path
+        self._data = self._load()
+
+    def _load(self) -> dict:
+        try:
+            data = json.loads(self.path.read_text(encoding="utf-8"))
+        except FileNotFoundError:
+            data = {}
+        except json.JSONDecodeError:
+            logger.warning(f"投稿済みエントリーの索引を読み込めませんでした。空の索引として扱います: {self.path}")
+            data = {}
+        for key in ("entries", "contents", "conversations"):
+            data.setdefault(key, {})
+        return data
+
+    def find_content(self, digest: str) -> dict | None:
+        """同じ内容で投稿済み（その後更新されていない）エントリーの投稿結果"""
+        link_edit = self._data["contents"].get(digest)
+        entry = self._data["entries"].get(link_edit) if link_edit else None
+        return entry["result"] if entry else None
+
+    def find_conversation(self, conversation_key: str) -> dict | None:
+        """同じ会話から投稿したエントリーの投稿結果"""
+        link_edit = self._data["conversations"].get(conversation_key)
+        entry = self._data["entries"].get(link_edit) if link_edit else None
+        return entry["result"] if entry else None
+
+    def record(self, result: dict, digest: str, conversation_key: str | None = None) -> None:
+        """投稿・更新の結果を保存"""
+        self.record_many([(result, digest, conversation_key)])
+
+    def record_many(self, items: list[tuple[dict, str, str | None]]) -> int:
+        """(投稿結果, 投稿内容のハッシュ, 会話のハッシュ)をまとめて保存し、保存した件数を返す
+
+        他のプロセスの追記を消さないよう、読み直してから書き込む。
+        """
+        recorded_at = datetime.now().isoformat(timespec="seconds")
+        with _LOCK:
+            data = self._load()
+            count = 0
+            for result, digest, conversation_key in items:
+                link_edit = result.get("link_edit")
+                if not link_edit:
+                    continue
+                previous = data["entries"].get(link_edit)
+                if previous is not None:
+                    data["contents"].pop(previous["content_digest"], None)
+                data["entries"][link_edit] = {
+                    "content_digest": digest,
+                    "result": json.loads(json.dumps(result, ensure_ascii=False, default=str)),  # 時刻は文字列で保存
+                    "recorded_at": recorded_at,
+                }
+                data["contents"][digest] = link_edit
+                if conversation_key:
+                    data["conversations"][conversation_key] = link_edit
+                count += 1
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = self.path.with_suffix(".tmp")
+            tmp_path.write_text(json.dumps(data, ensure_ascii=False, indent=2), encoding="utf-8")
+            os.replace(tmp_path, self.path)
+        self._data = data
+        logger.debug(f"投稿済みエントリーの索引を更新しました: {count}件")
+        return count
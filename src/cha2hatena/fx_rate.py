@@ -0,0 +1,156 @@
+import json
+import logging
+import math
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Callable
+
+from pydantic import BaseModel, Field
+
+logger = logging.getLogger(__name__)
+
+ENV_OVERRIDE = "USD_JPY_RATE"
+
+
+class FxSettings(BaseModel):
+    ttl_hours: float = Field(default=12, gt=0, description="キャッシュしたレートを最新とみなす時間")
+    max_stale_days: float = Field(default=30, ge=0, description="取得に失敗した場合に古いレートを使う期限（日）")
+    rate_file: str = Field(default="", description="USD/JPYレートを書いたファイル（指定時はネットワークを使わない）")
+    max_wait_seconds: float = Field(default=5, ge=0, description="記録時にレート取得の完了を待つ最大秒数")
+
+
+def _parse_rate(value: str, source: str) -> float | None:
+    """指定されたレートを数値に変換（正の数でなければ警告してNone）"""
+    try:
+        rate = float(value)
+    except ValueError:
+        rate = math.nan
+    if not 0 < rate < math.inf:
+        logger.warning(f"{source}の為替レートが数値ではないため使用しません: {value!r}")
+        return None
+    return rate
+
+
+def env_source() -> float | None:
+    """環境変数USD_JPY_RATEによる固定レート"""
+    value = os.getenv(ENV_OVERRIDE, "").strip()
+    return _parse_rate(value, f"環境変数{ENV_OVERRIDE}") if value else None
+
+
+def file_source(path: Path) -> float | None:
+    """レートを1行で書いたファイル（例: 150.25）"""
+    try:
+        value = path.read_text(encoding="utf-8").strip()
+    except FileNotFoundError:
+        logger.warning(f"為替レートのファイルが見つかりません: {path}")
+        return None
+    return _parse_rate(value, f"ファイル{path}")
+
+
+def yfinance_source() -> float | None:
+    """ヤフーファイナンスから取得"""
+    import yfinance as yf  # pandasごと読み込まれるため、取得する段階で読み込む
+
+    return float(yf.Ticker("USDJPY=X").history(period="1d").Close.iloc[0])
+
+
+class FxRateProvider:
+    """USD/JPYレートの取得
+
+    環境変数・ファイルの指定があればそれを使い、なければネットワークから取得したレートを
+    ディスクにキャッシュする。キャッシュが古い場合は古いレートを返しつつバックグラウンドで更新する。
+    """
+
+    def __init__(
+        self,
+        cache_path: Path,
+        settings: FxSettings | None = None,
+        remote: Callable[[], float | None] = yfinance_source,
+    ):
+        self.cache_path = cache_path
+        self.settings = settings or FxSettings()
+        self.remote = remote
+        self._lock = threading.Lock()
+        self._refresh: threading.Thread | None = None
+
+    def _local(self) -> float | None:
+        """ネットワークを使わない指定（環境変数→ファイルの順）"""
+        rate = env_source()
+        if rate is None and self.settings.rate_file:
+            rate = file_source(Path(self.settings.rate_file))
+        return rate
+
+    def _read_cache(self) -> dict | None:
+        try:
+            entry = json.loads(self.cache_path.read_text(encoding="utf-8"))
+            return {"rate": float(entry["rate"]), "fetched_at": float(entry["fetched_at"])}
+        except (FileNotFoundError, json.JSONDecodeError, KeyError, TypeError, ValueError):
+            return None
+
+    def _write_cache(self, rate: float) -> None:
+        self.cache_path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.cache_path.with_suffix(f".{os.getpid()}.{threading.get_ident()}.tmp")
+        tmp_path.write_text(json.dumps({"rate": rate, "fetched_at": time.time(), "source": "remote"}), encoding="utf-8")
+        os.replace(tmp_path, self.cache_path)
+
+    def _fetch(self) -> None:
+        try:
+            rate = self.remote()
+        except Exception as e:
+            logger.error("為替レートを取得できませんでした。詳細はapp.logを確認してください")
+            logger.info(f"詳細: {e}", exc_info=True)
+            return
+        if rate is not None:
+            self._write_cache(rate)
+            logger.debug(f"為替レートを更新しました: {rate}")
+
+    def refresh_async(self) -> threading.Thread:
+        """バックグラウンドで取得を開始（取得中の場合はそのスレッドを返す）"""
+        with self._lock:
+            if self._refresh is None or not self._refresh.is_alive():
+                self._refresh = threading.Thread(target=self._fetch, name="fx-rate-refresh", daemon=True)
+                self._refresh.start()
+            return self._refresh
+
+    def prefetch(self) -> None:
+        """キャッシュが古い・ない場合に先行して取得を開始（呼び出し元は待たない）"""
+        if self._local() is not None:
+            return
+        age = self._age(self._read_cache())
+        if age is None or age > self.settings.ttl_hours * 3600:
+            self.refresh_async()
+
+    def get(self, wait: float | None = None) -> float | None:
+        """現在のレート。取得できない場合はNone
+
+        キャッシュが最新ならそのまま返す。古い場合は期限内なら古いレートを返して更新を開始し、
+        使えるレートがない場合のみ最大wait秒（省略時は設定値）だけ取得を待つ。
+        """
+        local = self._local()
+        if local is not None:
+            return local
+
+        entry = self._read_cache()
+        age = self._age(entry)
+        if age is not None and age <= self.settings.ttl_hours * 3600:
+            return entry["rate"]
+
+        thread = self.refresh_async()
+        if age is not None and age <= self._max_age():
+            logger.debug(f"キャッシュの為替レートを使用します（{age / 3600:.1f}時間前）")
+            return entry["rate"]
+
+        thread.join(self.settings.max_wait_seconds if wait is None else wait)
+        entry = self._read_cache()
+        age = self._age(entry)
+        return entry["rate"] if age is not None and age <= self._max_age() else None
+
+    @staticmethod
+    def _age(entry: dict | None) -> float | None:
+        return time.time() - entry["fetched_at"] if entry else None
+
+    def _max_age(self) -> float:
+        """古いレートを使ってよい期限（秒）"""
+        return max(self.settings.ttl_hours * 3600, self.settings.max_stale_days * 86400)
@@ -0,0 +1,191 @@
+import json
+import logging
+import os
+import xml.etree.ElementTree as ET
+from collections import Counter
+from datetime import datetime
+from pathlib import Path
+from typing import IO, Callable, Iterator
+
+from pydantic import BaseModel
+
+from . import http_pool, retry
+from .entry_index import EntryIndex, content_digest
+from .hatenablog_poster import entry_fields
+
+logger = logging.getLogger(__name__)
+
+ATOM = "{http://www.w3.org/2005/Atom}"
+# 空の要素ではテキストがNoneになる項目
+EMPTY_TEXT_FIELDS = ("title", "content")
+
+
+class RemoteEntry(BaseModel):
+    """コレクションから取得したエントリー（parse_responseと同じ項目）"""
+
+    title: str
+    author: str
+    content: str
+    time: datetime
+    link_edit: str
+    link_edit_user: str
+    link_alternate: str
+    categories: list[str]
+    is_draft: bool
+
+
+class CollectionPage(BaseModel):
+    entries: list[RemoteEntry]
+    next_url: str | None = None
+    etag: str | None = None
+    last_modified: str | None = None
+
+
+class CollectionFetchError(RuntimeError):
+    """コレクションの取得に失敗した場合"""
+
+
+def parse_page(stream: IO[bytes]) -> tuple[list[RemoteEntry], str | None]:
+    """フィード1ページ分をiterparseで読み、エントリーと次のページのURL（rel="next"）を返す
+
+    ページ全体の木を作らず、feed直下の要素を読み終えるたびに取り出してfeedから外す。
+    空の<title/>・<content/>は空文字列として扱う。
+    """
+    entries, next_url, depth, root = [], None, 0, None
+    for event, elem in ET.iterparse(stream, events=("start", "end")):
+        if event == "start":
+            if root is None:
+                root = elem
+            depth += 1
+            continue
+        depth -= 1
+        if depth != 1:
+            continue
+        if elem.tag == f"{ATOM}entry":
+            fields = entry_fields(elem)
+            for key in EMPTY_TEXT_FIELDS:
+                fields[key] = fields.get(key) or ""
+            entries.append(RemoteEntry.model_validate(fields))
+        elif elem.tag == f"{ATOM}link" and elem.get("rel") == "next":
+            next_url = elem.get("href")
+        root.remove(elem)  # clearだけでは空の要素がfeedに残り続ける
+    return entries, next_url
+
+
+class PageCache:
+    """ページのURLごとの取得結果とETag・Last-Modified（JSON）"""
+
+    def __init__(self, path: Path):
+        self.path = path
+        self.pages: dict[str, CollectionPage] = self._load()
+        self.dirty = False
+
+    def _load(self) -> dict[str, CollectionPage]:
+        try:
+            data = json.loads(self.path.read_text(encoding="utf-8"))
+            return {url: CollectionPage.model_validate(page) for url, page in data.items()}
+        except FileNotFoundError:
+            return {}
+        except ValueError:
+            logger.warning(f"コレクションのキャッシュを読み込めませんでした。すべて取得し直します: {self.path}")
+            return {}
+
+    def get(self, url: str) -> CollectionPage | None:
+        return self.pages.get(url)
+
+    def put(self, url: str, page: CollectionPage) -> None:
+        self.pages[url] = page
+        self.dirty = True
+
+    def save(self) -> None:
+        if not self.dirty:
+            return
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.path.with_suffix(".tmp")
+        data = {url: page.model_dump(mode="json") for url, page in self.pages.items()}
+        tmp_path.write_text(json.dumps(data, ensure_ascii=False), encoding="utf-8")
+        os.replace(tmp_path, self.path)
+        self.dirty = False
+
+
+class CollectionClient:
+    """はてなブログAtomPubのコレクション（投稿済みエントリーの一覧）を取得
+
+    rel="next"をたどって全ページを取得する。取得済みのページはETag・If-Modified-Sinceで再検証し、
+    変更がなければ（304）本文を受け取らずにキャッシュを使う。
+    """
+
+    def __init__(self, collection_url: str, cache: PageCache, session_factory: Callable):
+        self.collection_url = collection_url
+        self.cache = cache
+        self.session_factory = session_factory
+        self.stats = Counter()  # fetched（取得）・not_modified（304）
+
+    def fetch_page(self, url: str) -> CollectionPage:
+        cached = self.cache.get(url)
+        headers = {}
+        if cached is not None and cached.etag:
+            headers["If-None-Match"] = cached.etag
+        if cached is not None and cached.last_modified:
+            headers["If-Modified-Since"] = cached.last_modified
+
+        response = retry.call(
+            self.session_factory().get,
+            url,
+            headers=headers,
+            timeout=http_pool.timeout(),
+            stream=True,  # 受信しながら解析
+            name="はてなブログ",
+            check_status=True,
+        )
+        try:
+            if response.status_code == 304 and cached is not None:
+                self.stats["not_modified"] += 1
+                return cached
+            if response.status_code != 200:
+                raise CollectionFetchError(f"コレクションを取得できませんでした（{response.status_code}）: {url}")
+            response.raw.decode_content = True  # gzipで返された場合も展開して解析
+            entries, next_url = parse_page(response.raw)
+        finally:
+            response.close()
+
+        page = CollectionPage(
+            entries=entries,
+            next_url=next_url,
+            etag=response.headers.get("ETag"),
+            last_modified=response.headers.get("Last-Modified"),
+        )
+        self.cache.put(url, page)
+        self.stats["fetched"] += 1
+        return page
+
+    def iter_entries(self, max_pages: int | None = None) -> Iterator[RemoteEntry]:
+        """新しい順にすべてのエントリー（max_pagesで取得するページ数を制限）"""
+        url, pages, seen = self.collection_url, 0, set()
+        try:
+            while url and url not in seen and (max_pages is None or pages < max_pages):
+                seen.add(url)
+                page = self.fetch_page(url)
+                pages += 1
+                yield from page.entries
+                url = page.next_url
+        finally:
+            self.cache.save()
+            logger.warning(
+                f"コレクションを{pages}ページ確認しました"
+                f"（取得{self.stats['fetched']}件・変更なし{self.stats['not_modified']}件）"
+            )
+
+
+def sync_index(entries: list[RemoteEntry], index: EntryIndex) -> int:
+    """取得したエントリーを投稿済みエントリーの索引へ反映（他の環境から投稿した記事も重複として検出できる）"""
+    items = []
+    for entry in entries:
+        result = {"status_code": 200, **entry.model_dump(mode="json")}
+        items.append((result, content_digest(entry.title, entry.content, entry.categories, entry.is_draft), None))
+    return index.record_many(items)
+
+
+def category_counts(entries: list[RemoteEntry]) -> Counter:
+    """カテゴリーごとの記事数（既存のカテゴリーの再利用・集計用）"""
+    return Counter(category for entry in entries for category in entry.categories)
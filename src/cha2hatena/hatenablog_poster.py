@@ -4,21 +4,51 @@ from datetime import datetime, timedelta, timezone
 from typing import Any
 
 from requests import Response
-from requests_oauthlib import OAuth1Session
+
+from . import http_pool, retry
 
 logger = logging.getLogger(__name__)
 
 
-def safe_find(root: ET.Element, key: str, ns: dict | None = None, default: str = "") -> str:
-    """ヘルパー関数: Noneの場合返却を空文字に"""
-    elem = root.find(key, ns)
-    return elem.text if elem is not None else default
+ATOM = "{http://www.w3.org/2005/Atom}"
+APP = "{http://www.w3.org/2007/app}"
+
+# 投稿リクエストのテンプレート（ElementTreeで組み立ててET.tostringした場合と同じ文字列になる）
+_ENTRY_START = '<entry xmlns="http://www.w3.org/2005/Atom" xmlns:app="http://www.w3.org/2007/app">'
+_ENTRY_CONTROL = "<app:control><app:draft>{draft}</app:draft><app:preview>no</app:preview></app:control>"
+_ENTRY_END = "</entry>"
+
+
+def escape_text(text: str) -> str:
+    """要素の本文のエスケープ（ET.tostringと同じ規則）"""
+    if "&" in text:
+        text = text.replace("&", "&amp;")
+    if "<" in text:
+        text = text.replace("<", "&lt;")
+    if ">" in text:
+        text = text.replace(">", "&gt;")
+    return text
+
 
+def escape_attrib(text: str) -> str:
+    """属性値のエスケープ（ET.tostringと同じく、改行・タブは文字参照に）"""
+    text = escape_text(text)
+    if '"' in text:
+        text = text.replace('"', "&quot;")
+    if "\r" in text:
+        text = text.replace("\r", "&#13;")
+    if "\n" in text:
+        text = text.replace("\n", "&#10;")
+    if "\t" in text:
+        text = text.replace("\t", "&#09;")
+    return text
 
-def safe_find_attr(root: ET.Element, key: str, attr: str, ns: dict | None = None, default: str = "") -> str:
-    """属性取得用ヘルパー関数"""
-    elem = root.find(key, ns)
-    return elem.get(attr) if elem is not None else default
+
+def _element(tag: str, text: str | None, attrib: str = "") -> str:
+    """本文が空の場合はET.tostringと同じく<tag />"""
+    if not text:
+        return f"<{tag}{attrib} />"
+    return f"<{tag}{attrib}>{escape_text(text)}</{tag}>"
 
 
 def xml_unparser(
@@ -29,10 +59,11 @@ def xml_unparser(
     author: str | None = None,
     updated: datetime | None = None,
     is_draft: bool = False,
-) -> str:
-    """はてなブログ投稿リクエストの形式へ変換"""
+) -> bytes:
+    """はてなブログ投稿リクエストの形式へ変換（UTF-8のバイト列。そのままリクエストの本文に使う）
 
-    logger.debug(f"{'=' * 25}xml_unparserの処理開始{'=' * 25}")
+    要素の木は作らず、テンプレートにエスケープした値を埋め込む。
+    """
 
     # 公開時刻設定
     jst = timezone(timedelta(hours=9))
@@ -41,41 +72,37 @@ def xml_unparser(
     elif updated.tzinfo is None:
         updated = updated.replace(tzinfo=jst)  # timezoneなしの場合JST
 
-    ROOT = ET.Element(
-        "entry",
-        attrib={
-            "xmlns": "http://www.w3.org/2005/Atom",
-            "xmlns:app": "http://www.w3.org/2007/app",
-        },
-    )
-    TITLE = ET.SubElement(ROOT, "title")
-    UPDATED = ET.SubElement(ROOT, "updated")
-    AUTHOR = ET.SubElement(ROOT, "author")
-    NAME = ET.SubElement(AUTHOR, "name")
-    CONTENT = ET.SubElement(ROOT, "content", attrib={"type": "text/x-markdown"})
-    CONTROL = ET.SubElement(ROOT, "app:control")
-    DRAFT = ET.SubElement(CONTROL, "app:draft")
-    PREVIEW = ET.SubElement(CONTROL, "app:preview")
-    for cat in categories + preset_categories:
-        ET.SubElement(ROOT, "category", attrib={"term": cat})
-
-    TITLE.text = title
-    UPDATED.text = updated.isoformat()  # timezoneありの場合それに従う
-    NAME.text = author
-    CONTENT.text = content
-    DRAFT.text = "yes" if is_draft else "no"
-    PREVIEW.text = "no"
-
-    logger.debug(f"{'=' * 25}☑ xml_unparserの処理終了{'=' * 25}")
-    return ET.tostring(ROOT, encoding="unicode")
-
-
-def hatena_oauth(xml_str: str, hatena_secret_keys: dict) -> dict:
+    parts = [
+        _ENTRY_START,
+        _element("title", title),
+        _element("updated", updated.isoformat()),  # timezoneありの場合それに従う
+        f"<author>{_element('name', author)}</author>",
+        _element("content", content, ' type="text/x-markdown"'),
+        _ENTRY_CONTROL.format(draft="yes" if is_draft else "no"),
+    ]
+    parts += [f'<category term="{escape_attrib(cat)}" />' for cat in categories + preset_categories]
+    parts.append(_ENTRY_END)
+    # 本文が大きい場合も、連結・エンコードは最後に1回だけ
+    return "".join(parts).encode("utf-8")
+
+
+def hatena_oauth(xml_str: bytes, hatena_secret_keys: dict) -> Response:
     """はてなブログへ投稿"""
 
-    URL = hatena_secret_keys.pop("hatena_entry_url")
-    oauth = OAuth1Session(**hatena_secret_keys)
-    response = oauth.post(URL, data=xml_str, headers={"Content-Type": "application/xml; charset=utf-8"})
+    keys = dict(hatena_secret_keys)  # 呼び出し元の辞書は変更しない（複数回投稿のため）
+    URL = keys.pop("hatena_entry_url")
+    oauth = http_pool.get_oauth_session(**keys)  # 同じ認証情報なら接続を再利用
+    # 二重投稿を防ぐため、再試行は処理されていないことが確実な場合（429など）のみ
+    response = retry.call(
+        oauth.post,
+        URL,
+        data=xml_str,
+        headers={"Content-Type": "application/xml; charset=utf-8"},
+        timeout=http_pool.timeout(),
+        name="はてなブログ",
+        idempotent=False,
+        check_status=True,
+    )
 
     logger.debug(f"Status: {response.status_code}")
     if response.status_code == 201:
@@ -85,37 +112,81 @@ def hatena_oauth(xml_str: str, hatena_secret_keys: dict) -> dict:
     return response
 
 
-def parse_response(response: Response) -> dict[str, Any]:
-    """投稿結果を取得"""
+def hatena_update(xml_str: bytes, link_edit: str, hatena_secret_keys: dict) -> Response:
+    """投稿済みのエントリーを更新（AtomPubのPUT。同じ内容で置き換えるだけなので再送しても重複しない）"""
+
+    keys = dict(hatena_secret_keys)
+    keys.pop("hatena_entry_url")
+    oauth = http_pool.get_oauth_session(**keys)
+    response = retry.call(
+        oauth.put,
+        link_edit,
+        data=xml_str,
+        headers={"Content-Type": "application/xml; charset=utf-8"},
+        timeout=http_pool.timeout(),
+        name="はてなブログ",
+        check_status=True,
+    )
 
-    # 名前空間
-    NS = {"atom": "http://www.w3.org/2005/Atom", "app": "http://www.w3.org/2007/app"}
+    logger.debug(f"Status: {response.status_code}")
+    if response.status_code == 200:
+        logger.warning("✓ はてなブログの記事を更新しました")
+    else:
+        logger.error("✗ リクエスト中にエラー発生。はてなブログの記事を更新できませんでした。")
+    return response
+
+
+# 1つ目の要素の本文だけを使う子要素 → 結果のキー
+_TEXT_FIELDS = {f"{ATOM}title": "title", f"{ATOM}content": "content", f"{ATOM}updated": "updated"}
 
-    root = ET.fromstring(response.text)
+
+def entry_fields(root: ET.Element) -> dict[str, Any]:
+    """entry要素から投稿内容・URLを取得（投稿結果・コレクションの各エントリーで共用）
+
+    子要素を1回だけ走査する。同じ要素が複数ある場合は最初のものを使う。
+    """
+    found: dict[str, Any] = {}
     categories = []
-    for category_elem in root.findall("atom:category", NS):
-        term = category_elem.get("term", "")
-        if term:
-            categories.append(term)
-    link_edit = safe_find_attr(root, "atom:link[@rel='edit']", "href", NS)
-    link_edit_user = str(link_edit).replace("atom/entry/", "edit?entry=")
-
-    response_dict = {
-        "status_code": response.status_code,
+    for child in root:
+        tag = child.tag
+        if tag == f"{ATOM}link":
+            rel = child.get("rel")
+            if rel in ("edit", "alternate"):
+                found.setdefault(f"link_{rel}", child.get("href"))
+        elif tag == f"{ATOM}category":
+            term = child.get("term", "")
+            if term:
+                categories.append(term)
+        elif tag in _TEXT_FIELDS:
+            found.setdefault(_TEXT_FIELDS[tag], child.text)
+        elif tag == f"{ATOM}author" and "author" not in found:
+            name = child.find(f"{ATOM}name")
+            if name is not None:
+                found["author"] = name.text
+        elif tag == f"{APP}control" and "is_draft" not in found:
+            draft = child.find(f"{APP}draft")
+            if draft is not None:
+                found["is_draft"] = draft.text == "yes"
+
+    link_edit = found.get("link_edit", "")
+    return {
         # Atom名前空間の要素
-        "title": safe_find(root, "{http://www.w3.org/2005/Atom}title"),  # XML名前空間の実体
-        "author": safe_find(root, "atom:author/atom:name", NS),
-        "content": safe_find(root, "atom:content", NS),
-        "time": datetime.fromisoformat(safe_find(root, "atom:updated", NS)),
+        "title": found.get("title", ""),
+        "author": found.get("author", ""),
+        "content": found.get("content", ""),
+        "time": datetime.fromisoformat(found.get("updated", "")),
         "link_edit": link_edit,
-        "link_edit_user": link_edit_user,
-        "link_alternate": safe_find_attr(root, "atom:link[@rel='alternate']", "href", NS),
+        "link_edit_user": str(link_edit).replace("atom/entry/", "edit?entry="),
+        "link_alternate": found.get("link_alternate", ""),
         "categories": categories,
         # app名前空間の要素
-        "is_draft": safe_find(root, "app:control/app:draft", NS) == "yes",
+        "is_draft": found.get("is_draft", False),
     }
 
-    return response_dict
+
+def parse_response(response: Response) -> dict[str, Any]:
+    """投稿結果を取得（レスポンスのバイト列をそのまま解析）"""
+    return {"status_code": response.status_code, **entry_fields(ET.fromstring(response.content))}
 
 
 def blog_post(
@@ -127,8 +198,13 @@ def blog_post(
     author: str | None = None,
     updated: datetime | None = None,
     is_draft: bool = False,
+    link_edit: str | None = None,
 ) -> dict:
+    """link_editを指定すると新規投稿ではなく、そのエントリーを更新"""
     xml_entry = xml_unparser(title, content, categories, preset_categories, author, updated, is_draft)
-    res = hatena_oauth(xml_entry, hatena_secret_keys)
+    if link_edit:
+        res = hatena_update(xml_entry, link_edit, hatena_secret_keys)
+    else:
+        res = hatena_oauth(xml_entry, hatena_secret_keys)
 
     return parse_response(res)
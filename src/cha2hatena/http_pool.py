@@ -0,0 +1,84 @@
+import logging
+import threading
+from typing import TYPE_CHECKING
+
+from pydantic import BaseModel, Field
+
+if TYPE_CHECKING:  # requestsは実際に通信する段階で読み込む（起動時間短縮）
+    import requests
+    from requests_oauthlib import OAuth1Session
+
+logger = logging.getLogger(__name__)
+
+
+class HttpSettings(BaseModel):
+    pool_connections: int = Field(default=4, ge=1, description="接続先ホストごとのプール数")
+    pool_maxsize: int = Field(default=10, ge=1, description="1ホストあたりの最大保持接続数")
+    connect_timeout: float = Field(default=10, gt=0, description="接続タイムアウト（秒）")
+    read_timeout: float = Field(default=60, gt=0, description="応答待ちタイムアウト（秒）")
+    llm_timeout: float = Field(default=600, gt=0, description="LLM APIの応答待ちタイムアウト（秒）")
+
+
+_settings = HttpSettings()
+_sessions: dict[tuple, "requests.Session"] = {}
+_lock = threading.Lock()
+
+
+def configure(settings: HttpSettings) -> None:
+    """設定を反映（作成済みのセッションは閉じ、次回利用時に作り直す）"""
+    global _settings
+    _settings = settings
+    close_all()
+
+
+def settings() -> HttpSettings:
+    return _settings
+
+
+def timeout() -> tuple[float, float]:
+    """requestsに渡す(接続, 応答待ち)のタイムアウト"""
+    return (_settings.connect_timeout, _settings.read_timeout)
+
+
+def _mount(session: "requests.Session") -> "requests.Session":
+    from requests.adapters import HTTPAdapter
+    from urllib3.util.retry import Retry
+
+    # 再試行はすべて呼び出し元のretry.callで行う（ここでも再送すると回数が掛け算になり、リトライ枠も効かない）
+    retry = Retry(total=0, connect=0, read=0, status=0)
+    adapter = HTTPAdapter(
+        pool_connections=_settings.pool_connections, pool_maxsize=_settings.pool_maxsize, max_retries=retry
+    )
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+def _cached(key: tuple, factory) -> "requests.Session":
+    with _lock:
+        session = _sessions.get(key)
+        if session is None:
+            session = _sessions[key] = _mount(factory())
+            logger.debug(f"HTTPセッションを作成しました: {key[0]}")
+        return session
+
+
+def get_session() -> "requests.Session":
+    """プロセス内で共有するkeep-aliveセッション"""
+    import requests
+
+    return _cached(("default",), requests.Session)
+
+
+def get_oauth_session(**keys) -> "OAuth1Session":
+    """OAuth1の認証情報ごとに共有するセッション（引数はOAuth1Sessionと同じ）"""
+    from requests_oauthlib import OAuth1Session
+
+    return _cached(("oauth1", *sorted(keys.items())), lambda: OAuth1Session(**keys))
+
+
+def close_all() -> None:
+    with _lock:
+        for session in _sessions.values():
+            session.close()
+        _sessions.clear()
@@ -0,0 +1,65 @@
+import hashlib
+import json
+import logging
+import os
+import threading
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+# 同一プロセス内（バッチモード）での同時書き込みを防ぐ
+_LOCK = threading.Lock()
+
+
+def message_digest(message: dict) -> str:
+    """メッセージを識別するハッシュ"""
+    material = json.dumps([message.get("role"), message.get("time"), message.get("say")], ensure_ascii=False)
+    return hashlib.sha1(material.encode("utf-8")).hexdigest()
+
+
+class IngestState:
+    """会話ログごとの取り込み済み位置（high-water mark）を保存
+
+    キーは「ファイルの絶対パス|metadata.link」。値は最後に要約したメッセージの時刻とハッシュ。
+    読み込み時の位置はstage()で保留し、投稿が成功した後にcommit()で確定する。
+    """
+
+    def __init__(self, path: Path):
+        self.path = path
+        self.pending: dict[str, dict] = {}
+        self._marks = self._load()
+
+    def _load(self) -> dict:
+        try:
+            return json.loads(self.path.read_text(encoding="utf-8"))
+        except FileNotFoundError:
+            return {}
+        except json.JSONDecodeError:
+            logger.warning(f"取り込み位置のファイルを読み込めませんでした。初回として扱います: {self.path}")
+            return {}
+
+    @staticmethod
+    def key_for(path: Path, metadata: dict) -> str:
+        return f"{path.resolve()}|{metadata.get('link', '')}"
+
+    def get(self, key: str) -> dict | None:
+        return self._marks.get(key)
+
+    def stage(self, key: str, last_message: dict) -> None:
+        """取り込んだ最新メッセージを保留"""
+        self.pending[key] = {"time": last_message.get("time"), "digest": message_digest(last_message)}
+
+    def commit(self) -> None:
+        """保留中の位置をファイルへ保存"""
+        if not self.pending:
+            return
+        with _LOCK:
+            marks = self._load()
+            marks.update(self.pending)
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = self.path.with_suffix(".tmp")
+            tmp_path.write_text(json.dumps(marks, ensure_ascii=False, indent=2), encoding="utf-8")
+            os.replace(tmp_path, self.path)
+        self._marks = marks
+        logger.debug(f"取り込み位置を保存しました: {len(self.pending)}件")
+        self.pending = {}
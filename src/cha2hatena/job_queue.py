@@ -0,0 +1,402 @@
+import json
+import logging
+import os
+import socket
+import sqlite3
+import threading
+import time
+from contextlib import closing, contextmanager
+from datetime import datetime
+from pathlib import Path
+
+from pydantic import BaseModel, Field
+
+from . import main as app
+from .entry_index import conversation_digest
+from .json_loader import NoNewMessagesError
+from .llm.llm_stats import TokenStats
+from .side_effects import SideEffectTask
+
+logger = logging.getLogger(__name__)
+
+SCHEMA_VERSION = 1
+
+# 完了した段階（この順に進み、再実行時は最初の未完了の段階から再開）
+STAGES = ("queued", "loaded", "summarized", "posted", "done")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY,
+    input_key TEXT NOT NULL,
+    status TEXT NOT NULL,
+    stage TEXT NOT NULL,
+    data TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    owner TEXT,
+    lease_until REAL,
+    error TEXT,
+    created_at TEXT NOT NULL,
+    updated_at TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs (status, id);
+CREATE UNIQUE INDEX IF NOT EXISTS idx_jobs_open_input ON jobs (input_key) WHERE status != 'done';
+"""
+
+
+class JobSettings(BaseModel):
+    max_attempts: int = Field(default=3, ge=1, description="この回数失敗したジョブはfailedにして取り出さない")
+    lease_seconds: float = Field(default=60, gt=0, description="異常終了したプロセスのジョブを再開できるまでの秒数")
+    poll_seconds: float = Field(default=10, gt=0, description="jobs work --followで新しいジョブを待つ間隔（秒）")
+
+
+class Job(BaseModel):
+    """1回分の要約・投稿。各段階の結果（チェックポイント）を保持する"""
+
+    id: int
+    status: str = Field(description="queued・running・done・failed")
+    stage: str = Field(description="完了した最後の段階（STAGES）")
+    attempts: int = 0
+    error: str | None = None
+    paths: list[str] = Field(description="会話ログの絶対パス")
+    incremental: bool = False
+    use_cache: bool = True
+    is_draft: bool = False
+    input_fingerprint: str | None = Field(default=None, description="読み込んだ時点の会話ログのサイズ・更新時刻")
+    conversation_hash: str | None = Field(default=None, description="読み込んだ会話のSHA-256")
+    ingest_marks: dict = Field(default_factory=dict, description="差分取り込みで投稿後に確定する位置")
+    llm_outputs: dict | None = Field(default=None, description="要約結果（BlogPost）")
+    llm_stats: dict | None = Field(default=None, description="TokenStats.to_dict()")
+    blogpost_result: dict | None = Field(default=None, description="はてなブログの投稿結果")
+    csv_data: dict | None = Field(default=None, description="CSV・実行履歴・スプレッドシートへの記録")
+    failed_side_effects: list[str] = Field(default_factory=list, description="再試行キューに回った後処理")
+
+    @property
+    def input_paths(self) -> list[Path]:
+        return [Path(p) for p in self.paths]
+
+
+# data列に保存する項目（id・状態などは専用の列）
+_DATA_FIELDS = set(Job.model_fields) - {"id", "status", "stage", "attempts", "error"}
+# 会話ログが変わった場合に破棄する、読み込み・要約の結果
+_LOADED_FIELDS = {"conversation_hash": None, "ingest_marks": {}, "llm_outputs": None, "llm_stats": None}
+
+
+def input_key(paths: list[Path]) -> str:
+    """同じ会話ログの組み合わせ（順序を含む）を識別するキー"""
+    return "\n".join(str(p.resolve()) for p in paths)
+
+
+def input_fingerprint(paths: list[Path]) -> str:
+    """会話ログのサイズと更新時刻（読み込まずに内容の変更を検出する）"""
+    stamps = []
+    for path in paths:
+        try:
+            stat = path.stat()
+        except FileNotFoundError:
+            stamps.append("missing")
+            continue
+        stamps.append(f"{stat.st_size}:{stat.st_mtime_ns}")
+    return "\n".join(stamps)
+
+
+def _now() -> str:
+    return datetime.now().isoformat(timespec="seconds")
+
+
+class JobBusyError(RuntimeError):
+    """同じジョブを他のプロセスが実行中の場合"""
+
+
+class JobQueue:
+    """ジョブと各段階のチェックポイントをSQLite（WAL）に保存するキュー
+
+    取り出したジョブには期限（lease）を付け、実行中は定期的に延長する。
+    プロセスが異常終了した場合は期限切れ後に別のプロセスが再開できる。
+    """
+
+    def __init__(self, path: Path, settings: JobSettings | None = None):
+        self.path = path
+        self.settings = settings or JobSettings()
+        self.owner = f"{socket.gethostname()}:{os.getpid()}"
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with closing(self._connect()) as conn:
+            version = conn.execute("PRAGMA user_version").fetchone()[0]
+            if version > SCHEMA_VERSION:
+                raise RuntimeError(f"新しいバージョンのジョブキューです（{version}）: {path}")
+            conn.executescript(_SCHEMA)
+            conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)  # トランザクションは明示的に開始
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=FULL")  # チェックポイントは電源断でも失わない
+        return conn
+
+    @contextmanager
+    def _transaction(self):
+        """書き込みロックを先に取るトランザクション（複数のワーカーが同じジョブを取り出さないように）"""
+        with closing(self._connect()) as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield conn
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            conn.execute("COMMIT")
+
+    @staticmethod
+    def _to_job(row: sqlite3.Row) -> Job:
+        return Job(
+            id=row["id"],
+            status=row["status"],
+            stage=row["stage"],
+            attempts=row["attempts"],
+            error=row["error"],
+            **json.loads(row["data"]),
+        )
+
+    def add(self, paths: list[Path], incremental: bool = False, use_cache: bool = True, is_draft: bool = False) -> Job:
+        """ジョブを追加。同じ会話ログの未完了のジョブがあれば、追加せずにそのジョブを返す
+
+        既存のジョブの設定（incremental・use_cache・is_draft）は今回の指定で更新する。
+        保存済みの段階の結果はそのまま使う（要約済みならuse_cacheを変えても再要約しない）。
+        """
+        key = input_key(paths)
+        options = {"incremental": incremental, "use_cache": use_cache, "is_draft": is_draft}
+        data = {"paths": [str(p.resolve()) for p in paths], **options}
+        data = Job(id=0, status="queued", stage="queued", **data).model_dump(mode="json", include=_DATA_FIELDS)
+        with self._transaction() as conn:
+            row = conn.execute("SELECT * FROM jobs WHERE input_key = ? AND status != 'done'", (key,)).fetchone()
+            if row is not None:
+                job = self._to_job(row)
+                if job.model_dump(include=set(options)) != options:
+                    job = job.model_copy(update=options)
+                    updated = json.dumps(job.model_dump(mode="json", include=_DATA_FIELDS), ensure_ascii=False)
+                    conn.execute("UPDATE jobs SET data = ?, updated_at = ? WHERE id = ?", (updated, _now(), job.id))
+                    logger.warning(f"ジョブ#{job.id}の設定を今回の指定に合わせて更新しました: {options}")
+                return job
+            cursor = conn.execute(
+                "INSERT INTO jobs (input_key, status, stage, data, created_at, updated_at) "
+                "VALUES (?, 'queued', 'queued', ?, ?, ?)",
+                (key, json.dumps(data, ensure_ascii=False), _now(), _now()),
+            )
+            return self._to_job(conn.execute("SELECT * FROM jobs WHERE id = ?", (cursor.lastrowid,)).fetchone())
+
+    def get(self, job_id: int) -> Job | None:
+        with closing(self._connect()) as conn:
+            row = conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return None if row is None else self._to_job(row)
+
+    def list_jobs(self, statuses: tuple[str, ...] = ("queued", "running", "failed")) -> list[Job]:
+        placeholders = ", ".join("?" * len(statuses))
+        with closing(self._connect()) as conn:
+            rows = conn.execute(f"SELECT * FROM jobs WHERE status IN ({placeholders}) ORDER BY id", statuses)
+            return [self._to_job(row) for row in rows]
+
+    def claim(self, job_id: int | None = None, retry_failed: bool = False) -> Job | None:
+        """ジョブを取り出して実行中にする（job_idを省略すると最も古い待機中のジョブ）
+
+        実行中でも期限切れのジョブ（異常終了したプロセスのもの）は取り出せる。
+        job_idを指定して他のプロセスが実行中の場合はJobBusyError。
+        """
+        statuses = ("queued", "failed") if retry_failed else ("queued",)
+        claimable = f"(status IN ({', '.join('?' * len(statuses))}) OR (status = 'running' AND lease_until < ?))"
+        now = time.time()
+        with self._transaction() as conn:
+            if job_id is None:
+                sql, params = f"SELECT * FROM jobs WHERE {claimable} ORDER BY id LIMIT 1", (*statuses, now)
+            else:
+                sql, params = f"SELECT * FROM jobs WHERE id = ? AND {claimable}", (job_id, *statuses, now)
+            row = conn.execute(sql, params).fetchone()
+            if row is None and job_id is not None:
+                current = conn.execute("SELECT status, lease_until FROM jobs WHERE id = ?", (job_id,)).fetchone()
+                if current is not None and current["status"] == "running":
+                    wait = max(current["lease_until"] - now, 0)
+                    raise JobBusyError(f"ジョブ#{job_id}は他のプロセスが実行中です（{wait:.0f}秒後に再開できます）")
+            if row is None:
+                return None
+            conn.execute(
+                "UPDATE jobs SET status = 'running', attempts = attempts + 1, owner = ?, lease_until = ?, "
+                "updated_at = ? WHERE id = ?",
+                (self.owner, now + self.settings.lease_seconds, _now(), row["id"]),
+            )
+            return self._to_job(conn.execute("SELECT * FROM jobs WHERE id = ?", (row["id"],)).fetchone())
+
+    def checkpoint(self, job: Job, stage: str | None = None, **fields) -> Job:
+        """段階の結果を保存（コミット後に次の段階へ進む）。保存したジョブを返す"""
+        job = job.model_copy(update={**fields, "stage": stage or job.stage})
+        data = job.model_dump(mode="json", include=_DATA_FIELDS)
+        with self._transaction() as conn:
+            conn.execute(
+                "UPDATE jobs SET stage = ?, data = ?, lease_until = ?, updated_at = ? WHERE id = ? AND owner = ?",
+                (
+                    job.stage,
+                    json.dumps(data, ensure_ascii=False),
+                    time.time() + self.settings.lease_seconds,
+                    _now(),
+                    job.id,
+                    self.owner,
+                ),
+            )
+        logger.debug(f"ジョブ#{job.id}: {job.stage}")
+        return job
+
+    def complete(self, job: Job) -> None:
+        job = self.checkpoint(job, "done")
+        with self._transaction() as conn:
+            conn.execute(
+                "UPDATE jobs SET status = 'done', lease_until = NULL, error = NULL, updated_at = ? WHERE id = ?",
+                (_now(), job.id),
+            )
+
+    def fail(self, job: Job, error: str) -> str:
+        """失敗を記録し、上限回数に達していなければ待機中に戻す。新しい状態を返す"""
+        status = "failed" if job.attempts >= self.settings.max_attempts else "queued"
+        with self._transaction() as conn:
+            conn.execute(
+                "UPDATE jobs SET status = ?, lease_until = NULL, error = ?, updated_at = ? WHERE id = ? AND owner = ?",
+                (status, error, _now(), job.id, self.owner),
+            )
+        return status
+
+    def renew_lease(self, job: Job) -> None:
+        """実行中のジョブの期限を延長"""
+        with self._transaction() as conn:
+            conn.execute(
+                "UPDATE jobs SET lease_until = ? WHERE id = ? AND owner = ? AND status = 'running'",
+                (time.time() + self.settings.lease_seconds, job.id, self.owner),
+            )
+
+    @contextmanager
+    def lease(self, job: Job):
+        """実行中は期限を延長し続ける（異常終了すると延長が止まり、期限切れ後に再開できる）"""
+        stop = threading.Event()
+
+        def renew():
+            while not stop.wait(self.settings.lease_seconds / 3):
+                # 延長は期限の1/3ごとのため、1回失敗（database is lockedなど）しても次の延長が期限内に間に合う
+                try:
+                    self.renew_lease(job)
+                except Exception as e:
+                    logger.warning(f"ジョブ#{job.id}の期限を延長できませんでした。次の延長で再試行します: {e!r}")
+
+        thread = threading.Thread(target=renew, name=f"job-lease-{job.id}", daemon=True)
+        thread.start()
+        try:
+            yield
+        finally:
+            stop.set()
+            thread.join()
+
+
+def process_job(queue: JobQueue, job: Job, started: float | None = None) -> Job:
+    """ジョブを最初の未完了の段階から実行し、段階ごとにチェックポイントを保存"""
+    started = started or time.perf_counter()
+    context = app.app_context()
+    paths = job.input_paths
+    state = app.build_ingest_state(job.incremental)
+    # 投稿前に会話ログが編集・追記された場合、保存済みの要約・取り込み位置は使わずに読み込みからやり直す
+    fingerprint = input_fingerprint(paths)
+    if job.llm_outputs is not None and job.blogpost_result is None and job.input_fingerprint != fingerprint:
+        logger.warning(f"ジョブ#{job.id}の会話ログが前回の読み込みから変わっています。新しい内容で要約します。")
+        job = queue.checkpoint(job, "queued", **_LOADED_FIELDS)
+    if job.stage != "queued":
+        logger.warning(f"ジョブ#{job.id}を「{job.stage}」の次の段階から再開します。")
+
+    # 読み込み・要約（要約済みなら読み込みも行わず、料金も再度発生しない）
+    if job.llm_outputs is None:
+        conversation = app.load_conversation(paths, state)
+        conversation_hash = conversation_digest(conversation)
+        if job.conversation_hash not in (None, conversation_hash):
+            logger.warning(f"ジョブ#{job.id}の会話ログが前回の読み込みから変わっています。新しい内容で要約します。")
+        job = queue.checkpoint(
+            job,
+            "loaded",
+            input_fingerprint=fingerprint,
+            conversation_hash=conversation_hash,
+            ingest_marks=dict(state.pending) if state else {},
+        )
+        llm_outputs, llm_stats = app.summarize_conversation(
+            conversation, context.llm_config, app.build_summary_cache(job.use_cache)
+        )
+        job = queue.checkpoint(job, "summarized", llm_outputs=llm_outputs, llm_stats=llm_stats.to_dict())
+
+    # はてなブログへ投稿
+    if job.blogpost_result is None:
+        blogpost_result = app.post_to_hatena(job.llm_outputs, job.is_draft, job.conversation_hash)
+        job = queue.checkpoint(job, "posted", blogpost_result=blogpost_result)
+
+    # 投稿後に取り込み位置を確定（読み込み時の位置をジョブから復元するため、再開時も同じ位置）
+    if state is not None and job.ingest_marks:
+        state.pending = dict(job.ingest_marks)
+        state.commit()
+
+    blogpost_result = job.blogpost_result
+    title = blogpost_result.get("title", "")
+    content = blogpost_result.get("content", "")
+    logger.warning("はてなブログへの投稿に成功しました。")
+    logger.warning(f"URL: {blogpost_result.get('link_edit_user', '')}")
+    print("-" * 50)
+    print(f"投稿タイトル：{title}")
+    print(f"\n{'-' * 20}投稿本文{'-' * 20}")
+    print(f"{content[:100]}")
+    print("-" * 50)
+
+    # 記録内容（時刻を含む）は先に保存し、再開時も同じ行を記録する（実行履歴は同じ行を重複させない）
+    if job.csv_data is None:
+        llm_stats = TokenStats.from_dict(job.llm_stats)
+        job = queue.checkpoint(job, csv_data=app.build_record(paths, blogpost_result, llm_stats, app.fetch_usd_jpy()))
+
+    # LINE通知・ファイル出力・実行履歴・Googleスプレッドシート出力（失敗分は再試行キューへ）
+    latency = time.perf_counter() - started
+    failed = app.run_side_effects(
+        [
+            SideEffectTask(name="line", payload={"line_text": app.build_line_text(blogpost_result)}),
+            SideEffectTask(name="outputs", payload={"csv_data": job.csv_data, "title": title, "content": content}),
+            SideEffectTask(name="history", payload={"csv_data": job.csv_data, "latency_seconds": latency}),
+            SideEffectTask(name="sheets", payload={"csv_data": job.csv_data}),
+        ]
+    )
+    job = job.model_copy(update={"failed_side_effects": [task.name for task in failed]})
+    queue.complete(job)
+    return job
+
+
+def run_claimed(queue: JobQueue, job: Job, started: float | None = None) -> bool:
+    """取り出したジョブを実行し、成否を記録。成功したらTrue"""
+    with queue.lease(job):
+        try:
+            process_job(queue, job, started)
+        except NoNewMessagesError as e:
+            logger.warning(f"ジョブ#{job.id}: {e}")
+            queue.complete(queue.get(job.id))
+            return True
+        # 要約クライアントは致命的なエラーでsys.exitするため、他のジョブを続けられるよう捕捉
+        except (Exception, SystemExit) as e:
+            status = queue.fail(queue.get(job.id), repr(e))
+            logger.error(f"ジョブ#{job.id}に失敗しました（{job.attempts}回目）: {e!r}")
+            if status == "queued":
+                logger.warning(f"次回の実行時に「{queue.get(job.id).stage}」の次の段階から再開します。")
+            logger.info("詳細: ", exc_info=True)
+            return False
+    return True
+
+
+def run_worker(queue: JobQueue, follow: bool = False, retry_failed: bool = False) -> int:
+    """待機中のジョブを古い順に処理。follow=Trueなら新しいジョブを待ち続ける"""
+    succeeded = failed = 0
+    while True:
+        job = queue.claim(retry_failed=retry_failed)
+        if job is None:
+            if not follow:
+                break
+            time.sleep(queue.settings.poll_seconds)
+            continue
+        logger.warning(f"ジョブ#{job.id}を処理します: {', '.join(Path(p).name for p in job.paths)}")
+        if run_claimed(queue, job):
+            succeeded += 1
+        else:
+            failed += 1
+    logger.warning(f"ジョブの処理が終了しました: 成功{succeeded}件 / 失敗{failed}件")
+    return 1 if failed else 0
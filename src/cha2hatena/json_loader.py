@@ -1,10 +1,31 @@
 import json
 import logging
-from datetime import datetime, timedelta
+import mmap
+import os
+from datetime import datetime
 from pathlib import Path
 
+from .ingest_state import IngestState, message_digest
+from .timestamps import find_session_start, is_session_break, parse_timestamp
+
 logger = logging.getLogger(__name__)
 
+MESSAGE_SEPARATOR = f" \n\n {'-' * 50}\n"  # 1メッセージの終端（要約の分割位置にも使用）
+_WHITESPACE = b" \t\r\n"
+# これ未満のファイル数・合計サイズではプロセス起動の方が高くつくため逐次処理
+PARALLEL_MIN_FILES = 2
+PARALLEL_MIN_BYTES = 32 * 1024 * 1024
+# 1プロセスあたりの最小サイズ（小さい分担ではプロセスを増やしても速くならない）
+PARALLEL_MIN_BYTES_PER_WORKER = 16 * 1024 * 1024
+
+
+class TailScanError(ValueError):
+    """末尾からの走査でjsonの構造を解釈できなかった場合"""
+
+
+class NoNewMessagesError(Exception):
+    """差分取り込みで新しいメッセージが1件もなかった場合"""
+
 
 ### ユーティリティ関数
 def ai_names_from_paths(paths: list[Path]) -> list:
@@ -42,86 +63,353 @@ def get_agent(message: dict, ai_name: str) -> str:
     return agent
 
 
-def convert_to_str(messages: dict, ai_name: str) -> tuple[list, datetime | None]:
-    """jsonの本丸を処理"""
+def convert_to_str(messages: dict, ai_name: str, use_session_break: bool = True) -> tuple[list, datetime | None]:
+    """jsonの本丸を処理
+
+    use_session_break=Falseの場合は日付・時間の区切りで打ち切らず、渡されたメッセージをすべて変換。
+    """
 
     logger.warning(f"{len(messages)}件のメッセージを処理中...")
 
-    # 初期化
-    dt_format = "%Y/%m/%d %H:%M:%S"
-    latest = messages[-1].get("time", "")
-    latest_dt = datetime.strptime(latest, dt_format) if latest else None
+    # 当日のメッセージではないかつ3時間以上時間が空いた位置を一括で判定
+    start = find_session_start([message.get("time") for message in messages]) if use_session_break else 0
+
     logs = []
-    previous_dt = latest_dt
+    for message in reversed(messages[start:]):  # 逆順
+        agent = get_agent(message, ai_name)
+        text = message.get("say", "").replace("\n\n", "\n")
+        logs.append(f"date: {message.get('time', None)} \nagent: {agent}\n[message]\n{text}{MESSAGE_SEPARATOR}")
 
-    # 逆順
-    for message in reversed(messages):
-        timestamp = message.get("time", None)
+    # 打ち切った場合はそのメッセージ、最後まで取り込んだ場合は最初のメッセージの時刻
+    timestamp = messages[start - 1].get("time") if start > 0 else messages[0].get("time", None)
+    return logs, timestamp
 
-        # 当日のメッセージではないかつ3時間以上時間が空いた場合ループを抜ける
-        if timestamp:
-            msg_dt = datetime.strptime(timestamp, dt_format)
-            if latest_dt is not None and msg_dt.date() != latest_dt.date():
-                if previous_dt - msg_dt > timedelta(hours=3):
-                    break
 
-        agent = get_agent(message, ai_name)
+### 末尾走査
+def _last_non_ws(buf, end: int) -> int:
+    """buf[:end]のうち最後の非空白文字の位置（なければ-1）"""
+    pos = end - 1
+    while pos >= 0 and buf[pos] in _WHITESPACE:
+        pos -= 1
+    return pos
 
-        text = message.get("say", "").replace("\n\n", "\n")
-        logs.append(f"date: {timestamp} \nagent: {agent}\n[message]\n{text} \n\n {'-' * 50}\n")
 
-        if timestamp:
-            previous_dt = msg_dt
-    return logs, timestamp
+def _decode_object_backward(buf, last: int, decoder: json.JSONDecoder) -> tuple[dict, int]:
+    """buf[last]の"}"で終わるオブジェクトを後ろから探してデコードし、(オブジェクト, 開始位置)を返す"""
+    start = last
+    while True:
+        start = buf.rfind(b"{", 0, start)
+        if start < 0:
+            raise TailScanError("メッセージの開始位置が見つかりません")
+        # 文字列中の"{"を候補から外す（直前が区切り文字、直後がキーの開始か空オブジェクトのみ有効）
+        separator = _last_non_ws(buf, start)
+        if separator < 0 or buf[separator] not in b",[":
+            continue
+        head = buf[start + 1 : start + 64].lstrip(_WHITESPACE)[:1]
+        if head not in (b'"', b"}"):
+            continue
+        chunk = buf[start : last + 1].decode("utf-8")
+        try:
+            obj, consumed = decoder.raw_decode(chunk)
+        except json.JSONDecodeError:
+            continue
+        if consumed == len(chunk) and isinstance(obj, dict):
+            return obj, start
+
+
+def iter_messages_reversed(buf):
+    """末尾にあるmessages配列の要素を後ろから1件ずつデコードして返す"""
+
+    root_end = _last_non_ws(buf, len(buf))
+    if root_end < 0 or buf[root_end] != ord("}"):
+        raise TailScanError("ルートオブジェクトの終端が見つかりません")
+    array_end = _last_non_ws(buf, root_end)
+    if array_end < 0 or buf[array_end] != ord("]"):
+        raise TailScanError("messages配列がファイル末尾にありません")
+
+    decoder = json.JSONDecoder()
+    elem_end = array_end
+    is_first = True
+    while True:
+        last = _last_non_ws(buf, elem_end)
+        if last >= 0 and buf[last] == ord("["):
+            key_end = _last_non_ws(buf, _last_non_ws(buf, last))  # ":"の前
+            if buf[key_end - len('"messages"') + 1 : key_end + 1] != b'"messages"':
+                raise TailScanError("末尾の配列がmessagesではありません")
+            return
+        if last < 0 or buf[last] != ord("}"):
+            raise TailScanError("メッセージの終端が見つかりません")
+
+        message, start = _decode_object_backward(buf, last, decoder)
+        if is_first and not {"role", "say"} & message.keys():
+            raise TailScanError("末尾の配列がmessagesではありません")
+        is_first = False
+        yield message
+
+        separator = _last_non_ws(buf, start)
+        elem_end = separator if buf[separator] == ord(",") else separator + 1
+
+
+def _skip_ws(text: str, pos: int) -> int:
+    while text[pos] in " \t\r\n":
+        pos += 1
+    return pos
+
+
+def _parse_head_metadata(head: str, decoder: json.JSONDecoder) -> dict:
+    """ルートオブジェクトのキーを先頭から順にたどり、metadataの値を返す"""
+    pos = _skip_ws(head, 0)
+    if head[pos] != "{":
+        raise TailScanError("ルートオブジェクトの開始が見つかりません")
+    pos += 1
+    while True:
+        key, pos = decoder.raw_decode(head, _skip_ws(head, pos))
+        pos = _skip_ws(head, pos)
+        if head[pos] != ":":
+            raise TailScanError("metadataを解釈できません")
+        pos = _skip_ws(head, pos + 1)
+        if key == "messages":  # metadataがmessagesより後にある場合は読まない
+            return {}
+        value, pos = decoder.raw_decode(head, pos)
+        if key == "metadata":
+            return value
+        pos = _skip_ws(head, pos)
+        if head[pos] != ",":
+            return {}
+        pos += 1
+
+
+def read_metadata(buf, chunk_size: int = 64 * 1024) -> dict:
+    """ファイル先頭からmetadataだけをデコード"""
+    decoder = json.JSONDecoder()
+    size = chunk_size
+    while True:
+        # 末尾で切れたマルチバイト文字は無視（その場合は範囲を広げて再試行）
+        head = buf[:size].decode("utf-8", errors="ignore")
+        try:
+            return _parse_head_metadata(head, decoder)
+        except (json.JSONDecodeError, IndexError):
+            if size >= len(buf):
+                raise TailScanError("metadataを読み込めません")
+            size *= 4
+
+
+def _session_window(messages_reversed) -> list[dict]:
+    """後ろから渡されるメッセージを、convert_to_strの区切り（区切りのメッセージを含む）まで集める"""
+    window = []
+    latest_dt = previous_dt = None
+    for message in messages_reversed:
+        window.append(message)
+        timestamp = message.get("time")
+        if len(window) == 1:
+            latest_dt = previous_dt = parse_timestamp(timestamp) if timestamp else None
+            continue
+        # 最新メッセージに時刻がない場合はすべて取得
+        if not timestamp or latest_dt is None:
+            continue
+        msg_dt = parse_timestamp(timestamp)
+        if is_session_break(msg_dt, latest_dt, previous_dt):
+            break
+        previous_dt = msg_dt
+
+    window.reverse()
+    return window
+
+
+def _newer_than(messages_reversed, mark: dict) -> list[dict]:
+    """後ろから渡されるメッセージのうち、取り込み済み位置より後のものを集める"""
+    newer = []
+    mark_dt = parse_timestamp(mark["time"]) if mark.get("time") else None
+    for message in messages_reversed:
+        if message_digest(message) == mark["digest"]:
+            break
+        # 取り込み済みのメッセージが編集・削除されていた場合は時刻で判定
+        timestamp = message.get("time")
+        if mark_dt is not None and timestamp and parse_timestamp(timestamp) < mark_dt:
+            break
+        newer.append(message)
+
+    newer.reverse()
+    return newer
+
+
+def load_tail_messages(path: Path) -> list[dict]:
+    """convert_to_strが使用する範囲のメッセージだけを末尾から読み込む
+
+    ファイルはメモリマップし、範囲外のメッセージはデコードしない。
+    convert_to_strの戻り値を全体読み込み時と一致させるため、区切りとなったメッセージも含めて返す。
+    """
+    with path.open("rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buf:
+        return _session_window(iter_messages_reversed(buf))
 
 
-def json_loader(paths: list[Path,]) -> str:
-    """複数のjsonファイルをstrに"""
+def load_new_messages(path: Path, state: IngestState) -> tuple[list[dict], str, bool]:
+    """取り込み済み位置より後のメッセージだけを読み込む
+
+    戻り値は(メッセージ, 状態のキー, 初回かどうか)。初回は通常と同じ範囲を返す。
+    """
+    try:
+        with path.open("rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buf:
+            key = state.key_for(path, read_metadata(buf))
+            mark = state.get(key)
+            if mark is None:
+                return _session_window(iter_messages_reversed(buf)), key, True
+            return _newer_than(iter_messages_reversed(buf), mark), key, False
+    except ValueError as e:
+        logger.debug(f"末尾走査を中止し、ファイル全体を読み込みます: {path.name} - {e}")
+
+    data = json.loads(path.read_text(encoding="utf-8"))
+    key = state.key_for(path, data.get("metadata") or {})
+    mark = state.get(key)
+    if mark is None:
+        return data["messages"], key, True
+    return _newer_than(reversed(data["messages"]), mark), key, False
+
+
+def load_messages(path: Path) -> list[dict]:
+    """messagesを読み込む。末尾走査に失敗した場合はファイル全体をデコード"""
+    try:
+        return load_tail_messages(path)
+    except ValueError as e:
+        logger.debug(f"末尾走査を中止し、ファイル全体を読み込みます: {path.name} - {e}")
+
+    data = json.loads(path.read_text(encoding="utf-8"))
+    return data["messages"]
+
+
+def load_conversation(path: Path, ai_name: str, state: IngestState | None = None) -> dict:
+    """1ファイル分の会話をテキストに変換
+
+    プロセスプールからも呼び出せるよう、表示やstateの更新は行わず結果を辞書で返す。
+    """
+    if path.suffix == ".txt":
+        return {"parts": [path.read_text(encoding="utf-8")], "is_json": False}
+    if path.suffix != ".json":
+        raise ValueError(f"エラー：対応していないファイル形式です - {path.name}")
+
+    is_first, key = True, None
+    try:
+        if state is None:
+            messages = load_messages(path)
+        else:
+            messages, key, is_first = load_new_messages(path, state)
+    except KeyError as e:
+        raise KeyError(f"エラー： jsonファイルの構成を確認してください - {path}") from e
+    except json.JSONDecodeError as e:
+        raise ValueError(f"エラー：ファイル形式を確認してください - {path.name}") from e
+
+    if not messages and state is not None:
+        return {"parts": None, "is_json": True}
+
+    # 会話の抽出→文字列へ
+    try:
+        logs, timestamp = convert_to_str(messages, ai_name, use_session_break=is_first)
+    except KeyError as e:
+        raise KeyError(f"エラー： jsonファイルの構成を確認してください - {path}") from e
+
+    logs.reverse()  # 順番を戻す（コピーせずにその場で）
+    return {
+        "parts": logs,
+        "is_json": True,
+        "count": len(logs),
+        "has_timestamp": timestamp is not None,
+        "first": logs[0][:100],
+        "last": logs[-1][:100],
+        "mark": (key, messages[-1]) if key is not None else None,
+    }
+
+
+def available_cpus() -> int:
+    """このプロセスが使えるCPU数（affinity・コンテナの制限を反映。os.cpu_countはホスト全体の数）"""
+    if hasattr(os, "process_cpu_count"):  # Python 3.13以降
+        return os.process_cpu_count() or 1
+    if hasattr(os, "sched_getaffinity"):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+
+def parallel_workers(file_count: int, total_bytes: int, max_workers: int | None = None) -> int:
+    """並列読み込みのプロセス数（1なら逐次）
+
+    ファイル数・合計サイズが閾値未満の場合は逐次。プロセス数は使えるCPU数（max_workersの指定があればそれ）・
+    ファイル数・1プロセスあたりPARALLEL_MIN_BYTES_PER_WORKER以上になる数を超えない。
+    """
+    if file_count < PARALLEL_MIN_FILES or total_bytes < PARALLEL_MIN_BYTES:
+        return 1
+    workers = min(max_workers or available_cpus(), file_count)
+    if PARALLEL_MIN_BYTES_PER_WORKER:
+        workers = min(workers, total_bytes // PARALLEL_MIN_BYTES_PER_WORKER)
+    return max(workers, 1)
+
+
+def _load_all(paths: list[Path], ai_names: list, state: IngestState | None, max_workers: int | None) -> list[dict]:
+    """ファイルが多く大きい場合はプロセスプールで並列に読み込む（結果の順番は入力順）"""
+    total_bytes = sum(path.stat().st_size for path in paths if path.exists())
+    workers = parallel_workers(len(paths), total_bytes, max_workers)
+    if workers == 1:
+        return [load_conversation(path, ai_name, state) for path, ai_name in zip(paths, ai_names)]
+
+    logger.debug(f"{len(paths)}個のファイルを{workers}プロセスで読み込みます（{total_bytes / 1024 / 1024:.1f}MB）")
+    from concurrent.futures import ProcessPoolExecutor  # multiprocessingの読み込みは並列時のみ
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(load_conversation, paths, ai_names, [state] * len(paths)))
+
+
+def _join_into(parts: list[str], fragments: list[str], separator: str) -> None:
+    """separator.join(fragments)と同じ並びでpartsに追加（文字列は作らない）"""
+    for i, fragment in enumerate(fragments):
+        if i:
+            parts.append(separator)
+        parts.append(fragment)
+
+
+def json_loader(paths: list[Path,], state: IngestState | None = None, max_workers: int | None = None) -> str:
+    """複数のjsonファイルをstrに
+
+    stateを渡すと差分取り込み: 前回要約したメッセージより後だけを読み込み、読み込んだ位置をstateに保留する。
+    """
 
     logger.warning(f"{len(paths)}個のjsonファイルの読み込みを開始します")
 
-    conversations = []
+    # 断片のリストに積み、最後に1回だけ連結する（途中で会話全体のコピーを作らない）
+    parts, count = [], 0
     ai_names = ai_names_from_paths(paths)
+    results = _load_all(paths, ai_names, state, max_workers)
 
     # ファイルごとのループ
-    for idx, (path, ai_name) in enumerate(zip(paths, ai_names), 1):
-        logger.warning(f"{idx}個目のファイルを読み込みます: {path.name}")
-
-        if path.suffix == ".json":
-            try:
-                data = json.loads(path.read_text(encoding="utf-8"))
-                messages = data["messages"]
-            except KeyError as e:
-                raise KeyError(f"エラー： jsonファイルの構成を確認してください - {path}") from e
-            except json.JSONDecodeError as e:
-                raise ValueError(f"エラー：ファイル形式を確認してください - {path.name}") from e
-
-            # 会話の抽出→文字列へ
-            try:
-                logs, timestamp = convert_to_str(messages, ai_name)
-            except KeyError as e:
-                raise KeyError(f"エラー： jsonファイルの構成を確認してください - {path}") from e
-
-            if timestamp is None:
-                print(f"{path.name}の会話履歴に時刻情報がありません。すべての会話を取得しました。")
-
-            logs.append(f"{'=' * 20} {idx}個目の会話 {'=' * 20}\n\n")
-            conversation = "\n".join(logs[::-1])  # 順番を戻す
-            logger.warning(f"{len(logs) - 1}件の発言を取得: {path.name}")
-            print(f"{'=' * 25}最初のメッセージ{'=' * 25}\n{logs[-2][:100]}")
-            print(f"{'=' * 25}最後のメッセージ{'=' * 25}\n{logs[0][:100]}")
-            print("=" * 60)
-
-        elif path.suffix == ".txt":
-            conversation = f"{'=' * 20} {idx}個目の会話 {'=' * 20}\n\n"
-            conversation += path.read_text(encoding="utf-8")
+    for idx, (path, result) in enumerate(zip(paths, results), 1):
+        logger.warning(f"{idx}個目のファイルを読み込みました: {path.name}")
+        header = f"{'=' * 20} {count + 1}個目の会話 {'=' * 20}\n\n"
 
-        else:
-            raise ValueError(f"エラー：対応していないファイル形式です - {path.name}")
+        if result["parts"] is None:
+            logger.warning(f"新しいメッセージはありません: {path.name}")
+            continue
 
-        conversations.append(conversation)
-        ai_names.append(ai_name)
+        if count:
+            parts.append("\n\n\n")
+        count += 1
+
+        if not result["is_json"]:
+            parts += [header, *result.pop("parts")]
+            continue
+
+        if state is not None and result["mark"] is not None:
+            state.stage(*result["mark"])
+
+        if not result["has_timestamp"]:
+            print(f"{path.name}の会話履歴に時刻情報がありません。すべての会話を取得しました。")
+
+        parts += [header, "\n"]
+        _join_into(parts, result.pop("parts"), "\n")
+        logger.warning(f"{result['count']}件の発言を取得: {path.name}")
+        print(f"{'=' * 25}最初のメッセージ{'=' * 25}\n{result['first']}")
+        print(f"{'=' * 25}最後のメッセージ{'=' * 25}\n{result['last']}")
+        print("=" * 60)
+
+    if not count:
+        raise NoNewMessagesError("前回の要約以降、新しいメッセージはありません。")
 
-    logger.warning(f"☑ {len(paths)}件のjsonファイルをテキストに変換しました。\n")
+    logger.warning(f"☑ {count}件のjsonファイルをテキストに変換しました。\n")
 
-    return "\n\n\n".join(conversations)
+    return "".join(parts)
@@ -1,11 +1,11 @@
 import logging
 
-import requests
+from . import http_pool, retry
 
 logger = logging.getLogger(__name__)
 
 
-def line_messenger(content: str, line_access_token: str):
+def line_messenger(content: str, line_access_token: str) -> bool:
     URL = r"https://api.line.me/v2/bot/message/broadcast"
 
     logger.debug(f"LINEアクセストークン: ... {line_access_token[-5:]}")
@@ -18,10 +18,21 @@ def line_messenger(content: str, line_access_token: str):
     message = {"type": "text", "text": content}
     body = {"messages": [message]}
 
-    res = requests.post(URL, headers=headers, json=body)
+    # 一斉送信の重複を防ぐため、再試行は処理されていないことが確実な場合（429など）のみ
+    res = retry.call(
+        http_pool.get_session().post,
+        URL,
+        headers=headers,
+        json=body,
+        timeout=http_pool.timeout(),
+        name="LINE",
+        idempotent=False,
+        check_status=True,
+    )
 
     if res.status_code == 200:
         logger.warning("✓ LINE通知に成功しました。")
+        return True
     else:
         logger.error("LINE通知出来ませんでした。詳細は`app.log`を確認してください")
         logger.error(f"ステータスコード：{res.status_code}")
@@ -31,3 +42,4 @@ def line_messenger(content: str, line_access_token: str):
             logger.info(f"{res_dict['details'][0]['message']}")
         except Exception:
             logger.info("レスポンス内容を解析できませんでした。")
+    return False
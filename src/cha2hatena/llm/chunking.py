@@ -0,0 +1,232 @@
+import json
+import logging
+import math
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable
+
+from ..json_loader import MESSAGE_SEPARATOR
+from .conversational_ai import ConversationalAi, LlmConfig
+from .llm_stats import CombinedTokenStats, TokenStats
+from .pricing import UnknownModelError, default_engine
+from .summary_cache import SummaryCache
+
+logger = logging.getLogger(__name__)
+
+MAP_PROMPT = (
+    "以下は長い会話ログを分割した一部（{index}/{total}）です。"
+    "後で1本の学習記録にまとめるための下書きメモを作成してください。\n"
+    "- title: この部分の話題を一言で\n"
+    "- content: 学んだポイント・実践内容・結論をMarkdownの箇条書きで漏れなく（800字以内）\n"
+    "- categories: この部分に関係するカテゴリー候補\n"
+    "機密情報や個人特定につながる情報は含めないでください。\n\n会話ログ："
+)
+MERGE_PROMPT = (
+    "以下は長い会話ログを分割して作成した下書きメモの一部（{index}/{total}）です。"
+    "後で1本の学習記録にまとめるため、これらを1つの下書きメモに統合してください。\n"
+    "- title: これらの話題を一言で\n"
+    "- content: 学んだポイント・実践内容・結論をMarkdownの箇条書きで漏れなく（800字以内）\n"
+    "- categories: 関係するカテゴリー候補\n\n下書きメモ："
+)
+REDUCE_HEADER = (
+    "（会話ログが長いため、分割して要約した下書きメモを以下に示します。これらを1本の記事に統合してください）\n"
+)
+# 縮約時のメモ1件あたりの想定トークン数（事前の料金見積もり用）
+NOTE_TOKENS_ESTIMATE = 1500
+
+
+class CostLimitError(RuntimeError):
+    """見積もりまたは実績の料金が上限を超える場合"""
+
+
+def estimate_tokens(text: str) -> int:
+    """文字数からトークン数を概算（ASCIIは約4文字、それ以外は約1文字で1トークン）"""
+    ascii_count = len(text.encode("ascii", errors="ignore"))
+    return math.ceil(ascii_count / 4) + (len(text) - ascii_count)
+
+
+def format_notes(notes: list[dict]) -> str:
+    """下書きメモを縮約のプロンプトに渡す形式にまとめる"""
+    return "\n\n".join(
+        f"### パート{index}: {note['title']}\n{note['content']}\nカテゴリー候補: {', '.join(note['categories'])}"
+        for index, note in enumerate(notes, 1)
+    )
+
+
+def split_into_chunks(conversation: str, max_tokens: int) -> list[str]:
+    """メッセージの境界で分割し、各チャンクをmax_tokens以内に収める"""
+    *messages, rest = conversation.split(MESSAGE_SEPARATOR)
+    pieces = [message + MESSAGE_SEPARATOR for message in messages]
+    if rest.strip():
+        pieces.append(rest)
+
+    chunks, current, current_tokens = [], [], 0
+    for piece in pieces:
+        tokens = estimate_tokens(piece)
+        if tokens > max_tokens:
+            # 1メッセージだけで上限を超える場合は文字数で切る（1文字は最大1トークンと見積もるため必ず収まる）
+            if current:
+                chunks.append("".join(current))
+                current, current_tokens = [], 0
+            chunks.extend(piece[i : i + max_tokens] for i in range(0, len(piece), max_tokens))
+            continue
+        if current and current_tokens + tokens > max_tokens:
+            chunks.append("".join(current))
+            current, current_tokens = [], 0
+        current.append(piece)
+        current_tokens += tokens
+    if current:
+        chunks.append("".join(current))
+    return chunks
+
+
+class MapReduceSummarizer:
+    """長い会話をチャンクごとに並列要約（map）し、最後に1本の記事へ統合（reduce）"""
+
+    def __init__(
+        self,
+        llm_config: LlmConfig,
+        client_factory: Callable[[LlmConfig], ConversationalAi],
+        max_chunk_tokens: int,
+        max_total_fee: float | None = None,
+        max_workers: int = 4,
+        cache: SummaryCache | None = None,
+    ):
+        self.llm_config = llm_config
+        self.client_factory = client_factory
+        self.max_chunk_tokens = max_chunk_tokens
+        self.max_total_fee = max_total_fee
+        self.max_workers = max_workers
+        self.cache = cache
+        # 1リクエストの入力がmax_chunk_tokens以内になるよう、指示文の分を差し引いた大きさで分割する
+        self.chunk_tokens = max_chunk_tokens - estimate_tokens(MAP_PROMPT)
+        self.merge_tokens = max_chunk_tokens - estimate_tokens(MERGE_PROMPT)
+        if min(self.chunk_tokens, self.merge_tokens) <= 0:
+            raise ValueError(f"max_chunk_tokens({max_chunk_tokens})が分割要約の指示文より小さいため分割できません。")
+
+    def needs_chunking(self) -> bool:
+        return estimate_tokens(self.llm_config.prompt + self.llm_config.conversation) > self.max_chunk_tokens
+
+    def _input_fee(self, tokens: int) -> float:
+        """1リクエストの入力トークン分の料金（料金表にないモデルはNaN）"""
+        try:
+            return default_engine().fees(self.llm_config.model, tokens).total
+        except UnknownModelError:
+            return math.nan
+
+    def estimate_fee(self, chunks: list[str]) -> float:
+        """入力トークンのみでの料金見積もり（USD）"""
+        fee = sum(self._input_fee(estimate_tokens(MAP_PROMPT + chunk)) for chunk in chunks)
+        # 下書きメモが1回の入力に収まるまで、グループごとに統合する段を重ねる
+        count = len(chunks)
+        reduce_tokens = estimate_tokens(self.llm_config.prompt + REDUCE_HEADER)
+        per_group = max(2, self.merge_tokens // NOTE_TOKENS_ESTIMATE)
+        while count > 1 and reduce_tokens + NOTE_TOKENS_ESTIMATE * count > self.max_chunk_tokens:
+            groups, rest = divmod(count, per_group)
+            merge_fee = self._input_fee(estimate_tokens(MERGE_PROMPT) + NOTE_TOKENS_ESTIMATE * per_group)
+            fee += groups * merge_fee
+            if rest > 1:
+                fee += self._input_fee(estimate_tokens(MERGE_PROMPT) + NOTE_TOKENS_ESTIMATE * rest)
+            count = groups + (1 if rest else 0)
+        return fee + self._input_fee(reduce_tokens + NOTE_TOKENS_ESTIMATE * count)
+
+    def _check_budget(self, fee: float, stage: str) -> None:
+        if self.max_total_fee is not None and not fee <= self.max_total_fee:  # 料金不明(NaN)も中止
+            raise CostLimitError(
+                f"{stage}の料金(${fee:.4f})が上限(${self.max_total_fee:.4f})を超えるため要約を中止します。"
+            )
+
+    def _summarize_chunk(self, index: int, total: int, chunk: str) -> tuple[dict, TokenStats]:
+        config = self.llm_config.model_copy(
+            update={
+                "prompt": MAP_PROMPT.format(index=index, total=total),
+                "conversation": chunk,
+                "append_statement": False,
+            }
+        )
+        return self.client_factory(config).get_summary_cached(self.cache)
+
+    def _merge_notes(self, index: int, total: int, notes: list[dict]) -> tuple[dict, TokenStats | None]:
+        if len(notes) == 1:
+            return notes[0], None  # 1件だけのグループはそのまま次の段へ
+        config = self.llm_config.model_copy(
+            update={
+                "prompt": MERGE_PROMPT.format(index=index, total=total),
+                "conversation": format_notes(notes),
+                "append_statement": False,
+            }
+        )
+        return self.client_factory(config).get_summary_cached(self.cache)
+
+    def group_notes(self, notes: list[dict]) -> list[list[dict]]:
+        """統合1回分の入力がmax_chunk_tokens以内になるように下書きメモをまとめる
+
+        段ごとに件数が必ず減るよう、1グループは（最後を除き）2件以上にする。
+        """
+        groups, current, current_tokens = [], [], 0
+        for note in notes:
+            tokens = estimate_tokens(format_notes([note])) + 2  # 区切りの改行
+            if len(current) >= 2 and current_tokens + tokens > self.merge_tokens:
+                groups.append(current)
+                current, current_tokens = [], 0
+            current.append(note)
+            current_tokens += tokens
+        if current:
+            groups.append(current)
+        return groups
+
+    def _fits_reduce(self, notes: list[dict]) -> bool:
+        return estimate_tokens(self.llm_config.prompt + REDUCE_HEADER + format_notes(notes)) <= self.max_chunk_tokens
+
+    def summarize(self) -> tuple[dict, CombinedTokenStats]:
+        chunks = split_into_chunks(self.llm_config.conversation, self.chunk_tokens)
+        logger.warning(f"会話ログが長いため{len(chunks)}個に分割して要約します。")
+        self._check_budget(self.estimate_fee(chunks), "見積もり")
+
+        # map: チャンクごとに並列で下書きメモを作成（結果の順番は入力順）
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            results = list(
+                executor.map(self._summarize_chunk, range(1, len(chunks) + 1), [len(chunks)] * len(chunks), chunks)
+            )
+
+        parts = []
+        for index, (note, stats) in enumerate(results, 1):
+            logger.warning(
+                f"チャンク{index}/{len(chunks)}: 入力{stats.input_tokens}・思考{stats.thoughts_tokens}"
+                f"・出力{stats.output_tokens}トークン ${stats.total_fee:.4f}"
+            )
+            parts.append(stats)
+
+        # 下書きメモが1回の入力に収まらない場合は、グループごとに統合して件数を減らす
+        notes = [note for note, _ in results]
+        level = 1
+        while len(notes) > 1 and not self._fits_reduce(notes):
+            groups = self.group_notes(notes)
+            logger.warning(f"下書きメモ{len(notes)}件を{len(groups)}件に統合します（{level}段目）。")
+            merge_estimate = sum(
+                self._input_fee(estimate_tokens(MERGE_PROMPT + format_notes(group)))
+                for group in groups
+                if len(group) > 1
+            )
+            spent = sum(p.total_fee for p in parts)
+            self._check_budget(spent + merge_estimate, f"下書きメモの統合（{level}段目）の見積もり")
+            with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+                merged = list(
+                    executor.map(self._merge_notes, range(1, len(groups) + 1), [len(groups)] * len(groups), groups)
+                )
+            notes = [note for note, _ in merged]
+            parts.extend(stats for _, stats in merged if stats is not None)
+            level += 1
+
+        notes = format_notes(notes)
+        reduce_estimate = self._input_fee(estimate_tokens(self.llm_config.prompt + notes))
+        self._check_budget(sum(p.total_fee for p in parts) + reduce_estimate, "分割要約後の見積もり")
+
+        # reduce: 下書きメモを元の指示で1本の記事に統合
+        reduce_config = self.llm_config.model_copy(update={"conversation": REDUCE_HEADER + notes})
+        data, stats = self.client_factory(reduce_config).get_summary_cached(self.cache)
+        parts.append(stats)
+
+        combined = CombinedTokenStats(parts)
+        logger.warning(f"分割要約の合計料金: ${combined.total_fee:.4f}（{len(parts)}リクエスト）")
+        logger.debug(f"統合後の記事: {json.dumps(data, ensure_ascii=False)[:200]}")
+        return data, combined
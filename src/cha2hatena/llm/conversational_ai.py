@@ -1,13 +1,18 @@
 import json
 import logging
 import sys
+import threading
 import time
 from abc import ABC, abstractmethod
 from pathlib import Path
-from typing import List
+from typing import TYPE_CHECKING, Iterable, List
 
 from pydantic import BaseModel, Field
 from .llm_stats import TokenStats
+from .streaming import IncrementalJsonParser, StreamFormatError
+
+if TYPE_CHECKING:
+    from .summary_cache import SummaryCache
 
 logger = logging.getLogger(__name__)
 
@@ -18,6 +23,8 @@ class LlmConfig(BaseModel):
     temperature: float = Field(ge=0, le=2.0, default=1.1, description="生成時の温度パラメータ")
     api_key: str = Field(min_length=1, description="API キー")
     conversation: str = Field(description="会話ログ")
+    append_statement: bool = Field(default=True, description="記事末尾の自動生成注記を指示するか")
+    stream: bool = Field(default=False, description="応答をストリーミングで受け取るか")
 
 
 # llm_outputs, llm_stats = hinge(llm_config)
@@ -31,29 +38,62 @@ class BlogPost(BaseModel):
     categories: List[str] = Field(description="カテゴリー一覧", max_length=4)
 
 
+class RequestCancelledError(RuntimeError):
+    """cancelで打ち切られた要約（ヘッジで他のモデルが先に応答した場合など）"""
+
+
 class ConversationalAi(ABC):
     def __init__(self, config: LlmConfig):
+        # cancel後は結果を使わないため、キャッシュ・失敗時の出力を書き込まず、ストリーミングは受信を打ち切る
+        self.cancelled = threading.Event()
         self.model = config.model
         self.api_key = config.api_key
         self.temperature = config.temperature
+        self.stream = config.stream
         self.company_name = "Google" if self.model.startswith("gemini") else "Deepseek"
         STATEMENT = (
             f"またその最後には、「この記事は {self.model} により自動生成されています」と目立つように注記してください。"
+            if config.append_statement
+            else ""
         )
-        self.prompt = config.prompt + STATEMENT + "\n\n" + config.conversation
+        # 会話ログは巨大になり得るため、連結は1回だけ（プロンプトの完成形を一度で作る）
+        self.prompt = "".join((self.prompt_prefix(), config.prompt, STATEMENT, "\n\n", config.conversation))
+
+    def prompt_prefix(self) -> str:
+        """プロンプトの先頭に付ける文字列（サブクラスで上書き）"""
+        return ""
 
     @abstractmethod
     def get_summary(self) -> tuple[dict, TokenStats]:
         pass
 
-    def handle_server_error(self, i, max_retries):
-        if i < max_retries - 1:
-            logger.warning(f"{self.company_name}の計算資源が逼迫しているようです。{5 * (i + 1)}秒後にリトライします。")
-            time.sleep(5 * (i + 1))
-        else:
-            logger.warning(f"{self.company_name}は現在過負荷のようです。少し時間をおいて再実行する必要があります。")
-            logger.warning("実行を中止します。")
-            sys.exit(1)
+    def cancel(self) -> None:
+        """実行中の要約の結果を破棄する（別スレッドから呼ぶ）"""
+        self.cancelled.set()
+
+    def get_summary_cached(self, cache: "SummaryCache | None") -> tuple[dict, TokenStats]:
+        """同一のプロンプトで要約済みならキャッシュから返却"""
+        if cache is None:
+            return self.get_summary()
+
+        key = cache.make_key(self.model, self.temperature, self.prompt)
+        cached = cache.get(key)
+        if cached is not None:
+            logger.warning("要約キャッシュを使用します（APIへのリクエストは行いません）")
+            return cached
+
+        data, stats = self.get_summary()
+        if self.cancelled.is_set():
+            raise RequestCancelledError(f"{self.model}の要約は打ち切られました")
+        cache.put(key, data, stats)
+        return data, stats
+
+    def handle_overload(self, e: Exception):
+        """再試行しても一時的なエラーが続いた場合"""
+        logger.warning(f"{self.company_name}は現在過負荷のようです。少し時間をおいて再実行する必要があります。")
+        logger.warning("実行を中止します。")
+        logger.info(f"詳細: {e}")
+        sys.exit(1)
 
     def handle_client_error(self, e: Exception):
         logger.error("エラー：APIレート制限。")
@@ -67,6 +107,56 @@ class ConversationalAi(ABC):
         logger.info(f"詳細: {e}")
         raise
 
+    def read_stream(self, pieces: Iterable[tuple[str, str]], started: float) -> tuple[dict, str, float | None, float]:
+        """ストリーミングの断片（"reasoning"または"content"と文字列の組）を受け取りながらJSONを検証
+
+        タイトル・カテゴリーは届いた時点でログに出し、JSONとして不正になった時点で受信を打ち切る。
+        戻り値は(出力の辞書, 出力の文字列, 最初のトークンまでの秒数, 最初のトークンから完了までの秒数)。
+        """
+
+        def on_field(key: str, value) -> None:
+            if key == "title":
+                logger.warning(f"タイトルを受信: {value}")
+            elif key == "categories":
+                logger.warning(f"カテゴリーを受信: {', '.join(map(str, value))}")
+
+        parser = IncrementalJsonParser(on_field, allowed_keys=BlogPost.model_fields)
+        first_token = None
+        try:
+            for kind, text in pieces:
+                if self.cancelled.is_set():
+                    if hasattr(pieces, "close"):
+                        pieces.close()
+                    raise RequestCancelledError(f"{self.model}の受信を打ち切りました")
+                if not text:
+                    continue
+                if first_token is None:
+                    first_token = time.perf_counter()
+                    logger.debug(f"最初のトークンを受信（{first_token - started:.2f}秒）")
+                if kind == "content":
+                    parser.feed(text)
+            parser.close()
+        except StreamFormatError as e:
+            if hasattr(pieces, "close"):
+                pieces.close()  # 受信を打ち切り、以降の生成を待たない
+            logger.error(f"{self.model}の出力が不正なため受信を中止しました: {e}")
+            self.save_failed_output(parser.text)
+
+        finished = time.perf_counter()
+        ttft = first_token - started if first_token is not None else None
+        return self.check_response(parser.text), parser.text, ttft, finished - (first_token or started)
+
+    def save_failed_output(self, response_text: str):
+        if self.cancelled.is_set():  # 結果を使わないため、採用した要約の失敗時の出力を上書きしない
+            raise RequestCancelledError(f"{self.model}の要約は打ち切られました")
+        output_path = Path.cwd() / "outputs"
+        output_path.mkdir(exist_ok=True)
+        file_path = output_path / "__summary.txt"
+        file_path.write_text(response_text, encoding="utf-8")
+
+        logger.error(f"{file_path}へ出力を保存しました。")
+        sys.exit(1)
+
     def check_response(self, response_text):
         required_keys = {"title", "content", "categories"}
         try:
@@ -75,12 +165,6 @@ class ConversationalAi(ABC):
                 logger.warning(f"{self.model}が構造化出力に成功")
         except Exception:
             logger.error(f"{self.model}が構造化出力に失敗。")
-            output_path = Path.cwd() / "outputs"
-            output_path.mkdir(exist_ok=True)
-            file_path = output_path / "__summary.txt"
-            file_path.write_text(response_text, encoding="utf-8")
-
-            logger.error(f"{file_path}へ出力を保存しました。")
-            sys.exit(1)
+            self.save_failed_output(response_text)
 
         return data
@@ -1,66 +1,107 @@
 import logging
 import sys
+import time
+from functools import lru_cache
 
+from .. import http_pool, retry
 from .conversational_ai import BlogPost, ConversationalAi, TokenStats
 
 logger = logging.getLogger(__name__)
 
 
-class DeepseekClient(ConversationalAi):
-    def get_summary(self) -> tuple[dict, TokenStats]:
-        from openai import OpenAI
+@lru_cache(maxsize=8)
+def _sdk_client(api_key: str, timeout: float):
+    """OpenAI互換クライアントをAPIキーごとに使い回す（keep-aliveの接続プールを保持）"""
+    from openai import OpenAI
+
+    # 再試行はretry.callで行う（SDK内部の再試行と重ねない）
+    return OpenAI(api_key=api_key, base_url="https://api.deepseek.com", timeout=timeout, max_retries=0)
+
 
-        statement = f"次の行から示すプロンプトはこのPydanticモデルに合うJSONで出力してください: {BlogPost.model_json_schema()}\n"
-        self.prompt = statement + self.prompt
+class DeepseekClient(ConversationalAi):
+    def prompt_prefix(self) -> str:
+        return f"次の行から示すプロンプトはこのPydanticモデルに合うJSONで出力してください: {BlogPost.model_json_schema()}\n"
 
+    def get_summary(self) -> tuple[dict, TokenStats]:
         logger.warning("Deepseekからの応答を待っています。")
         logger.debug(f"APIリクエスト中。APIキー: ...{self.api_key[-5:]}")
 
-        client = OpenAI(api_key=self.api_key, base_url="https://api.deepseek.com")
+        client = _sdk_client(self.api_key, http_pool.settings().llm_timeout)
 
-        max_retries = 3
-        for i in range(max_retries):
-            try:
-                response = client.chat.completions.create(
-                    model=self.model,
-                    temperature=self.temperature,
-                    messages=[{"role": "user", "content": self.prompt}],
-                    response_format={"type": "json_object"},
-                    stream=False,
-                )
-                break
-            except Exception as e:
-                # https://api-docs.deepseek.com/quick_start/error_codes
-                if any(code in str(e) for code in [500, 502, 503]):
-                    super().handle_server_error(i, max_retries)
-                elif "429" in str(e):
-                    logger.error("APIレート制限。しばらく経ってから再実行してください。")
-                    raise
-                elif "401" in str(e):
-                    logger.error("エラー：APIキーが誤っているか、入力されていません。")
-                    logger.error(f"実行を中止します。詳細：{e}")
-                    sys.exit(1)
-                elif "402" in str(e):
-                    logger.error("残高が不足しているようです。アカウントを確認してください。")
-                    logger.error(f"実行を中止します。詳細：{e}")
-                    sys.exit(1)
-                elif "422" in str(e):
-                    logger.error("リクエストに無効なパラメータが含まれています。設定を見直してください。")
-                    logger.error(f"実行を中止します。詳細：{e}")
-                    sys.exit(1)
-                else:
-                    super().handle_unexpected_error(e)
+        def send():
+            nonlocal started
+            started = time.perf_counter()  # 応答時間は再試行の待ち時間を含めない
+            return client.chat.completions.create(
+                model=self.model,
+                temperature=self.temperature,
+                messages=[{"role": "user", "content": self.prompt}],
+                response_format={"type": "json_object"},
+                stream=self.stream,
+                **({"stream_options": {"include_usage": True}} if self.stream else {}),
+            )
 
-        generated_text = response.choices[0].message.content
-        data = super().check_response(generated_text)
+        started = 0.0
+        try:
+            response = retry.call(send, name="Deepseek")
+        except Exception as e:
+            # https://api-docs.deepseek.com/quick_start/error_codes
+            status = retry.status_of(e)
+            if status == 429:
+                logger.error("APIレート制限。しばらく経ってから再実行してください。")
+                raise
+            elif status == 401:
+                logger.error("エラー：APIキーが誤っているか、入力されていません。")
+                logger.error(f"実行を中止します。詳細：{e}")
+                sys.exit(1)
+            elif status == 402:
+                logger.error("残高が不足しているようです。アカウントを確認してください。")
+                logger.error(f"実行を中止します。詳細：{e}")
+                sys.exit(1)
+            elif status == 422:
+                logger.error("リクエストに無効なパラメータが含まれています。設定を見直してください。")
+                logger.error(f"実行を中止します。詳細：{e}")
+                sys.exit(1)
+            elif retry.is_retryable(e):
+                super().handle_overload(e)
+            else:
+                super().handle_unexpected_error(e)
+
+        ttft = None
+        if self.stream:
+            received = {}
+            data, generated_text, ttft, seconds = super().read_stream(self._pieces(response, received), started)
+            usage = received["usage"]
+        else:
+            generated_text = response.choices[0].message.content
+            data = super().check_response(generated_text)
+            seconds = time.perf_counter() - started
+            usage = response.usage
 
         stats = TokenStats(
-            response.usage.prompt_tokens,
-            getattr(response.usage.completion_tokens_details, "reasoning_tokens", 0),
-            response.usage.completion_tokens,
+            usage.prompt_tokens,
+            getattr(usage.completion_tokens_details, "reasoning_tokens", 0),
+            usage.completion_tokens,
             len(self.prompt),
             len(generated_text),
             self.model,
+            getattr(usage, "prompt_cache_hit_tokens", 0) or 0,  # キャッシュに当たった入力は単価が安い
         )
+        stats.ttft_seconds, stats.generation_seconds = ttft, seconds
+        stats.log_timing()
 
         return data, stats
+
+    @staticmethod
+    def _pieces(response, received: dict):
+        """ストリームのチャンクを("reasoning" | "content", 文字列)に変換。使用量は最後のチャンクから取得"""
+        try:
+            for chunk in response:
+                if chunk.usage is not None:
+                    received["usage"] = chunk.usage
+                if not chunk.choices:
+                    continue
+                delta = chunk.choices[0].delta
+                yield "reasoning", getattr(delta, "reasoning_content", None) or ""
+                yield "content", delta.content or ""
+        finally:
+            response.close()  # 途中で打ち切った場合も接続を閉じる
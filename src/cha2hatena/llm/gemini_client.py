@@ -1,14 +1,26 @@
+import itertools
 import logging
+import time
+from functools import lru_cache
 
+from .. import http_pool, retry
 from .conversational_ai import BlogPost, ConversationalAi
 from .llm_stats import TokenStats
 
 logger = logging.getLogger(__name__)
 
 
+@lru_cache(maxsize=8)
+def _sdk_client(api_key: str, timeout: float):
+    """APIキーごとにSDKのクライアントを共有（内部のHTTP接続を再利用）"""
+    from google import genai
+    from google.genai import types
+
+    return genai.Client(api_key=api_key, http_options=types.HttpOptions(timeout=int(timeout * 1000)))  # ミリ秒
+
+
 class GeminiClient(ConversationalAi):
     def get_summary(self):
-        from google import genai
         from google.genai import types
         from google.genai.errors import ClientError, ServerError
 
@@ -16,39 +28,74 @@ class GeminiClient(ConversationalAi):
         logger.debug(f"APIリクエスト中。APIキー: ...{self.api_key[-5:]}")
 
         # api_key引数なしでも、環境変数"GEMNI_API_KEY"の値を勝手に参照するが、可読性のため代入
-        client = genai.Client(api_key=self.api_key)
+        client = _sdk_client(self.api_key, http_pool.settings().llm_timeout)
 
-        max_retries = 3
-        for i in range(max_retries):
+        request = dict(
+            model=self.model,
+            contents=self.prompt,
+            config=types.GenerateContentConfig(
+                temperature=self.temperature,
+                response_mime_type="application/json",  # 構造化出力
+                response_json_schema=BlogPost.model_json_schema(),
+            ),
+        )
+
+        def send():
+            nonlocal started
+            started = time.perf_counter()  # 応答時間は再試行の待ち時間を含めない
+            if self.stream:
+                # ストリームはエラーが最初のチャンクの受信時に発生するため、ここで受け取っておく
+                stream = client.models.generate_content_stream(**request)
+                return stream, next(stream)
             # generate_contentメソッドは内部的にHTTPレスポンスコード200以外の場合は例外を発生させる
-            try:
-                response = client.models.generate_content(  # リクエスト
-                    model=self.model,
-                    contents=self.prompt,
-                    config=types.GenerateContentConfig(
-                        temperature=self.temperature,
-                        response_mime_type="application/json",  # 構造化出力
-                        response_json_schema=BlogPost.model_json_schema(),
-                    ),
-                )
+            return client.models.generate_content(**request), None  # リクエスト
+
+        started = 0.0
+        try:
+            response, first = retry.call(send, name="Gemini")
+            if not self.stream:
                 print("Geminiによる要約を受け取りました。")
-                break
-            except ServerError:
-                super().handle_server_error(i, max_retries)
-            except ClientError as e:
-                super().handle_client_error(e)
-            except Exception as e:
-                super().handle_unexpected_error(e)
+        except ServerError as e:
+            super().handle_overload(e)
+        except ClientError as e:
+            super().handle_client_error(e)
+        except Exception as e:
+            if retry.is_retryable(e):
+                super().handle_overload(e)
+            super().handle_unexpected_error(e)
 
-        data = super().check_response(response.text)
+        ttft = None
+        if self.stream:
+            received = {}
+            data, text, ttft, seconds = super().read_stream(self._pieces(first, response, received), started)
+            usage_metadata = received["usage_metadata"]
+        else:
+            data = super().check_response(response.text)
+            text = response.text
+            seconds = time.perf_counter() - started
+            usage_metadata = response.usage_metadata
 
         stats = TokenStats(
-            response.usage_metadata.prompt_token_count,
-            response.usage_metadata.thoughts_token_count,
-            response.usage_metadata.candidates_token_count,
+            usage_metadata.prompt_token_count,
+            usage_metadata.thoughts_token_count,
+            usage_metadata.candidates_token_count,
             len(self.prompt),
-            len(response.text),
+            len(text),
             self.model,
+            usage_metadata.cached_content_token_count or 0,
         )
+        stats.ttft_seconds, stats.generation_seconds = ttft, seconds
+        stats.log_timing()
 
         return data, stats
+
+    @staticmethod
+    def _pieces(first, stream, received: dict):
+        """ストリームのチャンクを("content", 文字列)に変換。使用量は最後のチャンクから取得"""
+        try:
+            for chunk in itertools.chain([first], stream):
+                if chunk.usage_metadata is not None:
+                    received["usage_metadata"] = chunk.usage_metadata  # 最後のチャンクに合計が入る
+                yield "content", chunk.text or ""
+        finally:
+            stream.close()  # 途中で打ち切った場合も接続を閉じる
@@ -1,5 +1,8 @@
 import logging
-from abc import ABC, abstractmethod
+import math
+from functools import lru_cache
+
+from .pricing import Fees, UnknownModelError, default_engine
 
 logger = logging.getLogger(__name__)
 
@@ -13,6 +16,8 @@ class TokenStats:
         input_letter_count: int,
         output_letter_count: int,
         model: str,
+        cache_hit_tokens: int = 0,
+        requests: int = 1,
     ):
         self.input_tokens = input_tokens
         self.thoughts_tokens = thoughts_tokens
@@ -20,116 +25,106 @@ class TokenStats:
         self.input_letter_count = input_letter_count
         self.output_letter_count = output_letter_count
         self.model_name = model
+        self.cache_hit_tokens = cache_hit_tokens  # 入力のうちAPI側のキャッシュに当たった分（DeepSeek）
+        self.requests = requests  # APIへのリクエスト数（分割して要約した場合は複数）
+        # 要約キャッシュから復元した場合True（今回の実行ではAPI料金は発生していない）
+        self.from_cache = False
+        # 応答時間（APIへのリクエスト時のみ。ストリーミングでない場合ttft_secondsはNone）
+        self.ttft_seconds: float | None = None
+        self.generation_seconds: float | None = None
         # 遅延計算用のキャッシュ
-        self._input_fee = None
-        self._thoughts_fee = None
-        self._output_fee = None
-        
+        self._fees: Fees | None = None
+
+    def to_dict(self) -> dict:
+        """保存用にトークン数のみを辞書化（料金は読み込み時に再計算）"""
+        return {
+            "input_tokens": self.input_tokens,
+            "thoughts_tokens": self.thoughts_tokens,
+            "output_tokens": self.output_tokens,
+            "input_letter_count": self.input_letter_count,
+            "output_letter_count": self.output_letter_count,
+            "model": self.model_name,
+            "cache_hit_tokens": self.cache_hit_tokens,
+            "requests": self.requests,
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "TokenStats":
+        return cls(**data)
+
+    @property
+    def tokens_per_second(self) -> float | None:
+        """最初のトークンから完了までの出力トークン/秒"""
+        if not self.generation_seconds:
+            return None
+        return self.output_tokens / self.generation_seconds
+
+    def log_timing(self) -> None:
+        if self.ttft_seconds is not None:
+            logger.warning(
+                f"最初のトークンまで{self.ttft_seconds:.1f}秒・出力{self.tokens_per_second or 0:.1f}トークン/秒"
+            )
+
+    @property
+    def fees(self) -> Fees:
+        """料金表から計算した料金（料金表にないモデルはNaN）"""
+        if self._fees is None:
+            try:
+                self._fees = default_engine().fees(
+                    self.model_name, self.input_tokens, self.thoughts_tokens, self.output_tokens, self.cache_hit_tokens
+                )
+            except UnknownModelError as e:
+                _warn_unknown_model(str(e))
+                self._fees = Fees(math.nan, math.nan, math.nan)
+        return self._fees
+
     @property
     def input_fee(self) -> float:
-        if self._input_fee is None:
-            self._input_fee = LlmFee(self.model_name).calculate(self.input_tokens, "input")
-        return self._input_fee
-    
+        return self.fees.input
+
     @property
     def thoughts_fee(self) -> float:
-        if self._thoughts_fee is None:
-            self._thoughts_fee = LlmFee(self.model_name).calculate(self.thoughts_tokens, "thoughts")
-        return self._thoughts_fee
-    
+        return self.fees.thoughts
+
     @property
     def output_fee(self) -> float:
-        if self._output_fee is None:
-            self._output_fee = LlmFee(self.model_name).calculate(self.output_tokens, "output")
-        return self._output_fee
-    
+        return self.fees.output
+
     @property
     def total_fee(self) -> float:
         return self.input_fee + self.thoughts_fee + self.output_fee
 
 
-class BaseLlmFee(ABC):
-    def __init__(self, model: str):
-        self.model = model
-
-    @abstractmethod
-    def fees(self):
-        pass
+class CombinedTokenStats(TokenStats):
+    """複数リクエストの合計。料金はリクエストごとに計算して合算（料金階層がリクエスト単位のため）"""
 
-    @abstractmethod
-    def model_list(self):
-        pass
-
-    @abstractmethod
-    def calculate(self, tokens: int, token_type: str) -> float:
-        pass
-
-class LlmFee(BaseLlmFee):
-    """2025/12/09現在"""
-
-    _fees = {
-        "gemini-2.5-flash": {"input": 0.03, "output": 2.5},  # $per 1M tokens
-        "gemini-2.5-pro": {
-            "under_0.2M": {"input": 1.25, "output": 10.00},
-            "over_0.2M": {"input": 2.5, "output": 15.0},
-        },
-        "deepseek": {"input(cache_hit)": 0.028, "input(cache_miss)": 0.28, "output": 0.42},
-    }
-    _model_list = ["gemini-2.5-flash", "gemini-2.5-pro", "deepseek-chat", "deepseek-reasoner"]
+    def __init__(self, parts: list[TokenStats]):
+        super().__init__(
+            sum(p.input_tokens for p in parts),
+            sum(p.thoughts_tokens for p in parts),
+            sum(p.output_tokens for p in parts),
+            sum(p.input_letter_count for p in parts),
+            sum(p.output_letter_count for p in parts),
+            parts[-1].model_name,
+            sum(p.cache_hit_tokens for p in parts),
+            sum(p.requests for p in parts),
+        )
+        self.parts = parts
 
     @property
-    def fees(self):
-        return self._fees
+    def input_fee(self) -> float:
+        return sum(p.input_fee for p in self.parts)
 
     @property
-    def model_list(self):
-        return self._model_list
-
-    def calculate(self, tokens, token_type: str) -> float:
-        model_name = self.model
-        token_type = "output" if token_type == "thoughts" else token_type
-        if self.model not in self.model_list:
-            logger.warning("料金表に登録されていないモデルです")
-            logger.warning("'gemini-2.5-proの料金で試算します")
-            model_name = "gemini-2.5-pro"
-        if model_name.startswith("deepseek"):
-            base_fee = self.fees["deepseek"]
-            token_type = "output" if token_type == "thoughts" else token_type
-            if token_type == "output":
-                dollar_per_1M_tokens = base_fee["output"]
-            else:
-                dollar_per_1M_tokens = base_fee["input(cache_miss)"]
-        elif model_name == "gemini-2.5-flash":
-            dollar_per_1M_tokens = self.fees[self.model][token_type]
-        else:
-            base_fee = self.fees["gemini-2.5-pro"]
-            if tokens <= 200000:
-                dollar_per_1M_tokens = base_fee["under_0.2M"][token_type]
-            else:
-                dollar_per_1M_tokens = base_fee["over_0.2M"][token_type]
-
-        return dollar_per_1M_tokens * tokens / 1000000
-
-
-"""
-class DeepseekFee(LlmFee):
-    _fees = {"input(cache_hit)": 0.028, "input(cache_miss)":0.28, "output": 0.42}
-    _model_list = ["deepseek-chat", "deepseek-reasoner"]
+    def thoughts_fee(self) -> float:
+        return sum(p.thoughts_fee for p in self.parts)
 
     @property
-    def fees(self):
-        return self._fees
+    def output_fee(self) -> float:
+        return sum(p.output_fee for p in self.parts)
 
-    @property
-    def model_list(self):
-        return self._model_list
-
-    def calculate(self, tokens, token_type):
-        token_type = "output" if token_type == "thoughts" else token_type
-        if token_type == "output":
-            dollar_per_1M_tokens = self.fees["output"]
-        else:
-            dollar_per_1M_tokens = self.fees["input(cache_miss)"]
-        
-        return dollar_per_1M_tokens * tokens / 1000000
-"""
+
+@lru_cache(maxsize=None)
+def _warn_unknown_model(message: str) -> None:
+    """同じモデルについては1回だけ警告"""
+    logger.error(f"{message}（料金は記録されません）")
@@ -0,0 +1,186 @@
+import logging
+from bisect import bisect_right
+from datetime import date
+from functools import lru_cache
+from typing import NamedTuple
+
+from pydantic import BaseModel
+
+logger = logging.getLogger(__name__)
+
+# 料金表（USD / 100万トークン）。改定時は同じモデルに新しいeffectiveのエントリを追加する
+# tiersはリクエストの入力トークン数がup_to以下の最初の階層を適用（up_toなしは上限なし）
+# cache_hitはキャッシュ済み入力トークンの単価（省略時はinputと同じ）
+PRICE_TABLE = {
+    "version": "2025-12-09",
+    "prices": [
+        {
+            "model": "gemini-2.5-flash",
+            "effective": "2025-06-17",
+            "tiers": [{"input": 0.03, "output": 2.5}],
+        },
+        {
+            "model": "gemini-2.5-pro",
+            "effective": "2025-06-17",
+            "tiers": [{"up_to": 200_000, "input": 1.25, "output": 10.0}, {"input": 2.5, "output": 15.0}],
+        },
+        {
+            "model": "deepseek-chat",
+            "effective": "2025-09-29",
+            "tiers": [{"input": 0.28, "cache_hit": 0.028, "output": 0.42}],
+        },
+        {
+            "model": "deepseek-reasoner",
+            "effective": "2025-09-29",
+            "tiers": [{"input": 0.28, "cache_hit": 0.028, "output": 0.42}],
+        },
+    ],
+}
+
+
+class UnknownModelError(KeyError):
+    """料金表に登録されていないモデル"""
+
+
+class PriceTier(BaseModel):
+    up_to: int | None = None
+    input: float
+    cache_hit: float | None = None
+    output: float
+
+
+class PriceVersion(BaseModel):
+    model: str
+    effective: date
+    tiers: list[PriceTier]
+
+
+class PriceTable(BaseModel):
+    version: str
+    prices: list[PriceVersion]
+
+
+class Fees(NamedTuple):
+    input: float
+    thoughts: float
+    output: float
+
+    @property
+    def total(self) -> float:
+        return self.input + self.thoughts + self.output
+
+
+class PricingEngine:
+    """料金表をモデルごと・適用日順に整理し、1回分の料金と履歴全体の料金を計算する"""
+
+    def __init__(self, table: PriceTable):
+        self.version = table.version
+        self._versions: dict[str, list[PriceVersion]] = {}
+        for price in sorted(table.prices, key=lambda p: p.effective):
+            self._versions.setdefault(price.model, []).append(price)
+        self._effective = {model: [v.effective for v in versions] for model, versions in self._versions.items()}
+        self._arrays: dict = {}
+
+    @property
+    def models(self) -> list[str]:
+        return list(self._versions)
+
+    def _version(self, model: str, day: date | None) -> PriceVersion:
+        versions = self._versions.get(model)
+        if versions is None:
+            raise UnknownModelError(f"料金表（{self.version}）に登録されていないモデルです: {model}")
+        index = bisect_right(self._effective[model], day or date.today()) - 1
+        return versions[max(index, 0)]  # 最初の適用日より前は最初の料金
+
+    def tier(self, model: str, input_tokens: int, day: date | None = None) -> PriceTier:
+        """モデル・日付・入力トークン数に対応する単価"""
+        for tier in self._version(model, day).tiers:
+            if tier.up_to is None or input_tokens <= tier.up_to:
+                return tier
+        return tier
+
+    def fees(
+        self,
+        model: str,
+        input_tokens: int,
+        thoughts_tokens: int = 0,
+        output_tokens: int = 0,
+        cache_hit_tokens: int = 0,
+        day: date | None = None,
+    ) -> Fees:
+        """1リクエスト分の料金（USD）。思考トークンは出力の単価"""
+        tier = self.tier(model, input_tokens, day)
+        cache_hit_rate = tier.input if tier.cache_hit is None else tier.cache_hit
+        return Fees(
+            ((input_tokens - cache_hit_tokens) * tier.input + cache_hit_tokens * cache_hit_rate) / 1_000_000,
+            thoughts_tokens * tier.output / 1_000_000,
+            output_tokens * tier.output / 1_000_000,
+        )
+
+    def _model_arrays(self, model: str):
+        """モデルの適用日・階層の上限・単価を配列化（階層数が違う版は上限なしで埋める）"""
+        import numpy as np
+
+        if model not in self._arrays:
+            versions = self._versions[model]
+            depth = max(len(v.tiers) for v in versions)
+            up_to = np.full((len(versions), depth), np.inf)
+            rates = np.zeros((len(versions), depth, 3))
+            for i, version in enumerate(versions):
+                for j, tier in enumerate(version.tiers):
+                    up_to[i, j] = np.inf if tier.up_to is None else tier.up_to
+                    rates[i, j] = (tier.input, tier.input if tier.cache_hit is None else tier.cache_hit, tier.output)
+                rates[i, len(version.tiers) :] = rates[i, len(version.tiers) - 1]
+            effective = np.array([v.effective for v in versions], dtype="datetime64[D]")
+            self._arrays[model] = (effective, up_to, rates)
+        return self._arrays[model]
+
+    def fee_arrays(
+        self, models, input_tokens, thoughts_tokens=None, output_tokens=None, cache_hit_tokens=None, days=None
+    ) -> dict:
+        """複数回分の料金を一括計算し、input・thoughts・output・totalの配列を返す
+
+        daysは各回の日付（"YYYY-MM-DD"など。省略時は今日の料金）。料金表にないモデルの行はNaN。
+        """
+        import numpy as np
+
+        models = list(models)
+        count = len(models)
+
+        def column(values):
+            return np.zeros(count) if values is None else np.asarray(values, dtype=float)
+
+        inputs, thoughts, outputs, cache_hits = map(
+            column, (input_tokens, thoughts_tokens, output_tokens, cache_hit_tokens)
+        )
+        days = np.full(count, np.datetime64(date.today(), "D")) if days is None else np.asarray(days, "datetime64[D]")
+
+        # モデル名を番号に置き換え、モデルごとにまとめて単価を引く（文字列の並べ替えを避ける）
+        codes: dict[str, int] = {}
+        inverse = np.fromiter((codes.setdefault(model, len(codes)) for model in models), dtype=np.int64, count=count)
+        rates = np.full((count, 3), np.nan)
+        for model, code in codes.items():
+            if model not in self._versions:
+                logger.warning(f"料金表（{self.version}）に登録されていないモデルです: {model}")
+                continue
+            rows = np.flatnonzero(inverse == code)
+            effective, up_to, model_rates = self._model_arrays(model)
+            version = np.clip(np.searchsorted(effective, days[rows], side="right") - 1, 0, None)
+            tier = (inputs[rows, None] > up_to[version]).sum(axis=1)
+            rates[rows] = model_rates[version, np.minimum(tier, up_to.shape[1] - 1)]
+
+        input_fee = ((inputs - cache_hits) * rates[:, 0] + cache_hits * rates[:, 1]) / 1_000_000
+        thoughts_fee = thoughts * rates[:, 2] / 1_000_000
+        output_fee = outputs * rates[:, 2] / 1_000_000
+        return {
+            "input": input_fee,
+            "thoughts": thoughts_fee,
+            "output": output_fee,
+            "total": input_fee + thoughts_fee + output_fee,
+        }
+
+
+@lru_cache(maxsize=1)
+def default_engine() -> PricingEngine:
+    """組み込みの料金表から作成した料金計算（プロセス内で1回だけ作成）"""
+    return PricingEngine(PriceTable.model_validate(PRICE_TABLE))
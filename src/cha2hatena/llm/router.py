@@ -0,0 +1,176 @@
+import logging
+import queue
+import threading
+import time
+from typing import TYPE_CHECKING, Callable
+
+from pydantic import BaseModel
+
+from .conversational_ai import ConversationalAi, LlmConfig, RequestCancelledError
+from .llm_stats import TokenStats
+
+if TYPE_CHECKING:
+    from .summary_cache import SummaryCache
+
+logger = logging.getLogger(__name__)
+
+
+class RouterSettings(BaseModel):
+    fallback_model: str | None = None  # 主モデルが失敗したときに使うモデル
+    hedge_after_seconds: float | None = None  # この秒数で応答がなければ予備モデルにも同時にリクエスト
+    unhealthy_after_failures: int = 2  # 連続でこの回数失敗したモデルは後回し
+    cooldown_seconds: float = 300  # 後回しにする時間
+
+
+class AllProvidersFailedError(RuntimeError):
+    """すべてのモデルで要約に失敗した場合"""
+
+
+def provider_of(model: str) -> str:
+    return "gemini" if model.startswith("gemini") else "deepseek"
+
+
+class ProviderHealth:
+    """モデルごとの応答時間（指数移動平均）・失敗回数を記録し、速く正常なモデルから順に並べる"""
+
+    def __init__(self, settings: RouterSettings | None = None, alpha: float = 0.3):
+        self.settings = settings or RouterSettings()
+        self.alpha = alpha
+        self._stats: dict[str, dict] = {}
+        self._lock = threading.Lock()
+
+    def record(self, model: str, seconds: float, ok: bool) -> None:
+        with self._lock:
+            stats = self._stats.setdefault(
+                model, {"requests": 0, "errors": 0, "consecutive_errors": 0, "latency": None, "failed_at": 0.0}
+            )
+            stats["requests"] += 1
+            if ok:
+                stats["consecutive_errors"] = 0
+                previous = stats["latency"]
+                stats["latency"] = seconds if previous is None else self.alpha * seconds + (1 - self.alpha) * previous
+            else:
+                stats["errors"] += 1
+                stats["consecutive_errors"] += 1
+                stats["failed_at"] = time.monotonic()
+
+    def is_healthy(self, model: str) -> bool:
+        stats = self._stats.get(model)
+        if stats is None or stats["consecutive_errors"] < self.settings.unhealthy_after_failures:
+            return True
+        return time.monotonic() - stats["failed_at"] > self.settings.cooldown_seconds
+
+    def order(self, models: list[str]) -> list[str]:
+        """正常なモデルを応答の速い順に（未計測は指定順のまま先頭側へ）、不調なモデルは最後に"""
+        with self._lock:
+
+            def key(item):
+                index, model = item
+                latency = (self._stats.get(model) or {}).get("latency")
+                return (not self.is_healthy(model), 0.0 if latency is None else latency, index)
+
+            return [model for _, model in sorted(enumerate(models), key=key)]
+
+    def snapshot(self) -> dict[str, dict]:
+        with self._lock:
+            return {model: dict(stats) for model, stats in self._stats.items()}
+
+
+_health = ProviderHealth()
+
+
+def health() -> ProviderHealth:
+    """プロセス内で共有するモデルごとの記録（バッチ・常駐モードでは実行をまたいで蓄積）"""
+    return _health
+
+
+class Router:
+    """複数のモデルのクライアントを束ね、失敗時の切り替えと遅延時のヘッジを行う
+
+    ConversationalAiと同じくget_summary・get_summary_cachedを持ち、create_ai_clientの代わりに使える。
+    リクエストはデーモンスレッドで実行し、ヘッジで負けたリクエストは待たずに打ち切る（cancel）。
+    ストリーミングでない場合は応答まで止められないため、両方の料金が発生し得る。
+    """
+
+    def __init__(
+        self,
+        configs: list[LlmConfig],
+        client_factory: Callable[[LlmConfig], ConversationalAi],
+        settings: RouterSettings,
+        provider_health: ProviderHealth | None = None,
+    ):
+        self.configs = {config.model: config for config in configs}
+        self.client_factory = client_factory
+        self.settings = settings
+        self.health = provider_health or health()
+        self.model = configs[0].model
+
+    def _timed(self, model: str, client: ConversationalAi, call: Callable[[ConversationalAi], tuple]) -> tuple:
+        started = time.perf_counter()
+        try:
+            result = call(client)
+        except RequestCancelledError:
+            raise  # 打ち切ったのはこちらのため、モデルの失敗として記録しない
+        # 要約クライアントは致命的なエラーでsys.exitするため、他のモデルへ切り替えられるよう捕捉
+        except (Exception, SystemExit):
+            self.health.record(model, time.perf_counter() - started, ok=False)
+            raise
+        self.health.record(model, time.perf_counter() - started, ok=True)
+        return result
+
+    def _run(self, call: Callable[[ConversationalAi], tuple]) -> tuple[dict, TokenStats]:
+        models = self.health.order(list(self.configs))
+        errors = []
+        results: queue.Queue = queue.Queue()
+        pending: dict[str, ConversationalAi] = {}
+
+        def start(model: str) -> None:
+            # 打ち切りはリクエストごとのため、クライアントも毎回作成
+            client = pending[model] = self.client_factory(self.configs[model])
+
+            def run():
+                try:
+                    results.put((model, self._timed(model, client, call), None))
+                except BaseException as e:
+                    results.put((model, None, e))
+
+            # ThreadPoolExecutorのスレッドは終了時に完了を待つため、負けたリクエストで終了が遅れないようデーモンにする
+            threading.Thread(target=run, name=f"llm-router-{model}", daemon=True).start()
+
+        start(models[0])
+        started = 1
+        try:
+            while pending:
+                can_hedge = started < len(models) and self.settings.hedge_after_seconds is not None
+                timeout = self.settings.hedge_after_seconds if can_hedge else None
+                try:
+                    model, result, error = results.get(timeout=timeout)
+                except queue.Empty:
+                    slow = ", ".join(pending)
+                    logger.warning(f"{slow}の応答が遅いため、{models[started]}にも同時にリクエストします。")
+                    start(models[started])
+                    started += 1
+                    continue
+
+                del pending[model]
+                if error is not None:
+                    errors.append(f"{model}: {error!r}")
+                    logger.warning(f"{model}での要約に失敗しました。")
+                    if not pending and started < len(models):
+                        logger.warning(f"{models[started]}に切り替えます。")
+                        start(models[started])
+                        started += 1
+                    continue
+                if model != models[0]:
+                    logger.warning(f"{model}の要約を使用します。")
+                return result
+        finally:
+            for client in pending.values():  # ヘッジで負けたリクエストは待たずに打ち切る
+                client.cancel()
+        raise AllProvidersFailedError(f"すべてのモデルで要約に失敗しました: {'; '.join(errors)}")
+
+    def get_summary(self) -> tuple[dict, TokenStats]:
+        return self._run(lambda client: client.get_summary())
+
+    def get_summary_cached(self, cache: "SummaryCache | None") -> tuple[dict, TokenStats]:
+        return self._run(lambda client: client.get_summary_cached(cache))
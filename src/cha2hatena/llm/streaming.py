@@ -0,0 +1,144 @@
+import json
+from typing import Callable, Iterable
+
+_WHITESPACE = " \t\r\n"
+
+
+class StreamFormatError(ValueError):
+    """ストリーミング中の出力がJSONのオブジェクトとして成り立たない場合"""
+
+
+class IncrementalJsonParser:
+    """届いた断片ごとにJSONオブジェクトを読み進め、最上位の項目が揃った時点でon_fieldを呼ぶ
+
+    最上位の構造（キー・コロン・カンマ・括弧）と文字列のエスケープだけを追跡し、
+    値の中身は値が閉じた時点でjson.loadsする。各文字は1回しか走査しない。
+    allowed_keysを指定すると、それ以外のキーが現れた時点でStreamFormatError。
+    """
+
+    def __init__(
+        self,
+        on_field: Callable[[str, object], None] | None = None,
+        allowed_keys: Iterable[str] | None = None,
+    ):
+        self.on_field = on_field
+        self.allowed_keys = set(allowed_keys) if allowed_keys is not None else None
+        self.fields: dict = {}
+        self._text: list[str] = []
+        self._length = 0
+        self._state = "start"  # start → key → colon → value → comma → (key …) → done
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._token_start = 0
+        self._key: str | None = None
+
+    @property
+    def text(self) -> str:
+        return "".join(self._text)
+
+    def _fail(self, message: str, position: int):
+        snippet = self.text[max(position - 20, 0) : position + 1]
+        raise StreamFormatError(f"{message}（{position}文字目付近: {snippet!r}）")
+
+    def _slice(self, start: int, end: int) -> str:
+        text = self.text
+        self._text = [text]  # 連結結果を残し、次回の連結を減らす
+        return text[start:end]
+
+    def _finish_value(self, end: int) -> None:
+        raw = self._slice(self._token_start, end)
+        try:
+            value = json.loads(raw)
+        except json.JSONDecodeError:
+            self._fail(f"{self._key}の値がJSONとして不正です", end)
+        self.fields[self._key] = value
+        if self.on_field is not None:
+            self.on_field(self._key, value)
+        self._state = "comma"
+
+    def feed(self, chunk: str) -> None:
+        offset = self._length
+        self._text.append(chunk)
+        self._length += len(chunk)
+
+        for i, char in enumerate(chunk, offset):
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif char == "\\":
+                    self._escape = True
+                elif char == '"':
+                    self._in_string = False
+                    if self._depth == 1 and self._state == "key":
+                        self._key = json.loads(self._slice(self._token_start, i + 1))
+                        if self.allowed_keys is not None and self._key not in self.allowed_keys:
+                            self._fail(f"想定外のキーです: {self._key}", i)
+                        self._state = "colon"
+                    elif self._depth == 1 and self._state == "value":
+                        self._finish_value(i + 1)
+                continue
+
+            # 値が入れ子の配列・オブジェクトの場合は、括弧が閉じるまで中身を読み飛ばす
+            if self._depth > 1:
+                if char == '"':
+                    self._in_string = True
+                elif char in "[{":
+                    self._depth += 1
+                elif char in "]}":
+                    self._depth -= 1
+                    if self._depth == 1:
+                        self._finish_value(i + 1)
+                continue
+
+            if self._state == "scalar":
+                if char not in ",}" and char not in _WHITESPACE:
+                    continue
+                self._state = "value"
+                self._finish_value(i)
+
+            if char in _WHITESPACE:
+                continue
+            if self._state == "start":
+                if char != "{":
+                    self._fail("JSONのオブジェクトではありません", i)
+                self._depth = 1
+                self._state = "key"
+            elif self._state == "key":
+                if char == '"':
+                    self._in_string = True
+                    self._token_start = i
+                elif char == "}" and not self.fields:
+                    self._state = "done"
+                else:
+                    self._fail("キーがありません", i)
+            elif self._state == "colon":
+                if char != ":":
+                    self._fail("コロンがありません", i)
+                self._state = "value"
+            elif self._state == "value":
+                self._token_start = i
+                if char == '"':
+                    self._in_string = True
+                elif char in "[{":
+                    self._depth += 1
+                elif char in ",:]}":
+                    self._fail("値がありません", i)
+                else:
+                    self._state = "scalar"  # 数値・true・false・null
+            elif self._state == "comma":
+                if char == ",":
+                    self._state = "key"
+                elif char == "}":
+                    self._depth = 0
+                    self._state = "done"
+                else:
+                    self._fail("カンマがありません", i)
+            elif self._state == "done":
+                self._fail("オブジェクトの後に余分な文字があります", i)
+
+    def close(self) -> dict:
+        """入力の終わり。オブジェクトが閉じていなければStreamFormatError"""
+        if self._state != "done":
+            self._fail("出力が途中で終了しました", self._length)
+        return self.fields
@@ -0,0 +1,78 @@
+import hashlib
+import json
+import logging
+import os
+from pathlib import Path
+
+from .conversational_ai import BlogPost
+from .llm_stats import TokenStats
+
+logger = logging.getLogger(__name__)
+
+
+class SummaryCache:
+    """要約結果（BlogPostのJSONとTokenStats）のディスクキャッシュ
+
+    キーはモデル・温度・最終プロンプト・BlogPostスキーマのハッシュ。
+    容量上限を超えた場合は最終参照時刻(mtime)の古い順に削除する。
+    """
+
+    def __init__(self, cache_dir: Path, max_bytes: int = 50 * 1024 * 1024):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+
+    @staticmethod
+    def make_key(model: str, temperature: float, prompt: str) -> str:
+        material = json.dumps(
+            {
+                "model": model,
+                "temperature": temperature,
+                "prompt": prompt,
+                "schema": BlogPost.model_json_schema(),
+            },
+            ensure_ascii=False,
+            sort_keys=True,
+        )
+        return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+    def _path(self, key: str) -> Path:
+        return self.cache_dir / f"{key}.json"
+
+    def get(self, key: str) -> tuple[dict, TokenStats] | None:
+        path = self._path(key)
+        try:
+            entry = json.loads(path.read_text(encoding="utf-8"))
+            os.utime(path)  # LRU用に参照時刻を更新
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+
+        stats = TokenStats.from_dict(entry["stats"])
+        stats.from_cache = True
+        return entry["data"], stats
+
+    def put(self, key: str, data: dict, stats: TokenStats) -> None:
+        path = self._path(key)
+        tmp_path = path.with_suffix(f".{os.getpid()}.tmp")
+        entry = {"data": data, "stats": stats.to_dict()}
+        tmp_path.write_text(json.dumps(entry, ensure_ascii=False), encoding="utf-8")
+        os.replace(tmp_path, path)
+        self.evict()
+
+    def evict(self) -> None:
+        """容量上限を超えた分を古い順に削除"""
+        entries = []
+        for path in self.cache_dir.glob("*.json"):
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            path.unlink(missing_ok=True)
+            total -= size
+            logger.debug(f"要約キャッシュを削除しました: {path.name}")
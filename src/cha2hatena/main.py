@@ -1,37 +1,99 @@
+import argparse
 import csv
 import logging
+import math
 import sys
-from datetime import datetime
+import threading
+import time
+from datetime import date, datetime
+from functools import lru_cache
 from pathlib import Path
 
-import gspread
-import yfinance as yf
+from pydantic import BaseModel
 
-from . import hatenablog_poster, line_message
 from . import json_loader as jl
+from .entry_index import EntryIndex, content_digest
+from .fx_rate import FxRateProvider, FxSettings
+from .ingest_state import IngestState
 from .llm import deepseek_client, gemini_client
+from .llm.chunking import MapReduceSummarizer
 from .llm.conversational_ai import ConversationalAi, LlmConfig
+from .llm.llm_stats import TokenStats
+from .llm.router import Router, RouterSettings, provider_of
+from .llm.summary_cache import SummaryCache
+from .run_history import RunHistory
 from .setup import initialization
+from .sheets_sink import SheetsSink, service_account_client
+from .side_effects import RetryQueue, SideEffectSettings, SideEffectTask, run_tasks
 
 logger = logging.getLogger(__name__)
 parent_logger = logging.getLogger("cha2hatena")
 
-try:
-    DEBUG, SECRET_KEYS, LLM_CONFIG, config = initialization(parent_logger)
-except Exception as e:
-    logger.critical(f"初期設定が正常に行われませんでした: {e}", exc_info=True)
-    sys.exit(1)
 
-
-PRESET_CATEGORIES = config["blog"]["preset_category"]
-LINE_ACCESS_TOKEN = SECRET_KEYS.pop("LINE_CHANNEL_ACCESS_TOKEN")
-HATENA_SECRET_KEYS = SECRET_KEYS
+class AppContext(BaseModel):
+    debug: bool
+    config: dict
+    llm_config: LlmConfig
+    hatena_secret_keys: dict
+    line_access_token: str
+    llm_api_keys: dict = {}
+
+    @property
+    def preset_categories(self) -> list:
+        return self.config["blog"]["preset_category"]
+
+
+_context: AppContext | None = None
+_context_lock = threading.Lock()
+
+
+def app_context() -> AppContext:
+    """設定・.env・ログの初期化（初回の呼び出し時のみ。import時には行わない）"""
+    global _context
+    with _context_lock:
+        if _context is None:
+            try:
+                debug, secret_keys, llm_config, config = initialization(parent_logger)
+            except Exception as e:
+                logger.critical(f"初期設定が正常に行われませんでした: {e}", exc_info=True)
+                sys.exit(1)
+
+            from . import http_pool, retry
+
+            http_pool.configure(http_pool.HttpSettings(**(config.get("http") or {})))
+            retry.configure(retry.RetrySettings(**(config.get("retry") or {})))
+            line_access_token = secret_keys.pop("LINE_CHANNEL_ACCESS_TOKEN")
+            llm_api_keys = secret_keys.pop("LLM_API_KEYS")
+            _context = AppContext(
+                debug=debug,
+                config=config,
+                llm_config=llm_config,
+                hatena_secret_keys=secret_keys,
+                line_access_token=line_access_token,
+                llm_api_keys=llm_api_keys,
+            )
+        return _context
 
 
 ######################################################
 
 
 def create_ai_client(config: LlmConfig):
+    """要約クライアントを作成。ai.fallback_modelがあれば切り替え・ヘッジ付きのルーターを返す"""
+    context = app_context()
+    settings = RouterSettings.model_validate(context.config["ai"])
+    if not settings.fallback_model or settings.fallback_model == config.model:
+        return create_provider_client(config)
+
+    api_key = context.llm_api_keys.get(provider_of(settings.fallback_model), "")
+    if not api_key:
+        logger.warning(f"{settings.fallback_model}のAPIキーがないため、予備モデルは使用しません。")
+        return create_provider_client(config)
+    fallback = config.model_copy(update={"model": settings.fallback_model, "api_key": api_key})
+    return Router([config, fallback], create_provider_client, settings)
+
+
+def create_provider_client(config: LlmConfig):
     if config.model.startswith("gemini"):
         client = gemini_client.GeminiClient(config)
     elif config.model.startswith("deepseek"):
@@ -43,173 +105,613 @@ def create_ai_client(config: LlmConfig):
 
 
 def append_csv(path: Path, data: dict):
-    """pathがなければ作成し、CSVに1行追記"""
+    """pathがなければ作成し、CSVに1行追記。失敗した場合は例外（再試行キュー用）
+
+    既存のCSVは列を変えずに追記する（後から増えた項目は実行履歴・スプレッドシートにのみ記録）。
+    """
     # ファイルを開く前に状態を確定させる（正しい）
     is_new_file = not path.exists() or path.stat().st_size == 0
-    
+
     try:
+        fieldnames = list(data)
+        if not is_new_file:
+            with path.open(newline="", encoding="utf-8-sig") as f:
+                fieldnames = next(csv.reader(f), fieldnames)
         with path.open("a", newline="", encoding="utf-8-sig") as f:
-            writer = csv.DictWriter(f, fieldnames=data.keys())
+            writer = csv.DictWriter(f, fieldnames=fieldnames, extrasaction="ignore")
             if is_new_file:
                 writer.writeheader()  # 新規または空の時のみ列名を追加
             writer.writerow(data)
-            
-        if is_new_file:
-            logger.warning(f"新しいCSVファイルを作成しました: {path}")
-        else:
-            logger.warning(f"CSVにデータを追記しました: {path.name}")    
     except Exception:
         logger.exception("CSVファイルへの書き込み中にエラーが発生しました。")
-        
+        raise
+
+    if is_new_file:
+        logger.warning(f"新しいCSVファイルを作成しました: {path}")
+    else:
+        logger.warning(f"CSVにデータを追記しました: {path.name}")
 
 
-def to_spreadsheet(new_data: dict, spreadsheet_name: str) -> None:
-    SCOPES = ["https://www.googleapis.com/auth/spreadsheets","https://www.googleapis.com/auth/drive"]
-    CREDENTIALS_DIRECTORY = Path.cwd() / "credentials" / "credentials.json"
+@lru_cache(maxsize=4)
+def sheets_sink(spreadsheet_name: str) -> SheetsSink:
+    """スプレッドシートごとに認証済みのクライアントとワークシートを使い回す"""
+    credentials_path = Path.cwd() / "credentials" / "credentials.json"
+    return SheetsSink(spreadsheet_name, lambda: service_account_client(credentials_path))
+
+
+def to_spreadsheet(new_data: dict, spreadsheet_name: str, flush: bool = True) -> None:
+    """スプレッドシートへ1行追記。flush=Falseの場合は送信待ちに溜める（flush_spreadsheetでまとめて送信）"""
     if spreadsheet_name:
-        gc = gspread.service_account(scopes=SCOPES, filename=CREDENTIALS_DIRECTORY)
-        try:
-            # スプレッドシートを開く（存在チェック）
-            sh = gc.open(spreadsheet_name)
-            worksheet = sh.sheet1
-            
-            existing_data = worksheet.get_all_values()
-            if not existing_data:
-                worksheet.update([list(new_data.keys())] + [list(new_data.values())])
-                logger.warning(f"新規作成: スプレッドシートにヘッダーとデータを追加しました: {spreadsheet_name}")
-            else:
-                worksheet.append_row(list(new_data.values()))
-                logger.warning("追記: スプレッドシートに新しい行を追加しました")
-
-        except gspread.exceptions.SpreadsheetNotFound:
-            # スプレッドシートが存在しない場合、新規作成
-            sh = gc.create("record")
-            worksheet = sh.sheet1
-            worksheet.update([list(new_data.keys())] + [list(new_data.values())])
-            logger.warning(f"新規スプレッドシートを作成し、データを追加しました: {spreadsheet_name}")
+        sink = sheets_sink(spreadsheet_name)
+        if flush:
+            sink.write(new_data)
+        else:
+            sink.append(new_data)
+
+
+### パイプラインの各段階（mainとbatchで共用）
+def build_summary_cache(use_cache: bool = True) -> SummaryCache | None:
+    """config.yamlのcache設定から要約キャッシュを作成"""
+    config = app_context().config
+    cache_config = config.get("cache") or {}
+    if not use_cache or not cache_config.get("summary", True):
+        return None
+    cache_dir = Path(config["paths"]["output_dir"].strip()) / ".cache" / "summary"
+    max_bytes = int(float(cache_config.get("max_size_mb", 50)) * 1024 * 1024)
+    return SummaryCache(cache_dir, max_bytes)
+
+
+def build_ingest_state(incremental: bool) -> IngestState | None:
+    """差分取り込みモードの場合、取り込み済み位置の保存先を作成"""
+    if not incremental:
+        return None
+    return IngestState(Path(app_context().config["paths"]["output_dir"].strip()) / ".state" / "ingest.json")
+
+
+def load_conversation(input_paths: list[Path], state: IngestState | None = None) -> str:
+    """JSONファイルから会話履歴を読み込み、テキストに整形"""
+    return jl.json_loader(input_paths, state)
+
+
+def summarize_conversation(
+    conversation: str, llm_config: LlmConfig, cache: SummaryCache | None = None
+) -> tuple[dict, TokenStats]:
+    """読み込み済みの会話履歴をAIで要約"""
+    job_config = llm_config.model_copy(update={"conversation": conversation})
+
+    # 長すぎる会話は分割して要約（map-reduce）
+    config = app_context().config
+    summarizer = MapReduceSummarizer(
+        job_config,
+        create_ai_client,
+        max_chunk_tokens=int(config["ai"].get("chunk_max_tokens") or 150000),
+        max_total_fee=config["ai"].get("max_total_fee"),
+        cache=cache,
+    )
+    if summarizer.needs_chunking():
+        return summarizer.summarize()
+
+    # AIオブジェクト作成
+    ai_instance: ConversationalAi = create_ai_client(job_config)
+
+    # AIで要約取得（同一プロンプトの再実行時はキャッシュから）
+    return ai_instance.get_summary_cached(cache)
+
+
+@lru_cache(maxsize=1)
+def entry_index() -> EntryIndex:
+    """投稿済みエントリーの索引（output_dir/.state/entries.json）"""
+    return EntryIndex(Path(app_context().config["paths"]["output_dir"].strip()) / ".state" / "entries.json")
+
+
+def post_to_hatena(
+    llm_outputs: dict, is_draft: bool, conversation_key: str | None = None, updated: datetime | None = None
+) -> dict:
+    """はてなブログへ投稿 投稿結果を辞書型で返却（updatedは公開時刻。Noneの場合は現在時刻）
+
+    同じ内容を投稿済みなら投稿せずに前回の結果を返す。blog.update_existingが有効で、
+    同じ会話（conversation_key）から投稿済みのエントリーがあれば、新規投稿せずにそのエントリーを更新する。
+    """
+    from . import hatenablog_poster
+
+    context = app_context()
+    index = entry_index()
+    digest = content_digest(
+        llm_outputs["title"], llm_outputs["content"], llm_outputs["categories"] + context.preset_categories, is_draft
+    )
+    posted = index.find_content(digest)
+    if posted is not None:
+        logger.warning(f"同じ内容の記事を投稿済みのため、投稿を省略します: {posted.get('link_alternate', '')}")
+        return posted
+
+    link_edit = None
+    if conversation_key and context.config["blog"].get("update_existing"):
+        previous = index.find_conversation(conversation_key)
+        if previous is not None:
+            link_edit = previous["link_edit"]
+            logger.warning(f"同じ会話から投稿済みの記事を更新します: {previous.get('link_alternate', '')}")
+
+    result = hatenablog_poster.blog_post(
+        **llm_outputs,
+        preset_categories=context.preset_categories,
+        hatena_secret_keys=context.hatena_secret_keys,
+        author=None,  # str | None   Noneの場合自分のはてなID
+        updated=updated,  # datetime | None  公開時刻設定。Noneの場合は現在時刻
+        is_draft=is_draft,  # デバッグ時は下書き
+        link_edit=link_edit,
+    )
+    if result["status_code"] in (200, 201):
+        index.record(result, digest, conversation_key)
+    return result
+
+
+def build_line_text(blogpost_result: dict) -> str:
+    """投稿結果からLINE通知の本文を作成"""
+    url = blogpost_result.get("link_alternate", "")
+    url_edit = blogpost_result.get("link_edit_user", "")
+    title = blogpost_result.get("title", "")
+    content = blogpost_result.get("content", "")
+
+    if blogpost_result["status_code"] in (200, 201):  # 200は既存の記事の更新
+        line_text = "投稿完了です。今日も長い時間お疲れさまでした！\n"
+        line_text = (
+            line_text
+            + f"タイトル：{title}\n確認: {url}\n編集: {url_edit}\n下書きモード: {blogpost_result.get('is_draft')}"
+        )
+    else:
+        line_text = "要約の保存完了。ブログ投稿は行われませんでした。今日も長い時間お疲れ様でした。\n"
+        line_text = line_text + f"タイトル：{title}\n本文: \n{content[:200]} ..."
+    return line_text
+
+
+def notify_line(line_text: str) -> None:
+    """LINE通知。失敗しても処理は継続"""
+    from . import line_message
+
+    try:
+        line_message.line_messenger(line_text, app_context().line_access_token)
+    except Exception as e:
+        logger.error("エラー：LINE通知は行われませんでした。")
+        logger.info(f"詳細: {e}")
+
+
+def send_line(line_text: str) -> None:
+    """LINE通知。失敗した場合は例外（再試行キュー用）"""
+    from . import line_message
+
+    if not line_message.line_messenger(line_text, app_context().line_access_token):
+        raise RuntimeError("LINE通知に失敗しました")
+
+
+@lru_cache(maxsize=1)
+def fx_provider() -> FxRateProvider:
+    """config.yamlのfx設定から為替レートの取得元を作成"""
+    config = app_context().config
+    cache_path = Path(config["paths"]["output_dir"].strip()) / ".cache" / "fx_rate.json"
+    return FxRateProvider(cache_path, FxSettings.model_validate(config.get("fx") or {}))
+
+
+def fetch_usd_jpy() -> float | None:
+    """為替レートを取得（キャッシュ済みなら通信しない）"""
+    return fx_provider().get()
+
+
+def build_record(input_paths: list[Path], blogpost_result: dict, llm_stats: TokenStats, dy_rate: float | None) -> dict:
+    """CSV・スプレッドシート出力用の1行を作成
+
+    要約キャッシュから復元した場合、今回の実行ではAPIを呼んでいないためトークン数・料金は0として記録する。
+    料金表にないモデルの料金（NaN）は空欄（None）にする（スプレッドシートのAPIはNaNを受け付けない）。
+    """
+    content = blogpost_result.get("content", "")
+    llm_config = app_context().llm_config
+    if llm_stats.from_cache:
+        letters = (llm_stats.input_letter_count, llm_stats.output_letter_count)
+        llm_stats = TokenStats(0, 0, 0, *letters, llm_stats.model_name, requests=0)
+    fees = {
+        name: None if math.isnan(fee) else fee
+        for name, fee in (
+            ("input", llm_stats.input_fee),
+            ("thoughts", llm_stats.thoughts_fee),
+            ("output", llm_stats.output_fee),
+            ("total", llm_stats.total_fee),
+        )
+    }
+    total_JPY = fees["total"] * dy_rate if fees["total"] is not None and dy_rate is not None else None
+
+    ai_names = jl.ai_names_from_paths(input_paths)
+    conversation_titles = " ".join(jl.get_conversation_titles(input_paths, ai_names))
+
+    return {
+        "timestamp": datetime.now().isoformat(),
+        "conversation_title": conversation_titles,
+        "AI_name": " ".join(ai_names),
+        "entry_URL": blogpost_result.get("link_alternate", ""),
+        "is_draft": blogpost_result.get("is_draft"),
+        "entry_title": blogpost_result.get("title", ""),
+        "entry_content": content[:30],
+        "categories": ",".join(blogpost_result.get("categories", [])),
+        "prompt": llm_config.prompt[:20],
+        "model": llm_stats.model_name,  # 予備モデルに切り替えた場合は実際に要約したモデル
+        "temperature": llm_config.temperature,
+        "input_letter_count": llm_stats.input_letter_count,
+        "output_letter_count": llm_stats.output_letter_count,
+        "input_tokens": llm_stats.input_tokens,
+        "input_fee": fees["input"],
+        "cache_hit_tokens": llm_stats.cache_hit_tokens,
+        "thoughts_tokens": llm_stats.thoughts_tokens,
+        "thoughts_fee": fees["thoughts"],
+        "output_tokens": llm_stats.output_tokens,
+        "output_fee": fees["output"],
+        "api_requests": llm_stats.requests,
+        "total_fee (USD)": fees["total"],
+        "total_fee (JPY)": total_JPY,
+        "api_key": "..." + llm_config.api_key[-5:],
+    }
+
+
+def save_outputs(csv_data: dict, title: str, content: str) -> None:
+    """CSVへの追記と投稿本文のテキスト保存"""
+    summary_file_name = datetime.now().strftime("%y%m%d") + "-" + title
+
+    csv_dir = Path(app_context().config["paths"]["output_dir"].strip())
+    csv_dir.mkdir(exist_ok=True)
+    csv_path = csv_dir / "record.csv"
+    summary_dir = csv_dir / "summary"
+    summary_dir.mkdir(exist_ok=True)
+    summary_path = summary_dir / (f"{summary_file_name.replace('/', ', ')}.txt")
+    # ファイル出力
+    append_csv(csv_path, csv_data)
+    summary_path.write_text(content, encoding="utf-8")
+
+
+@lru_cache(maxsize=1)
+def run_history() -> RunHistory:
+    """実行履歴（output_dir/history.sqlite3）。新規作成時は既存のrecord.csvを取り込む"""
+    output_dir = Path(app_context().config["paths"]["output_dir"].strip())
+    path = output_dir / "history.sqlite3"
+    is_new = not path.exists()
+    history = RunHistory(path)
+    if is_new and (output_dir / "record.csv").exists():
+        history.import_csv(output_dir / "record.csv")
+    return history
+
+
+def record_history(csv_data: dict, latency_seconds: float | None = None) -> None:
+    """実行履歴へ追加。失敗した場合は例外（再試行キュー用）"""
+    run_history().add(csv_data, latency_seconds)
+
+
+@lru_cache(maxsize=1)
+def job_queue():
+    """ジョブキュー（output_dir/jobs.sqlite3）"""
+    from .job_queue import JobQueue, JobSettings
+
+    config = app_context().config
+    path = Path(config["paths"]["output_dir"].strip()) / "jobs.sqlite3"
+    return JobQueue(path, JobSettings.model_validate(config.get("jobs") or {}))
+
+
+@lru_cache(maxsize=1)
+def publish_schedule():
+    """公開予定の投稿（output_dir/publish.sqlite3）"""
+    from .publish_scheduler import PublishSchedule, PublishSettings
+
+    config = app_context().config
+    path = Path(config["paths"]["output_dir"].strip()) / "publish.sqlite3"
+    return PublishSchedule(path, PublishSettings.model_validate(config.get("publish") or {}))
+
+
+def spreadsheet_name() -> str:
+    return app_context().config["google_sheets"].get("spreadsheet_name", "record").strip()
+
+
+def write_spreadsheet(csv_data: dict, flush: bool = True) -> None:
+    """Googleスプレッドシートへ出力。失敗した場合は例外（再試行キュー用）"""
+    to_spreadsheet(csv_data, spreadsheet_name(), flush)
+
+
+# 後処理の名前と関数（再試行キューには名前と引数だけを保存）
+SIDE_EFFECT_HANDLERS = {
+    "line": send_line,
+    "outputs": save_outputs,
+    "history": record_history,
+    "sheets": write_spreadsheet,
+}
+
+
+def side_effect_queue() -> tuple[RetryQueue, SideEffectSettings]:
+    """投稿後の処理の再試行キュー（output_dir/.state/side_effects.jsonl）と設定"""
+    config = app_context().config
+    settings = SideEffectSettings.model_validate(config.get("side_effects") or {})
+    path = Path(config["paths"]["output_dir"].strip()) / ".state" / "side_effects.jsonl"
+    return RetryQueue(path, settings.max_attempts), settings
+
+
+def run_side_effects(tasks: list[SideEffectTask]) -> list[SideEffectTask]:
+    """投稿後の処理を並行して実行。前回失敗した処理も合わせて再試行し、失敗分は次回へ"""
+    queue, settings = side_effect_queue()
+    pending = queue.load()
+    if pending:
+        logger.warning(f"前回失敗した{len(pending)}件の処理を再試行します: {', '.join(t.name for t in pending)}")
+
+    failed = run_tasks(pending + tasks, SIDE_EFFECT_HANDLERS, settings)
+    queue.save(failed)
+    return failed
+
+
+def defer_side_effects(failed: list[SideEffectTask]) -> None:
+    """失敗した処理を再試行キューに追加（次回のmainの実行時に再試行）"""
+    if not failed:
+        return
+    queue, _ = side_effect_queue()
+    queue.save(queue.load() + failed)
+
+
+def record_to_spreadsheet(csv_data: dict, flush: bool = True) -> None:
+    """Googleスプレッドシートへ出力。失敗しても処理は継続"""
+    try:
+        write_spreadsheet(csv_data, flush)
+    except Exception as e:
+        logger.warning("Googleスプレッドシートへの書き込みは行われませんでした")
+        logger.debug(f"詳細: {e}")
+
+
+def flush_spreadsheet() -> list[dict]:
+    """送信待ちの行をまとめてスプレッドシートへ送信。失敗した場合は送信待ちから外した行を返す（再試行キュー用）"""
+    if not spreadsheet_name():
+        return []
+    sink = sheets_sink(spreadsheet_name())
+    try:
+        sink.flush()
+    except Exception as e:
+        logger.warning("Googleスプレッドシートへの書き込みは行われませんでした")
+        logger.debug(f"詳細: {e}")
+        return sink.take_pending()
+    return []
+
+
+def parse_args(argv: list[str]) -> argparse.Namespace:
+    """コマンドライン引数を解析。先頭が"batch"ならバッチモード、"watch"なら常駐モード、"jobs"ならジョブキュー、
+    "entries"なら投稿済みエントリー一覧、"publish"なら公開予定の投稿、"history"・"stats"なら実行履歴
+    """
+    if argv and argv[0] == "batch":
+        parser = argparse.ArgumentParser(prog="cha2hatena batch", description="複数の会話セットをまとめて要約・投稿")
+        parser.add_argument("manifest", type=Path, help="ジョブ一覧を記述したYAMLファイル")
+        parser.add_argument("--no-cache", action="store_true", help="要約キャッシュを使わずに必ずAPIへリクエスト")
+        parser.add_argument("--incremental", action="store_true", help="前回要約したメッセージより後だけを取り込む")
+        args = parser.parse_args(argv[1:])
+        args.command = "batch"
+    elif argv and argv[0] == "watch":
+        parser = argparse.ArgumentParser(
+            prog="cha2hatena watch", description="フォルダを監視し、更新された会話ログを常駐して処理"
+        )
+        parser.add_argument(
+            "directory", nargs="?", type=Path, help="監視するフォルダ（省略時はconfig.yamlのpaths.input_dir）"
+        )
+        parser.add_argument("--no-cache", action="store_true", help="要約キャッシュを使わずに必ずAPIへリクエスト")
+        parser.add_argument("--polling", action="store_true", help="変更通知を使わずポーリングで監視")
+        args = parser.parse_args(argv[1:])
+        args.command = "watch"
+    elif argv and argv[0] == "history":
+        parser = argparse.ArgumentParser(prog="cha2hatena history", description="実行履歴（history.sqlite3）の管理")
+        actions = parser.add_subparsers(dest="action", required=True)
+        import_parser = actions.add_parser("import", help="record.csvを実行履歴へ取り込む（取り込み済みの行は無視）")
+        import_parser.add_argument(
+            "csv", nargs="?", type=Path, help="取り込むCSV（省略時はconfig.yamlのpaths.output_dirのrecord.csv）"
+        )
+        actions.add_parser("compact", help="実行履歴のファイルを最適化")
+        args = parser.parse_args(argv[1:])
+        args.command = "history"
+    elif argv and argv[0] == "jobs":
+        parser = argparse.ArgumentParser(prog="cha2hatena jobs", description="ジョブキュー（jobs.sqlite3）の操作")
+        actions = parser.add_subparsers(dest="action", required=True)
+        add_parser = actions.add_parser("add", help="ジョブを追加（実行はjobs workで行う）")
+        add_parser.add_argument("paths", nargs="+", type=Path, help="1回の投稿にまとめる会話ログ（.json / .txt）")
+        add_parser.add_argument("--no-cache", action="store_true", help="要約キャッシュを使わずに必ずAPIへリクエスト")
+        add_parser.add_argument("--incremental", action="store_true", help="前回要約したメッセージより後だけを取り込む")
+        list_parser = actions.add_parser("list", help="未完了のジョブを一覧表示")
+        list_parser.add_argument("--all", action="store_true", help="完了したジョブも表示")
+        work_parser = actions.add_parser("work", help="待機中・中断したジョブを古い順に処理")
+        work_parser.add_argument("--follow", action="store_true", help="キューが空になっても新しいジョブを待ち続ける")
+        work_parser.add_argument("--retry-failed", action="store_true", help="上限回数まで失敗したジョブも再実行")
+        args = parser.parse_args(argv[1:])
+        args.command = "jobs"
+    elif argv and argv[0] == "entries":
+        parser = argparse.ArgumentParser(
+            prog="cha2hatena entries", description="はてなブログの投稿済みエントリー一覧を取得（取得済みは再検証のみ）"
+        )
+        actions = parser.add_subparsers(dest="action", required=True)
+        sync_parser = actions.add_parser("sync", help="投稿済みエントリーの索引へ反映（同じ内容の記事の再投稿を防ぐ）")
+        categories_parser = actions.add_parser("categories", help="カテゴリーごとの記事数を表示")
+        for action_parser in (sync_parser, categories_parser):
+            action_parser.add_argument("--max-pages", type=int, help="取得するページ数の上限（新しい順）")
+        args = parser.parse_args(argv[1:])
+        args.command = "entries"
+    elif argv and argv[0] == "publish":
+        parser = argparse.ArgumentParser(
+            prog="cha2hatena publish", description="公開時刻を割り当てた投稿を、送信数を制限してはてなブログへ送信"
+        )
+        actions = parser.add_subparsers(dest="action", required=True)
+        add_parser = actions.add_parser("add", help="投稿（title・content・categoriesのJSON、またはその配列）を追加")
+        add_parser.add_argument("paths", nargs="+", type=Path, help="投稿のJSONファイル")
+        add_parser.add_argument(
+            "--start", type=datetime.fromisoformat, help="最初の公開時刻（ISO 8601。timezoneなしの場合JST）"
+        )
+        list_parser = actions.add_parser("list", help="未完了の投稿を公開時刻順に表示")
+        list_parser.add_argument("--all", action="store_true", help="投稿済みも表示")
+        run_parser = actions.add_parser("run", help="公開時刻を過ぎた投稿を送信")
+        run_parser.add_argument("--follow", action="store_true", help="待機中の投稿がなくなるまで公開時刻を待って送信")
+        args = parser.parse_args(argv[1:])
+        args.command = "publish"
+    elif argv and argv[0] == "stats":
+        parser = argparse.ArgumentParser(prog="cha2hatena stats", description="実行履歴からトークン数・料金を集計")
+        parser.add_argument("--since", type=date.fromisoformat, help="集計の開始日（YYYY-MM-DD）")
+        parser.add_argument("--until", type=date.fromisoformat, help="集計の終了日（YYYY-MM-DD、当日を含む）")
+        parser.add_argument("--model", help="指定したモデルのみを集計")
+        parser.add_argument(
+            "--by", action="append", choices=["day", "model", "ai"], help="集計の単位（複数指定可。省略時はすべて）"
+        )
+        parser.add_argument("--budget", type=float, help="月の予算（USD）。config.yamlの設定より優先")
+        args = parser.parse_args(argv[1:])
+        args.command = "stats"
+    else:
+        parser = argparse.ArgumentParser(prog="cha2hatena", description="AIとの会話ログを要約してはてなブログへ投稿")
+        parser.add_argument("paths", nargs="*", type=Path, help="会話ログ（.json / .txt）")
+        parser.add_argument("--no-cache", action="store_true", help="要約キャッシュを使わずに必ずAPIへリクエスト")
+        parser.add_argument("--incremental", action="store_true", help="前回要約したメッセージより後だけを取り込む")
+        args = parser.parse_args(argv)
+        args.command = "run"
+    return args
+
+
+def run_history_command(args: argparse.Namespace) -> int:
+    """cha2hatena historyのエントリーポイント"""
+    history = run_history()
+    if args.action == "import":
+        csv_path = args.csv or Path(app_context().config["paths"]["output_dir"].strip()) / "record.csv"
+        history.import_csv(csv_path)
+    elif args.action == "compact":
+        history.compact()
+    return 0
+
+
+def run_jobs_command(args: argparse.Namespace) -> int:
+    """cha2hatena jobsのエントリーポイント"""
+    from .job_queue import run_worker
+
+    queue = job_queue()
+    if args.action == "add":
+        job = queue.add(
+            args.paths, incremental=args.incremental, use_cache=not args.no_cache, is_draft=app_context().debug
+        )
+        logger.warning(f"ジョブ#{job.id}（{job.status}・{job.stage}）: {', '.join(map(str, args.paths))}")
+    elif args.action == "list":
+        statuses = ("queued", "running", "failed", "done") if args.all else ("queued", "running", "failed")
+        for job in queue.list_jobs(statuses):
+            names = ", ".join(Path(p).name for p in job.paths)
+            print(f"#{job.id}\t{job.status}\t{job.stage}\t{job.attempts}回\t{names}\t{job.error or ''}")
+    elif args.action == "work":
+        return run_worker(queue, follow=args.follow, retry_failed=args.retry_failed)
+    return 0
+
+
+def collection_client():
+    """はてなブログのコレクション（投稿済みエントリー一覧）のクライアント"""
+    from . import http_pool
+    from .hatena_collection import CollectionClient, PageCache
+
+    context = app_context()
+    keys = dict(context.hatena_secret_keys)
+    collection_url = keys.pop("hatena_entry_url")
+    cache = PageCache(Path(context.config["paths"]["output_dir"].strip()) / ".cache" / "hatena_collection.json")
+    return CollectionClient(collection_url, cache, lambda: http_pool.get_oauth_session(**keys))
+
+
+def run_entries_command(args: argparse.Namespace) -> int:
+    """cha2hatena entriesのエントリーポイント"""
+    from .hatena_collection import category_counts, sync_index
+
+    entries = list(collection_client().iter_entries(args.max_pages))
+    if args.action == "sync":
+        count = sync_index(entries, entry_index())
+        logger.warning(f"{count}件のエントリーを投稿済みエントリーの索引へ反映しました。")
+    elif args.action == "categories":
+        for category, count in category_counts(entries).most_common():
+            print(f"{count}\t{category}")
+    return 0
+
+
+def run_publish_command(args: argparse.Namespace) -> int:
+    """cha2hatena publishのエントリーポイント"""
+    import json
+
+    from .llm.conversational_ai import BlogPost
+    from .publish_scheduler import run_publisher
+
+    schedule = publish_schedule()
+    if args.action == "add":
+        posts = []
+        for path in args.paths:
+            data = json.loads(path.read_text(encoding="utf-8"))
+            posts.extend(BlogPost.model_validate(post) for post in (data if isinstance(data, list) else [data]))
+        for item in schedule.add(posts, is_draft=app_context().debug, start=args.start):
+            logger.warning(f"#{item.id}「{item.post.title}」: {item.publish_at:%Y-%m-%d %H:%M}に公開")
+    elif args.action == "list":
+        statuses = ("queued", "running", "failed", "done") if args.all else ("queued", "running", "failed")
+        for item in schedule.list_posts(statuses):
+            print(f"#{item.id}\t{item.publish_at:%Y-%m-%d %H:%M}\t{item.status}\t{item.post.title}\t{item.error or ''}")
+    elif args.action == "run":
+        return run_publisher(schedule, post_to_hatena, follow=args.follow)
+    return 0
+
+
+def run_stats_command(args: argparse.Namespace) -> int:
+    """cha2hatena statsのエントリーポイント"""
+    from .stats import StatsSettings, build_report
+
+    settings = StatsSettings.model_validate(app_context().config.get("stats") or {})
+    if args.budget is not None:
+        settings.monthly_budget_usd = args.budget
+    by = args.by or ["day", "model", "ai"]
+    print(build_report(run_history(), settings, by, args.since, args.until, args.model))
+    return 0
 
 
 def main():
+    started = time.perf_counter()
     try:
+        # --helpや引数の誤りでは設定を読み込まずに終了
+        args = parse_args(sys.argv[1:])
+        context = app_context()
+
         logger.debug("================================================")
-        logger.debug(f"アプリケーションが起動しました。デバッグモード：{DEBUG}")
+        logger.debug(f"アプリケーションが起動しました。デバッグモード：{context.debug}")
 
-        if len(sys.argv) > 1:
-            INPUT_PATHS_RAW = sys.argv[1:]
-            logger.warning(f"処理を開始します: {', '.join(INPUT_PATHS_RAW)}")
-        else:
-            logger.error("エラー: 引数を入力する必要があります。実行を終了します")
-            sys.exit(1)
+        if args.command == "history":
+            return run_history_command(args)
+        if args.command == "stats":
+            return run_stats_command(args)
+        if args.command == "entries":
+            return run_entries_command(args)
+        if args.command == "publish":
+            return run_publish_command(args)
 
-        input_paths = list(map(Path, INPUT_PATHS_RAW))
+        if args.command == "jobs" and args.action != "work":
+            return run_jobs_command(args)
 
-        # JSONファイルから会話履歴を読み込み、テキストに整形
-        LLM_CONFIG.conversation = jl.json_loader(input_paths)
+        # 為替レートは要約・投稿と並行して取得しておく
+        fx_provider().prefetch()
 
-        # AIオブジェクト作成
-        ai_instance: ConversationalAi = create_ai_client(LLM_CONFIG)
+        if args.command == "batch":
+            from .batch import run_batch
 
-        # AIで要約取得
-        llm_outputs, llm_stats = ai_instance.get_summary()
+            return run_batch(args.manifest, use_cache=not args.no_cache, incremental=args.incremental)
+        if args.command == "watch":
+            from .watcher import run_watch
 
-        # はてなブログへ投稿 投稿結果を辞書型で返却
-        blogpost_result = hatenablog_poster.blog_post(
-            **llm_outputs,
-            preset_categories=PRESET_CATEGORIES,
-            hatena_secret_keys=HATENA_SECRET_KEYS,
-            author=None,  # str | None   Noneの場合自分のはてなID
-            updated=None,  # datetime | None  公開時刻設定。Noneの場合5分後に公開
-            is_draft=DEBUG,  # デバッグ時は下書き
-        )
+            return run_watch(args.directory, use_cache=not args.no_cache, force_polling=args.polling)
+        if args.command == "jobs":
+            return run_jobs_command(args)
 
-        url = blogpost_result.get("link_alternate", "")
-        url_edit = blogpost_result.get("link_edit_user", "")
-        title = blogpost_result.get("title", "")
-        content = blogpost_result.get("content", "")
-        categories = blogpost_result.get("categories", [])
-
-        logger.warning("はてなブログへの投稿に成功しました。")
-        logger.warning(f"URL: {url_edit}")
-        print("-" * 50)
-        print(f"投稿タイトル：{title}")
-        print(f"\n{'-' * 20}投稿本文{'-' * 20}")
-        print(f"{content[:100]}")
-        print("-" * 50)
-
-        # LINE通知
-        if blogpost_result["status_code"] == 201:
-            line_text = "投稿完了です。今日も長い時間お疲れさまでした！\n"
-            line_text = (
-                line_text
-                + f"タイトル：{title}\n確認: {url}\n編集: {url_edit}\n下書きモード: {blogpost_result.get('is_draft')}"
-            )
+        if args.paths:
+            logger.warning(f"処理を開始します: {', '.join(map(str, args.paths))}")
         else:
-            line_text = "要約の保存完了。ブログ投稿は行われませんでした。今日も長い時間お疲れ様でした。\n"
-            line_text = line_text + f"タイトル：{title}\n本文: \n{content[:200]} ..."
+            logger.error("エラー: 引数を入力する必要があります。実行を終了します")
+            sys.exit(1)
 
-        try:
-            line_message.line_messenger(line_text, LINE_ACCESS_TOKEN)
-        except Exception as e:
-            logger.error("エラー：LINE通知は行われませんでした。")
-            logger.info(f"詳細: {e}")
+        # 1回の実行を1件のジョブとして記録し、中断した場合は同じ引数での再実行時に続きから再開
+        from .job_queue import JobBusyError, run_claimed
 
-        # 為替レートを取得
-        ticker = "USDJPY=X"
-        try:
-            dy_rate = yf.Ticker(ticker).history(period="1d").Close.iloc[0]
-            total_JPY = llm_stats.total_fee * dy_rate
-        except Exception as e:
-            logger.error("ヤフーファイナンスから為替レートを取得できませんでした。詳細はapp.logを確認してください")
-            logger.info(f"詳細: {e}", exc_info=True)
-            total_JPY = None
-
-        ai_names = jl.ai_names_from_paths(input_paths)
-        conversation_titles = " ".join(jl.get_conversation_titles(input_paths, ai_names))
-
-        csv_data = {
-            "timestamp": datetime.now().isoformat(),
-            "conversation_title": conversation_titles,
-            "AI_name": " ".join(ai_names),
-            "entry_URL": url,
-            "is_draft": blogpost_result.get("is_draft"),
-            "entry_title": title,
-            "entry_content": content[:30],
-            "categories": ",".join(categories),
-            "prompt": LLM_CONFIG.prompt[:20],
-            "model": LLM_CONFIG.model,
-            "temperature": LLM_CONFIG.temperature,
-            "input_letter_count": llm_stats.input_letter_count,
-            "output_letter_count": llm_stats.output_letter_count,
-            "input_tokens": llm_stats.input_tokens,
-            "input_fee": llm_stats.input_fee,
-            "thoughts_tokens": llm_stats.thoughts_tokens,
-            "thoughts_fee": llm_stats.thoughts_fee,
-            "output_tokens": llm_stats.output_tokens,
-            "output_fee": llm_stats.output_fee,
-            "total_fee (USD)": llm_stats.total_fee,
-            "total_fee (JPY)": total_JPY,
-            "api_key": "..." + LLM_CONFIG.api_key[-5:],
-        }
-
-        summary_file_name = datetime.now().strftime("%y%m%d") + "-" + title
-
-        csv_dir = Path(config["paths"]["output_dir"].strip())
-        csv_dir.mkdir(exist_ok=True)
-        csv_path = csv_dir / "record.csv"
-        summary_dir = csv_dir / "summary"
-        summary_dir.mkdir(exist_ok=True)
-        summary_path = summary_dir / (f"{summary_file_name.replace('/', ', ')}.txt")
-        # ファイル出力
-        append_csv(csv_path, csv_data)
-        summary_path.write_text(content, encoding="utf-8")
-
-        # Googleスプレッドシートへ出力
-        SPREADSHEET_NAME = config["google_sheets"].get("spreadsheet_name", "record").strip()
+        queue = job_queue()
+        job = queue.add(args.paths, incremental=args.incremental, use_cache=not args.no_cache, is_draft=context.debug)
         try:
-            to_spreadsheet(csv_data, SPREADSHEET_NAME)
-        except Exception as e:
-            logger.warning("Googleスプレッドシートへの書き込みは行われませんでした")
-            logger.debug(f"詳細: {e}")
+            job = queue.claim(job.id, retry_failed=True)
+        except JobBusyError as e:
+            logger.error(f"{e} 実行を終了します。")
+            return 1
+        if job is not None and not run_claimed(queue, job, started):
+            logger.error("アプリケーションの実行を中止します。")
+            sys.exit(1)
         logger.info("処理が正常に終了しました。")
 
         return 0
@@ -0,0 +1,333 @@
+import asyncio
+import json
+import logging
+import os
+import socket
+import sqlite3
+import threading
+import time
+from contextlib import closing, contextmanager
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import Callable
+
+from pydantic import BaseModel, Field
+
+from . import retry
+from .llm.conversational_ai import BlogPost
+
+logger = logging.getLogger(__name__)
+
+SCHEMA_VERSION = 2
+JST = timezone(timedelta(hours=9))
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS posts (
+    id INTEGER PRIMARY KEY,
+    publish_at REAL NOT NULL,
+    status TEXT NOT NULL,
+    post TEXT NOT NULL,
+    is_draft INTEGER NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    owner TEXT,
+    lease_until REAL,
+    result TEXT,
+    error TEXT,
+    created_at TEXT NOT NULL,
+    updated_at TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_posts_status_publish_at ON posts (status, publish_at);
+"""
+
+
+class PublishSettings(BaseModel):
+    rate_per_minute: float = Field(default=6, gt=0, description="はてなブログAPIへ送る投稿数の上限（1分あたり）")
+    burst: int = Field(default=2, ge=1, description="続けて送れる投稿数（トークンバケットの容量）")
+    concurrency: int = Field(default=2, ge=1, description="同時に送信する投稿数")
+    first_delay_minutes: float = Field(default=5, ge=0, description="最初の公開時刻（追加した時刻から何分後か）")
+    spacing_minutes: float = Field(default=60, ge=0, description="公開時刻の間隔（分）")
+    max_attempts: int = Field(default=3, ge=1, description="この回数失敗した投稿は再送しない")
+    lease_seconds: float = Field(default=60, gt=0, description="異常終了したプロセスの投稿を再送できるまでの秒数")
+    poll_seconds: float = Field(default=30, gt=0, description="publish run --followで次の公開時刻を確認する間隔の上限")
+
+
+class ScheduledPost(BaseModel):
+    id: int
+    publish_at: datetime
+    status: str = Field(description="queued・running・done・failed")
+    post: BlogPost
+    is_draft: bool = False
+    attempts: int = 0
+    result: dict | None = None
+    error: str | None = None
+
+
+def _now() -> str:
+    return datetime.now().isoformat(timespec="seconds")
+
+
+class PublishSchedule:
+    """公開予定の投稿（SQLite、WAL）。再起動しても予定は失われない
+
+    取り出した投稿には期限（lease）を付け、送信中は定期的に延長する（JobQueueと同じ）。
+    プロセスが異常終了した場合は期限切れ後に再送し、実行中の他のプロセスの投稿は取り出さない。
+    """
+
+    def __init__(self, path: Path, settings: PublishSettings | None = None):
+        self.path = path
+        self.settings = settings or PublishSettings()
+        self.owner = f"{socket.gethostname()}:{os.getpid()}"
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with closing(self._connect()) as conn:
+            version = conn.execute("PRAGMA user_version").fetchone()[0]
+            if version > SCHEMA_VERSION:
+                raise RuntimeError(f"新しいバージョンの公開予定です（{version}）: {path}")
+            conn.executescript(_SCHEMA)
+            if version == 1:  # 期限の列を追加
+                conn.execute("ALTER TABLE posts ADD COLUMN owner TEXT")
+                conn.execute("ALTER TABLE posts ADD COLUMN lease_until REAL")
+            conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)  # トランザクションは明示的に開始
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode=WAL")
+        return conn
+
+    @contextmanager
+    def _transaction(self):
+        """書き込みロックを先に取るトランザクション（複数のプロセスが同じ投稿を取り出さないように）"""
+        with closing(self._connect()) as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield conn
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            conn.execute("COMMIT")
+
+    @staticmethod
+    def _to_post(row: sqlite3.Row) -> ScheduledPost:
+        return ScheduledPost(
+            id=row["id"],
+            publish_at=datetime.fromtimestamp(row["publish_at"], JST),
+            status=row["status"],
+            post=BlogPost.model_validate_json(row["post"]),
+            is_draft=bool(row["is_draft"]),
+            attempts=row["attempts"],
+            result=json.loads(row["result"]) if row["result"] else None,
+            error=row["error"],
+        )
+
+    def add(self, posts: list[BlogPost], is_draft: bool = False, start: datetime | None = None) -> list[ScheduledPost]:
+        """投稿を追加し、公開時刻を割り当てる（start・最後の予定の次のうち遅い方から、spacing_minutes間隔）"""
+        spacing = self.settings.spacing_minutes * 60
+        if start is None:
+            start = datetime.now(JST) + timedelta(minutes=self.settings.first_delay_minutes)
+        elif start.tzinfo is None:
+            start = start.replace(tzinfo=JST)  # timezoneなしの場合JST（xml_unparserと同じ）
+
+        with self._transaction() as conn:
+            last = conn.execute("SELECT MAX(publish_at) FROM posts WHERE status IN ('queued', 'running')").fetchone()[0]
+            publish_at = start.timestamp() if last is None else max(start.timestamp(), last + spacing)
+            ids = []
+            for post in posts:
+                cursor = conn.execute(
+                    "INSERT INTO posts (publish_at, status, post, is_draft, created_at, updated_at) "
+                    "VALUES (?, 'queued', ?, ?, ?, ?)",
+                    (publish_at, post.model_dump_json(), int(is_draft), _now(), _now()),
+                )
+                ids.append(cursor.lastrowid)
+                publish_at += spacing
+        return [self.get(post_id) for post_id in ids]
+
+    def get(self, post_id: int) -> ScheduledPost | None:
+        with closing(self._connect()) as conn:
+            row = conn.execute("SELECT * FROM posts WHERE id = ?", (post_id,)).fetchone()
+        return None if row is None else self._to_post(row)
+
+    def list_posts(self, statuses: tuple[str, ...] = ("queued", "running", "failed")) -> list[ScheduledPost]:
+        placeholders = ", ".join("?" * len(statuses))
+        sql = f"SELECT * FROM posts WHERE status IN ({placeholders}) ORDER BY publish_at, id"
+        with closing(self._connect()) as conn:
+            return [self._to_post(row) for row in conn.execute(sql, statuses)]
+
+    def recover(self, now: float | None = None) -> int:
+        """送信中に異常終了した投稿（期限切れ）を待機中に戻す
+
+        投稿済みだった場合は投稿済みエントリーの索引で再投稿を防ぐ。期限内の投稿は他のプロセスが送信中のため戻さない。
+        """
+        now = time.time() if now is None else now
+        with self._transaction() as conn:
+            return conn.execute(
+                "UPDATE posts SET status = 'queued', owner = NULL, lease_until = NULL "
+                "WHERE status = 'running' AND lease_until < ?",
+                (now,),
+            ).rowcount
+
+    def claim_due(self, now: float | None = None) -> list[ScheduledPost]:
+        """公開時刻を過ぎた投稿を公開時刻順に取り出して実行中にする（期限切れの送信中の投稿も含む）"""
+        now = time.time() if now is None else now
+        with self._transaction() as conn:
+            rows = conn.execute(
+                "SELECT * FROM posts WHERE publish_at <= ? "
+                "AND (status = 'queued' OR (status = 'running' AND lease_until < ?)) ORDER BY publish_at, id",
+                (now, now),
+            ).fetchall()
+            conn.executemany(
+                "UPDATE posts SET status = 'running', attempts = attempts + 1, owner = ?, lease_until = ?, "
+                "updated_at = ? WHERE id = ?",
+                [(self.owner, now + self.settings.lease_seconds, _now(), row["id"]) for row in rows],
+            )
+        return [self.get(row["id"]) for row in rows]
+
+    def renew_lease(self) -> None:
+        """このプロセスが送信中の投稿の期限を延長"""
+        with self._transaction() as conn:
+            conn.execute(
+                "UPDATE posts SET lease_until = ? WHERE owner = ? AND status = 'running'",
+                (time.time() + self.settings.lease_seconds, self.owner),
+            )
+
+    @contextmanager
+    def lease(self):
+        """このプロセスが送信中の投稿の期限を延長し続ける（異常終了すると延長が止まり、期限切れ後に再送できる）"""
+        stop = threading.Event()
+
+        def renew():
+            while not stop.wait(self.settings.lease_seconds / 3):
+                # 延長は期限の1/3ごとのため、1回失敗（database is lockedなど）しても次の延長が期限内に間に合う
+                try:
+                    self.renew_lease()
+                except Exception as e:
+                    logger.warning(f"投稿の期限を延長できませんでした。次の延長で再試行します: {e!r}")
+
+        thread = threading.Thread(target=renew, name="publish-lease", daemon=True)
+        thread.start()
+        try:
+            yield
+        finally:
+            stop.set()
+            thread.join()
+
+    def next_publish_at(self) -> float | None:
+        with closing(self._connect()) as conn:
+            return conn.execute("SELECT MIN(publish_at) FROM posts WHERE status = 'queued'").fetchone()[0]
+
+    def mark_done(self, post_id: int, result: dict) -> None:
+        with self._transaction() as conn:
+            conn.execute(
+                "UPDATE posts SET status = 'done', lease_until = NULL, result = ?, error = NULL, updated_at = ? "
+                "WHERE id = ? AND owner = ?",
+                (json.dumps(result, ensure_ascii=False, default=str), _now(), post_id, self.owner),
+            )
+
+    def mark_failed(self, item: ScheduledPost, error: str) -> str:
+        """失敗を記録し、上限回数に達していなければ待機中に戻す。新しい状態を返す"""
+        status = "failed" if item.attempts >= self.settings.max_attempts else "queued"
+        with self._transaction() as conn:
+            conn.execute(
+                "UPDATE posts SET status = ?, lease_until = NULL, error = ?, updated_at = ? WHERE id = ? AND owner = ?",
+                (status, error, _now(), item.id, self.owner),
+            )
+        return status
+
+
+class TokenBucket:
+    """はてなブログAPIへの送信数の制限。rate（件/秒）で補充し、capacity件まで続けて送れる"""
+
+    def __init__(self, rate: float, capacity: int, clock=time.monotonic, sleep=asyncio.sleep):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = float(capacity)
+        self.clock = clock
+        self.sleep = sleep
+        self._updated = clock()
+        self._lock = asyncio.Lock()
+
+    def _refill(self) -> None:
+        now = self.clock()
+        self.tokens = min(self.capacity, self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    async def acquire(self) -> None:
+        """1件分の枠を取得（枠がなければ補充されるまで待つ。待っている間も他の処理は進む）"""
+        async with self._lock:  # 待っている順に取得
+            self._refill()
+            while self.tokens < 1:
+                await self.sleep((1 - self.tokens) / self.rate)
+                self._refill()
+            self.tokens -= 1
+
+
+class Publisher:
+    """公開時刻を過ぎた投稿を、送信数の制限・同時送信数の範囲内で並行して送信"""
+
+    def __init__(
+        self,
+        schedule: PublishSchedule,
+        post_func: Callable[..., dict],  # post_to_hatenaと同じ引数
+        bucket: TokenBucket | None = None,
+    ):
+        settings = schedule.settings
+        self.schedule = schedule
+        self.post_func = post_func
+        self.bucket = bucket or TokenBucket(settings.rate_per_minute / 60, settings.burst)
+        self.semaphore = asyncio.Semaphore(settings.concurrency)
+
+    async def publish(self, item: ScheduledPost) -> bool:
+        async def attempt():
+            async with self.semaphore:
+                await self.bucket.acquire()
+                # 公開時刻を投稿の日時（updated）にする
+                post = item.post.model_dump()
+                return await asyncio.to_thread(self.post_func, post, item.is_draft, updated=item.publish_at)
+
+        try:
+            # 429などで待つ間は同時送信の枠を空ける
+            result = await retry.policy().call_async(attempt, name="はてなブログ")
+            if result.get("status_code") not in (200, 201):
+                raise RuntimeError(f"投稿できませんでした（{result.get('status_code')}）")
+        # 他の投稿を止めないよう捕捉
+        except (Exception, SystemExit) as e:
+            status = self.schedule.mark_failed(item, repr(e))
+            logger.error(f"#{item.id}「{item.post.title}」の投稿に失敗しました（{item.attempts}回目）: {e!r}")
+            if status == "queued":
+                logger.warning(f"#{item.id}は次回の実行時に再送します。")
+            return False
+        self.schedule.mark_done(item.id, result)
+        logger.warning(f"#{item.id}「{item.post.title}」を投稿しました: {result.get('link_alternate', '')}")
+        return True
+
+    async def run_due(self) -> tuple[int, int]:
+        """公開時刻を過ぎた投稿をすべて送信し、(成功数, 失敗数)を返す"""
+        items = self.schedule.claim_due()
+        results = await asyncio.gather(*(self.publish(item) for item in items))
+        return sum(results), len(results) - sum(results)
+
+    async def run(self, follow: bool = False) -> tuple[int, int]:
+        """follow=Trueなら、待機中の投稿がなくなるまで公開時刻を待って送信し続ける"""
+        succeeded = failed = 0
+        while True:
+            ok, ng = await self.run_due()
+            succeeded, failed = succeeded + ok, failed + ng
+            next_at = self.schedule.next_publish_at()
+            if not follow or next_at is None:
+                return succeeded, failed
+            wait = min(max(next_at - time.time(), 0), self.schedule.settings.poll_seconds)
+            if wait > 0:
+                await asyncio.sleep(wait)
+
+
+def run_publisher(schedule: PublishSchedule, post_func: Callable, follow: bool = False) -> int:
+    """publish runのエントリーポイント。すべて成功で0を返す"""
+    recovered = schedule.recover()
+    if recovered:
+        logger.warning(f"前回の実行中に終了した{recovered}件の投稿を再送します。")
+    with schedule.lease():
+        succeeded, failed = asyncio.run(Publisher(schedule, post_func).run(follow))
+    next_at = schedule.next_publish_at()
+    if next_at is not None:
+        logger.warning(f"次の公開予定: {datetime.fromtimestamp(next_at, JST):%Y-%m-%d %H:%M}")
+    logger.warning(f"公開予定の投稿を送信しました: 成功{succeeded}件 / 失敗{failed}件")
+    return 1 if failed else 0
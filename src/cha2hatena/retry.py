@@ -0,0 +1,226 @@
+import asyncio
+import logging
+import random
+import threading
+import time
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from typing import Awaitable, Callable, TypeVar
+
+from pydantic import BaseModel, Field
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+# 再送すれば成功し得るステータスコード
+RETRY_STATUS = frozenset({408, 425, 429, 500, 502, 503, 504})
+# 処理されずに拒否されたことが確実なステータスコード（POSTなど再送で二重登録になり得る呼び出し用）
+RETRY_STATUS_NOT_PROCESSED = frozenset({429})
+# ステータスコードのない一時的なエラー（requests・httpx・openaiの例外名。ライブラリを読み込まずに判定する）
+TRANSIENT_ERRORS = frozenset(
+    {
+        "ConnectionError",
+        "TimeoutError",
+        "Timeout",
+        "ConnectTimeout",
+        "ReadTimeout",
+        "ConnectError",
+        "RemoteProtocolError",
+        "APIConnectionError",
+        "APITimeoutError",
+    }
+)
+NOT_SENT_ERRORS = frozenset({"ConnectTimeout", "ConnectError", "NewConnectionError"})
+
+
+class RetrySettings(BaseModel):
+    max_attempts: int = Field(default=4, ge=1, description="最初の1回を含む最大試行回数")
+    base_delay: float = Field(default=1.0, ge=0, description="1回目のリトライの最大待ち時間（秒）。以降は2倍ずつ")
+    max_delay: float = Field(default=60.0, ge=0, description="待ち時間の上限（秒）。Retry-Afterにも適用")
+    budget_ratio: float = Field(default=0.2, ge=0, description="呼び出し1回ごとに増えるリトライ枠")
+    budget_initial: float = Field(default=10, ge=0, description="リトライ枠の初期値・上限")
+
+
+class RetryDeferred(BaseException):
+    """非同期の再試行（call_async）の内側で、待機を呼び出し元のイベントループに任せるための例外
+
+    except Exceptionで捕捉されないよう、asyncio.CancelledErrorと同じくBaseExceptionを継承。
+    """
+
+    def __init__(self, delay: float, error: BaseException):
+        super().__init__(f"{delay:.1f}秒後に再試行: {error!r}")
+        self.delay = delay
+        self.error = error
+
+
+class RetryableResult(Exception):
+    """レスポンスは返ったが、ステータスコードが再試行の対象だった場合"""
+
+    def __init__(self, response):
+        super().__init__(f"status {response.status_code}")
+        self.response = response
+
+
+def status_of(error: BaseException) -> int | None:
+    """例外からHTTPステータスコードを取得（openai・google-genai・requests・gspreadの例外に対応）"""
+    for value in (getattr(error, "status_code", None), getattr(error, "code", None)):
+        if isinstance(value, int):
+            return value
+    status = getattr(getattr(error, "response", None), "status_code", None)
+    return status if isinstance(status, int) else None
+
+
+def retry_after(error: BaseException) -> float | None:
+    """Retry-Afterヘッダーの秒数（秒数・HTTP日付の両方に対応）"""
+    headers = getattr(getattr(error, "response", None), "headers", None)
+    value = headers.get("Retry-After") if headers is not None else None
+    if not value:
+        return None
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+    try:
+        return max((parsedate_to_datetime(value) - datetime.now(timezone.utc)).total_seconds(), 0.0)
+    except (TypeError, ValueError):
+        return None
+
+
+def is_retryable(error: BaseException, idempotent: bool = True) -> bool:
+    """再試行すべき一時的なエラーか。idempotent=Falseでは処理されていないことが確実なものに限る"""
+    status = status_of(error)
+    names = {cls.__name__ for cls in type(error).__mro__}
+    if status is not None:
+        return status in (RETRY_STATUS if idempotent else RETRY_STATUS_NOT_PROCESSED)
+    return bool(names & (TRANSIENT_ERRORS if idempotent else NOT_SENT_ERRORS))
+
+
+class RetryBudget:
+    """リトライ枠（トークンバケット）。障害時にプロセス全体のリトライが呼び出し数の一定割合を超えないようにする"""
+
+    def __init__(self, ratio: float, initial: float):
+        self.ratio = ratio
+        self.capacity = initial
+        self.tokens = initial
+        self._lock = threading.Lock()
+
+    def deposit(self) -> None:
+        with self._lock:
+            self.tokens = min(self.capacity, self.tokens + self.ratio)
+
+    def withdraw(self) -> bool:
+        with self._lock:
+            if self.tokens < 1:
+                return False
+            self.tokens -= 1
+            return True
+
+
+# call_asyncの内側で実行中の場合、その試行回数（Noneなら同期的に待つ）
+_deferred_attempt: ContextVar[int | None] = ContextVar("deferred_attempt", default=None)
+
+
+class RetryPolicy:
+    """ステータスコードで判定し、ジッター付き指数バックオフで再試行する"""
+
+    def __init__(self, settings: RetrySettings | None = None, sleep=time.sleep, rng=random.random):
+        self.settings = settings or RetrySettings()
+        self.budget = RetryBudget(self.settings.budget_ratio, self.settings.budget_initial)
+        self.sleep = sleep
+        self.rng = rng
+
+    def delay(self, attempt: int, error: BaseException) -> float:
+        """attempt回目（0始まり）の失敗後の待ち時間。Retry-Afterがあれば優先、なければFull Jitter"""
+        server_delay = retry_after(error)
+        if server_delay is not None:
+            return min(server_delay, self.settings.max_delay)
+        return self.rng() * min(self.settings.max_delay, self.settings.base_delay * 2**attempt)
+
+    def _attempt(self, func: Callable[..., T], args, kwargs, check_status: bool, idempotent: bool) -> T:
+        result = func(*args, **kwargs)
+        if check_status and result.status_code in (RETRY_STATUS if idempotent else RETRY_STATUS_NOT_PROCESSED):
+            raise RetryableResult(result)
+        return result
+
+    def call(
+        self,
+        func: Callable[..., T],
+        *args,
+        name: str = "",
+        idempotent: bool = True,
+        check_status: bool = False,
+        **kwargs,
+    ) -> T:
+        """funcを呼び出し、一時的なエラーなら待って再試行。最後のエラーはそのまま送出
+
+        check_status=Trueでは戻り値（requestsのResponse）のステータスコードでも判定し、使い切ったら最後の戻り値を返す。
+        idempotent=Falseでは、処理されていないことが確実なエラー（429・接続前の失敗）のみ再試行する。
+        """
+        deferred = _deferred_attempt.get()
+        if not deferred:  # call_asyncによる再実行では数えない
+            self.budget.deposit()
+        for attempt in range(self.settings.max_attempts):
+            try:
+                return self._attempt(func, args, kwargs, check_status, idempotent)
+            except RetryableResult as e:
+                error = e
+            except Exception as e:
+                if not is_retryable(e, idempotent):
+                    raise
+                error = e
+
+            overall = attempt if deferred is None else deferred
+            if overall + 1 >= self.settings.max_attempts or not self.budget.withdraw():
+                break
+            wait = self.delay(overall, error)
+            if isinstance(error, RetryableResult) and hasattr(error.response, "close"):
+                error.response.close()  # 使わないレスポンスの接続をプールへ戻す
+            if deferred is not None:
+                # 待機は呼び出し元のイベントループで行う（その間スレッドとステージの枠を空ける）
+                raise RetryDeferred(wait, error)
+            reason = status_of(error) or type(error).__name__
+            logger.warning(f"{name or '外部サービス'}で一時的なエラー（{reason}）。{wait:.1f}秒後に再試行します。")
+            self.sleep(wait)
+
+        if isinstance(error, RetryableResult):
+            return error.response
+        raise error
+
+    async def call_async(self, func: Callable[[], Awaitable[T]], name: str = "") -> T:
+        """非同期関数funcを実行。内側のcallが一時的なエラーで失敗した場合は、イベントループを止めずに待って再実行
+
+        funcの中でasyncio.to_threadなどから呼ばれたcallは、待つ代わりにRetryDeferredを送出する。
+        外部呼び出しを1回だけ含む処理をまとめて再実行する用途向け（複数の外部呼び出しを含むと、成功済みの呼び出しも
+        再実行される）。
+        """
+        attempt = 0
+        while True:
+            token = _deferred_attempt.set(attempt)
+            try:
+                return await func()
+            except RetryDeferred as deferred:
+                logger.warning(f"{name or '外部サービス'}で一時的なエラー。{deferred.delay:.1f}秒後に再試行します。")
+                await asyncio.sleep(deferred.delay)
+                attempt += 1
+            finally:
+                _deferred_attempt.reset(token)
+
+
+_policy = RetryPolicy()
+
+
+def configure(settings: RetrySettings) -> None:
+    global _policy
+    _policy = RetryPolicy(settings)
+
+
+def policy() -> RetryPolicy:
+    """プロセス内で共有する再試行の設定とリトライ枠"""
+    return _policy
+
+
+def call(func: Callable[..., T], *args, **kwargs) -> T:
+    """共有の設定でfuncを呼び出す（RetryPolicy.callと同じ引数）"""
+    return _policy.call(func, *args, **kwargs)
@@ -0,0 +1,195 @@
+import csv
+import logging
+import sqlite3
+from contextlib import closing
+from datetime import date
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+SCHEMA_VERSION = 2
+
+# build_recordのキー（record.csvの列名） → runsテーブルの列名と型
+RECORD_COLUMNS = {
+    "timestamp": ("timestamp", "TEXT NOT NULL"),
+    "conversation_title": ("conversation_title", "TEXT"),
+    "AI_name": ("ai_name", "TEXT"),
+    "entry_URL": ("entry_url", "TEXT"),
+    "is_draft": ("is_draft", "INTEGER"),
+    "entry_title": ("entry_title", "TEXT"),
+    "entry_content": ("entry_content", "TEXT"),
+    "categories": ("categories", "TEXT"),
+    "prompt": ("prompt", "TEXT"),
+    "model": ("model", "TEXT NOT NULL"),
+    "temperature": ("temperature", "REAL"),
+    "input_letter_count": ("input_letter_count", "INTEGER"),
+    "output_letter_count": ("output_letter_count", "INTEGER"),
+    "input_tokens": ("input_tokens", "INTEGER"),
+    "input_fee": ("input_fee", "REAL"),
+    "cache_hit_tokens": ("cache_hit_tokens", "INTEGER"),
+    "thoughts_tokens": ("thoughts_tokens", "INTEGER"),
+    "thoughts_fee": ("thoughts_fee", "REAL"),
+    "output_tokens": ("output_tokens", "INTEGER"),
+    "output_fee": ("output_fee", "REAL"),
+    "api_requests": ("api_requests", "INTEGER"),
+    "total_fee (USD)": ("total_fee_usd", "REAL"),
+    "total_fee (JPY)": ("total_fee_jpy", "REAL"),
+    "api_key": ("api_key", "TEXT"),
+}
+# バージョン2で追加した列（料金表からの再計算用。以前の行・CSVから取り込んだ行はNULL）
+ADDED_COLUMNS = {2: ["cache_hit_tokens", "api_requests"]}
+# record.csvにはない列
+EXTRA_COLUMNS = {"day": "TEXT NOT NULL", "latency_seconds": "REAL"}
+COLUMNS = [name for name, _ in RECORD_COLUMNS.values()] + list(EXTRA_COLUMNS)
+
+_SCHEMA = f"""
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY,
+    {", ".join(f"{name} {sql_type}" for name, sql_type in [*RECORD_COLUMNS.values(), *EXTRA_COLUMNS.items()])},
+    UNIQUE (timestamp, model, entry_url)
+);
+CREATE INDEX IF NOT EXISTS idx_runs_day ON runs (day);
+CREATE INDEX IF NOT EXISTS idx_runs_model_day ON runs (model, day);
+"""
+
+
+class SchemaMismatchError(ValueError):
+    """レコードの項目が実行履歴のスキーマと一致しない場合"""
+
+
+def _convert(value, sql_type: str):
+    """CSVの文字列なども列の型に合わせて変換（空欄はNULL）"""
+    if value is None or value == "":
+        return None
+    if sql_type.startswith("INTEGER"):
+        if isinstance(value, str) and value.lower() in ("true", "false"):
+            return int(value.lower() == "true")
+        return int(float(value))
+    if sql_type.startswith("REAL"):
+        return float(value)
+    return str(value)
+
+
+def to_row(record: dict, latency_seconds: float | None = None) -> dict:
+    """build_recordの辞書を列名→値に変換。未知の項目・不足があればSchemaMismatchError"""
+    unknown = set(record) - set(RECORD_COLUMNS)
+    missing = {"timestamp", "model"} - set(record)
+    if unknown or missing:
+        raise SchemaMismatchError(f"実行履歴の列と一致しません（未知: {sorted(unknown)} 不足: {sorted(missing)}）")
+
+    row = {name: _convert(record.get(key), sql_type) for key, (name, sql_type) in RECORD_COLUMNS.items()}
+    row["day"] = row["timestamp"][:10]
+    row["latency_seconds"] = latency_seconds
+    return row
+
+
+class RunHistory:
+    """実行履歴（SQLite）。列は固定で、日付・モデルで索引を引ける"""
+
+    def __init__(self, path: Path):
+        self.path = path
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with closing(self._connect()) as conn:
+            version = conn.execute("PRAGMA user_version").fetchone()[0]
+            if version > SCHEMA_VERSION:
+                raise SchemaMismatchError(f"新しいバージョンの実行履歴です（{version}）: {path}")
+            conn.executescript(_SCHEMA)
+            if version == SCHEMA_VERSION:
+                return
+            # 既存のファイルには追加した列を足す。列の確認からバージョンの更新までを1つのトランザクションで行い、
+            # 途中で異常終了した場合や他のプロセスが先に足した場合も、足りない列だけを足す
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                existing = {row["name"] for row in conn.execute("PRAGMA table_info(runs)")}
+                types = dict(RECORD_COLUMNS.values())
+                for names in ADDED_COLUMNS.values():
+                    for name in names:
+                        if name not in existing:
+                            conn.execute(f"ALTER TABLE runs ADD COLUMN {name} {types[name]}")
+                conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+            except BaseException:
+                conn.rollback()
+                raise
+            conn.commit()
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, timeout=30)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode=WAL")  # 書き込み中も読み出せるように
+        return conn
+
+    def _insert(self, rows: list[dict]) -> int:
+        sql = f"INSERT OR IGNORE INTO runs ({', '.join(COLUMNS)}) VALUES ({', '.join(':' + c for c in COLUMNS)})"
+        with closing(self._connect()) as conn, conn:
+            before = conn.total_changes
+            conn.executemany(sql, rows)
+            return conn.total_changes - before
+
+    def add(self, record: dict, latency_seconds: float | None = None) -> None:
+        """1回分の実行を追加（同じ時刻・モデル・URLの行は重複させない）"""
+        self._insert([to_row(record, latency_seconds)])
+
+    def add_many(self, records: list[dict], latency_seconds: list[float | None] | None = None) -> int:
+        """複数の実行を1トランザクションで追加し、追加した行数を返す"""
+        latencies = latency_seconds or [None] * len(records)
+        return self._insert([to_row(record, latency) for record, latency in zip(records, latencies, strict=True)])
+
+    @staticmethod
+    def _where(start: date | None, end: date | None, model: str | None) -> tuple[str, list]:
+        """期間（両端を含む）・モデルの絞り込み条件（索引が効く列のみ）"""
+        conditions, params = [], []
+        if start is not None:
+            conditions.append("day >= ?")
+            params.append(start.isoformat())
+        if end is not None:
+            conditions.append("day <= ?")
+            params.append(end.isoformat())
+        if model is not None:
+            conditions.append("model = ?")
+            params.append(model)
+        return (f"WHERE {' AND '.join(conditions)}" if conditions else ""), params
+
+    def query(self, start: date | None = None, end: date | None = None, model: str | None = None) -> list[dict]:
+        """期間（両端を含む）・モデルで絞り込んだ実行履歴"""
+        where, params = self._where(start, end, model)
+        with closing(self._connect()) as conn:
+            return [dict(row) for row in conn.execute(f"SELECT * FROM runs {where} ORDER BY timestamp", params)]
+
+    def read_frame(
+        self,
+        columns: list[str],
+        start: date | None = None,
+        end: date | None = None,
+        model: str | None = None,
+    ):
+        """指定した列だけをpandas.DataFrameとして読み込む（集計用）"""
+        import pandas as pd  # 読み込みが重いため、集計する段階で読み込む
+
+        unknown = set(columns) - set(COLUMNS)
+        if unknown:
+            raise SchemaMismatchError(f"実行履歴にない列です: {sorted(unknown)}")
+        where, params = self._where(start, end, model)
+        with closing(self._connect()) as conn:
+            return pd.read_sql_query(
+                f"SELECT {', '.join(columns)} FROM runs {where} ORDER BY timestamp", conn, params=params
+            )
+
+    def import_csv(self, csv_path: Path) -> int:
+        """既存のrecord.csvを取り込み、追加した行数を返す（取り込み済みの行は無視）"""
+        with csv_path.open(newline="", encoding="utf-8-sig") as f:
+            rows = []
+            for record in csv.DictReader(f):
+                record = {key: value for key, value in record.items() if key in RECORD_COLUMNS}
+                if record.get("timestamp") and record.get("model"):
+                    rows.append(to_row(record))
+        added = self._insert(rows)
+        logger.warning(f"{csv_path.name}から{added}件の実行履歴を取り込みました（{len(rows) - added}件は取り込み済み）")
+        return added
+
+    def compact(self) -> None:
+        """統計情報を更新し、WALを書き戻してファイルを詰める"""
+        with closing(self._connect()) as conn:
+            conn.execute("ANALYZE")
+            conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+            conn.execute("VACUUM")
+        logger.warning(f"実行履歴を最適化しました: {self.path}（{self.path.stat().st_size / 1024:.0f}KB）")
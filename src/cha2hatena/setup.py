@@ -10,7 +10,6 @@ from dotenv import load_dotenv
 from .llm.conversational_ai import LlmConfig
 
 logger = logging.getLogger(__name__)
-load_dotenv(override=True)
 
 
 def config_validation(config_dict: dict, secret_keys: dict) -> tuple[dict, dict]:
@@ -105,6 +104,8 @@ def log_setup(logger: logging.Logger, initial_level: int, console_format: str) -
 def initialization(logger: logging.Logger) -> tuple:
     """DEBUGモード判定、ログレベル決定"""
 
+    load_dotenv(override=True)
+
     # DEBUGモード・ログレベル仮判定
     DEBUG_ENV = os.getenv("DEBUG", "False").lower() in ("true", "t", "1")
 
@@ -125,10 +126,17 @@ def initialization(logger: logging.Logger) -> tuple:
         prompt=config["ai"]["prompt"],
         model=config["ai"]["model"],
         temperature=config["ai"]["temperature"],
+        stream=config["ai"].get("stream", False),
         api_key=secret_keys.pop("API_KEY"),
         conversation="",
     )
 
+    # 予備モデル（ai.fallback_model）用に両方のAPIキーを保持
+    secret_keys["LLM_API_KEYS"] = {
+        "gemini": os.getenv("GEMINI_API_KEY", "").strip(),
+        "deepseek": os.getenv("DEEPSEEK_API_KEY", "").strip(),
+    }
+
     # DEBUGモード・ログレベル判定
     DEBUG_CONFIG = config.get("other", {}).get("debug").lower() in ("true", "1", "t")
     DEBUG = DEBUG_ENV if DEBUG_ENV else DEBUG_CONFIG
@@ -0,0 +1,113 @@
+import logging
+import threading
+from pathlib import Path
+from typing import Callable
+
+from . import retry
+
+logger = logging.getLogger(__name__)
+
+SCOPES = ["https://www.googleapis.com/auth/spreadsheets", "https://www.googleapis.com/auth/drive"]
+
+
+def service_account_client(credentials_path: Path):
+    """サービスアカウントで認証したgspreadクライアント"""
+    import gspread  # 読み込みが重いため、書き込む段階で読み込む
+
+    return gspread.service_account(scopes=SCOPES, filename=credentials_path)
+
+
+class SheetsSink:
+    """スプレッドシートへの追記をまとめて行う
+
+    認証済みクライアントとワークシートを使い回し、ヘッダーの有無は1行目だけで判定する。
+    appendで溜めた行はflushで1回のappend_rowsにまとめて送信する。
+    """
+
+    def __init__(self, spreadsheet_name: str, client_factory: Callable[[], object], flush_size: int = 50):
+        self.spreadsheet_name = spreadsheet_name
+        self.client_factory = client_factory
+        self.flush_size = flush_size
+        self.header: list[str] | None = None
+        self.pending: list[dict] = []
+        self._worksheet = None
+        self._lock = threading.Lock()
+
+    def _open(self):
+        if self._worksheet is not None:
+            return self._worksheet
+        import gspread
+
+        client = self.client_factory()
+        try:
+            worksheet = retry.call(client.open, self.spreadsheet_name, name="Googleスプレッドシート").sheet1
+        except gspread.exceptions.SpreadsheetNotFound:
+            worksheet = client.create(self.spreadsheet_name).sheet1
+            logger.warning(f"新規スプレッドシートを作成しました: {self.spreadsheet_name}")
+
+        # シート全体ではなく1行目だけを取得
+        self.header = retry.call(worksheet.row_values, 1, name="Googleスプレッドシート") or None
+        self._worksheet = worksheet
+        return worksheet
+
+    def append(self, row: dict) -> None:
+        """送信待ちに追加（flush_sizeに達したら送信）"""
+        with self._lock:
+            self.pending.append(row)
+            if len(self.pending) < self.flush_size:
+                return
+        self.flush()
+
+    def write(self, row: dict) -> int:
+        """送信待ちと合わせて1行を追記し、追記した行数を返す
+
+        失敗した場合は、この行を送信待ちから外して例外を送出する（再試行は呼び出し側の再試行キューで行うため、
+        送信待ちに残すと次の送信で同じ行が重複する）。
+        """
+        with self._lock:
+            self.pending.append(row)
+        try:
+            return self.flush()
+        except BaseException:
+            with self._lock:
+                self.pending = [pending for pending in self.pending if pending is not row]
+            raise
+
+    def take_pending(self) -> list[dict]:
+        """送信待ちの行を取り出す（送信を諦めて再試行キューへ回す場合）"""
+        with self._lock:
+            rows, self.pending = self.pending, []
+        return rows
+
+    def flush(self) -> int:
+        """送信待ちの行をまとめて追記し、追記した行数を返す。失敗した場合は送信待ちに残す"""
+        with self._lock:
+            if not self.pending:
+                return 0
+            worksheet = self._open()
+            values = []
+            header = self.header
+            if header is None:
+                header = list(self.pending[0].keys())
+                values.append(header)
+            values += [[row.get(column) for column in header] for row in self.pending]
+
+            # append_rowと同じく値をそのまま書き込む。行の重複を防ぐため、再試行は429（利用上限）のみ
+            retry.call(
+                worksheet.append_rows,
+                values,
+                value_input_option="RAW",
+                name="Googleスプレッドシート",
+                idempotent=False,
+            )
+
+            count = len(self.pending)
+            if self.header is None:
+                self.header = header
+                logger.warning(
+                    f"新規作成: スプレッドシートにヘッダーと{count}行を追加しました: {self.spreadsheet_name}"
+                )
+            else:
+                logger.warning(f"追記: スプレッドシートに{count}行を追加しました")
+            self.pending.clear()
+            return count
@@ -0,0 +1,111 @@
+import logging
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Callable
+
+from pydantic import BaseModel, Field
+
+logger = logging.getLogger(__name__)
+
+
+class SideEffectTask(BaseModel):
+    name: str = Field(description="処理名（handlersのキー）")
+    payload: dict = Field(default_factory=dict, description="処理に渡す引数（JSONで保存できる値）")
+    attempts: int = Field(default=0, description="これまでに失敗した回数")
+    last_error: str = Field(default="", description="直近の失敗内容")
+
+
+class SideEffectSettings(BaseModel):
+    timeouts: dict[str, float] = Field(
+        default_factory=lambda: {"line": 15, "outputs": 10, "sheets": 60}, description="処理ごとのタイムアウト（秒）"
+    )
+    default_timeout: float = Field(default=30, gt=0, description="timeoutsにない処理のタイムアウト（秒）")
+    max_attempts: int = Field(default=5, ge=1, description="この回数失敗した処理は再試行しない")
+    retry_on_timeout: list[str] = Field(
+        default_factory=lambda: ["history"], description="タイムアウトしても再試行する処理（重複しない処理のみ）"
+    )
+
+
+class RetryQueue:
+    """失敗した処理をJSON Linesで保存し、次回の実行時に再試行する"""
+
+    def __init__(self, path: Path, max_attempts: int = 5):
+        self.path = path
+        self.max_attempts = max_attempts
+
+    def load(self) -> list[SideEffectTask]:
+        try:
+            lines = self.path.read_text(encoding="utf-8").splitlines()
+        except FileNotFoundError:
+            return []
+        tasks = []
+        for line in lines:
+            try:
+                tasks.append(SideEffectTask.model_validate_json(line))
+            except ValueError:
+                logger.debug(f"再試行キューの壊れた行を読み飛ばします: {line[:100]}")
+        return tasks
+
+    def save(self, failed: list[SideEffectTask]) -> None:
+        """未完了の処理で置き換え（上限回数に達したものは破棄）"""
+        keep = []
+        for task in failed:
+            if task.attempts >= self.max_attempts:
+                logger.error(f"{task.name}は{task.attempts}回失敗したため再試行を中止します: {task.last_error}")
+            else:
+                keep.append(task)
+
+        if not keep:
+            self.path.unlink(missing_ok=True)
+            return
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.path.with_suffix(f".{os.getpid()}.tmp")
+        tmp_path.write_text("".join(task.model_dump_json() + "\n" for task in keep), encoding="utf-8")
+        os.replace(tmp_path, self.path)
+        logger.warning(f"{len(keep)}件の処理を次回の実行時に再試行します: {self.path}")
+
+
+def run_tasks(
+    tasks: list[SideEffectTask],
+    handlers: dict[str, Callable[..., object]],
+    settings: SideEffectSettings | None = None,
+) -> list[SideEffectTask]:
+    """すべての処理を並行して実行し、再試行する処理（失敗した処理）を返す
+
+    タイムアウトした処理のスレッドは止められないため、デーモンスレッドとして終了時に破棄する。
+    スレッドが後から成功すると再試行で二重にLINE通知・追記されるため、タイムアウトした処理は
+    retry_on_timeoutに含まれる（何度実行しても重複しない）処理だけを再試行する。
+    """
+    settings = settings or SideEffectSettings()
+    errors: dict[int, str] = {}
+
+    def run(idx: int, task: SideEffectTask) -> None:
+        try:
+            handlers[task.name](**task.payload)
+        except BaseException as e:  # sys.exitも含め、他の処理を止めない
+            errors[idx] = repr(e)
+
+    started = time.monotonic()
+    threads = []
+    for idx, task in enumerate(tasks):
+        thread = threading.Thread(target=run, args=(idx, task), name=f"side-effect-{task.name}", daemon=True)
+        thread.start()
+        threads.append(thread)
+
+    failed = []
+    for idx, (task, thread) in enumerate(zip(tasks, threads)):
+        timeout = settings.timeouts.get(task.name, settings.default_timeout)
+        thread.join(max(0.0, started + timeout - time.monotonic()))
+        if thread.is_alive():
+            if task.name not in settings.retry_on_timeout:
+                # 後から成功する可能性があるため再試行しない
+                logger.error(f"{task.name}の処理が{timeout}秒でタイムアウトしました（再試行しません）")
+                continue
+            errors[idx] = f"{timeout}秒でタイムアウト"
+        if idx in errors:
+            logger.error(f"{task.name}の処理に失敗しました: {errors[idx]}")
+            failed.append(task.model_copy(update={"attempts": task.attempts + 1, "last_error": errors[idx]}))
+    logger.debug(f"{len(tasks)}件の後処理が{time.monotonic() - started:.2f}秒で終了（失敗{len(failed)}件）")
+    return failed
@@ -0,0 +1,131 @@
+import calendar
+import logging
+from datetime import date
+
+from pydantic import BaseModel
+
+from .run_history import RunHistory
+
+logger = logging.getLogger(__name__)
+
+# --byの指定 → 集計に使う列と見出し
+GROUPS = {"day": ("day", "日別"), "model": ("model", "モデル別"), "ai": ("ai_name", "AI別")}
+SUM_COLUMNS = ["input_tokens", "thoughts_tokens", "output_tokens", "total_fee_usd", "total_fee_jpy"]
+PERCENTILE_COLUMNS = ["latency_seconds", "total_fee_usd"]
+# 料金の再計算に使う列
+TOKEN_COLUMNS = ["input_tokens", "thoughts_tokens", "output_tokens", "cache_hit_tokens"]
+PRICING_COLUMNS = ["day", "model", *TOKEN_COLUMNS, "api_requests", "total_fee_usd", "total_fee_jpy"]
+LOAD_COLUMNS = ["day", "model", "ai_name", *SUM_COLUMNS, "cache_hit_tokens", "api_requests", "latency_seconds"]
+
+
+class StatsSettings(BaseModel):
+    monthly_budget_usd: float | None = None  # 月の予算（USD）。未設定なら消化状況を表示しない
+    percentiles: list[float] = [50, 90, 99]
+    reprice: bool = True  # 料金をトークン数の内訳と料金表（その日の単価）から計算し直す。Falseなら記録時の料金
+
+
+def reprice(runs, engine=None):
+    """トークン数の内訳が記録された回の料金（USD・JPY）を料金表から一括で計算し直す
+
+    api_requestsのない回（以前のバージョン・CSVから取り込んだ行）と料金表にないモデルは記録時の料金のまま。
+    分割して要約した回は、1リクエストあたりの平均トークン数で料金階層を判定する。
+    JPYは記録時の為替レート（JPY÷USD）で換算する。
+    """
+    import numpy as np
+
+    from .llm.pricing import default_engine
+
+    rows = runs.index[runs["api_requests"].fillna(0) > 0]  # 0は要約キャッシュを使った回（料金は0）
+    if rows.empty:
+        return runs
+    part = runs.loc[rows]
+    requests = part["api_requests"].astype(float).to_numpy()
+    tokens = [part[column].fillna(0).astype(float).to_numpy() / requests for column in TOKEN_COLUMNS]
+    usd = (engine or default_engine()).fee_arrays(part["model"], *tokens, days=part["day"])["total"] * requests
+
+    known = ~np.isnan(usd)
+    rows, usd = rows[known], usd[known]
+    runs = runs.copy()
+    recorded_usd = runs.loc[rows, "total_fee_usd"].astype(float).to_numpy()
+    recorded_jpy = runs.loc[rows, "total_fee_jpy"].astype(float).to_numpy()
+    with np.errstate(divide="ignore", invalid="ignore"):
+        jpy = usd * recorded_jpy / recorded_usd
+    runs.loc[rows, "total_fee_usd"] = usd
+    runs.loc[rows, "total_fee_jpy"] = np.where(np.isfinite(jpy), jpy, recorded_jpy)
+    return runs
+
+
+def aggregate(runs, by: str):
+    """列byごとの実行回数・トークン数・料金の合計と平均処理時間"""
+    grouped = runs.groupby(GROUPS[by][0], sort=True, dropna=False)
+    result = grouped[SUM_COLUMNS].sum()
+    result.insert(0, "runs", grouped.size())
+    result["mean_latency"] = grouped["latency_seconds"].mean()
+    return result
+
+
+def percentiles(runs, q: list[float]):
+    """処理時間・料金のパーセンタイル（欠損値は除外）"""
+    result = runs[PERCENTILE_COLUMNS].astype(float).quantile([p / 100 for p in q])
+    result.index = [f"p{p:g}" for p in q]
+    return result
+
+
+def burn_down(runs, budget: float, today: date):
+    """今月の日ごとの料金・累計・予算残額と、月末時点の見込み額（累計÷経過日数×月の日数）"""
+    import numpy as np
+    import pandas as pd
+
+    days = pd.date_range(today.replace(day=1), today).strftime("%Y-%m-%d")
+    days_in_month = calendar.monthrange(today.year, today.month)[1]
+
+    this_month = runs[(runs["day"] >= days[0]) & (runs["day"] <= days[-1])]
+    daily = this_month.groupby("day")["total_fee_usd"].sum().reindex(days, fill_value=0.0)
+
+    result = pd.DataFrame({"total_fee_usd": daily})
+    result["cumulative"] = daily.cumsum()
+    result["remaining"] = budget - result["cumulative"]
+    result["projected"] = result["cumulative"] / np.arange(1, len(days) + 1) * days_in_month
+    return result
+
+
+def build_report(
+    history: RunHistory,
+    settings: StatsSettings,
+    by: list[str],
+    start: date | None = None,
+    end: date | None = None,
+    model: str | None = None,
+    today: date | None = None,
+) -> str:
+    """実行履歴を集計し、表示用の文字列を返す"""
+    runs = history.read_frame(LOAD_COLUMNS, start, end, model)
+    if runs.empty:
+        return "該当する実行履歴がありません。"
+    if settings.reprice:
+        runs = reprice(runs)
+
+    sections = [f"実行回数: {len(runs)}  料金合計: ${runs['total_fee_usd'].sum():.4f}"]
+    for key in by:
+        sections.append(f"■ {GROUPS[key][1]}\n{aggregate(runs, key).to_string(float_format='{:.4f}'.format)}")
+    sections.append(
+        f"■ パーセンタイル\n{percentiles(runs, settings.percentiles).to_string(float_format='{:.4f}'.format)}"
+    )
+
+    if settings.monthly_budget_usd is not None:
+        # 予算は期間・モデルの指定によらず今月の全実行で判定
+        today = today or date.today()
+        this_month = history.read_frame(PRICING_COLUMNS, today.replace(day=1), today)
+        if settings.reprice:
+            this_month = reprice(this_month)
+        table = burn_down(this_month, settings.monthly_budget_usd, today)
+        last = table.iloc[-1]
+        sections.append(
+            f"■ 今月の予算消化（予算: ${settings.monthly_budget_usd:.2f}）\n"
+            f"{table.to_string(float_format='{:.4f}'.format)}\n"
+            f"消化率: {last['cumulative'] / settings.monthly_budget_usd:.1%}  月末見込み: ${last['projected']:.4f}"
+        )
+        if last["projected"] > settings.monthly_budget_usd:
+            logger.warning("今月の料金が予算を超える見込みです。")
+
+    return "\n\n".join(sections)
@@ -0,0 +1,102 @@
+import logging
+from datetime import date, datetime, timedelta
+from functools import lru_cache
+
+logger = logging.getLogger(__name__)
+
+DT_FORMAT = "%Y/%m/%d %H:%M:%S"
+SESSION_GAP = timedelta(hours=3)
+_GAP_SECONDS = int(SESSION_GAP.total_seconds())
+_DAY_SECONDS = 24 * 60 * 60
+# これ未満の件数ではNumPyへの変換の方が高くつくため1件ずつ変換
+VECTORIZE_MIN = 256
+
+
+def _is_fixed_format(timestamp: str) -> bool:
+    return len(timestamp) == 19 and timestamp[4] == timestamp[7] == "/" and timestamp[10] == " "
+
+
+def parse_timestamp(timestamp: str) -> datetime:
+    """ "%Y/%m/%d %H:%M:%S"形式の時刻を変換（固定位置の切り出しで、strptimeより高速）"""
+    if not _is_fixed_format(timestamp):
+        return datetime.strptime(timestamp, DT_FORMAT)  # ゼロ埋めなし等はstrptimeに任せる
+    return datetime(
+        int(timestamp[0:4]),
+        int(timestamp[5:7]),
+        int(timestamp[8:10]),
+        int(timestamp[11:13]),
+        int(timestamp[14:16]),
+        int(timestamp[17:19]),
+    )
+
+
+@lru_cache(maxsize=4096)
+def _day_ordinal(day: str) -> int:
+    return date(int(day[0:4]), int(day[5:7]), int(day[8:10])).toordinal()
+
+
+def to_seconds(timestamp: str) -> int:
+    """時刻を通し秒に変換（// 86400で日付を比較できる）"""
+    if not _is_fixed_format(timestamp):
+        dt = datetime.strptime(timestamp, DT_FORMAT)
+        return dt.toordinal() * _DAY_SECONDS + dt.hour * 3600 + dt.minute * 60 + dt.second
+    return (
+        _day_ordinal(timestamp[:10]) * _DAY_SECONDS
+        + int(timestamp[11:13]) * 3600
+        + int(timestamp[14:16]) * 60
+        + int(timestamp[17:19])
+    )
+
+
+def _find_break_numpy(timestamps: list[str]) -> int | None:
+    """NumPyで一括変換・判定。使えない場合はNone"""
+    try:
+        import numpy as np
+    except ImportError:
+        return None
+    if not all(_is_fixed_format(t) for t in timestamps):
+        return None
+
+    seconds = np.array([t.replace("/", "-") for t in timestamps], dtype="datetime64[s]").astype(np.int64)
+    days = seconds // _DAY_SECONDS
+    # k番目のメッセージの「直前」は、逆順に処理したときに1つ前（=1つ新しい）のメッセージ
+    breaks = np.flatnonzero((days[:-1] != days[-1]) & (seconds[1:] - seconds[:-1] > _GAP_SECONDS))
+    return int(breaks[-1]) if breaks.size else -1
+
+
+def _find_break_python(timestamps: list[str]) -> int:
+    seconds = [to_seconds(t) for t in timestamps]
+    latest_day = seconds[-1] // _DAY_SECONDS
+    for k in range(len(seconds) - 2, -1, -1):
+        if seconds[k] // _DAY_SECONDS != latest_day and seconds[k + 1] - seconds[k] > _GAP_SECONDS:
+            return k
+    return -1
+
+
+def find_session_start(timestamps: list[str | None]) -> int:
+    """convert_to_strが取り込むメッセージの開始位置を求める
+
+    最新のメッセージから遡り、当日ではなくかつ直前のメッセージと3時間以上空いたメッセージで打ち切る。
+    時刻のないメッセージは判定に使わない。最新のメッセージに時刻がない場合はすべて取り込む。
+    """
+    if not timestamps[-1]:
+        return 0
+    indices = [i for i, t in enumerate(timestamps) if t]
+    stamped = [timestamps[i] for i in indices]
+
+    cut = None
+    if len(stamped) >= VECTORIZE_MIN:
+        try:
+            cut = _find_break_numpy(stamped)
+        except ValueError:
+            logger.debug("NumPyで時刻を変換できないため、1件ずつ変換します")
+    if cut is None:
+        cut = _find_break_python(stamped)
+    return 0 if cut < 0 else indices[cut] + 1
+
+
+def is_session_break(msg_dt: datetime, latest_dt: datetime | None, previous_dt: datetime | None) -> bool:
+    """当日のメッセージではないかつ3時間以上時間が空いた場合True"""
+    if latest_dt is None or msg_dt.date() == latest_dt.date():
+        return False
+    return previous_dt - msg_dt > SESSION_GAP
@@ -0,0 +1,196 @@
+import asyncio
+import logging
+import time
+from pathlib import Path
+
+from pydantic import BaseModel, Field
+
+from . import main as app
+from .batch import BatchJob, BatchRunner, StageConcurrency
+
+logger = logging.getLogger(__name__)
+
+WATCH_SUFFIXES = (".json", ".txt")
+
+
+class WatchSettings(BaseModel):
+    debounce_seconds: float = Field(default=10, ge=0, description="最後の変更からこの秒数だけ待ってから処理")
+    poll_interval: float = Field(default=5, gt=0, description="ポーリング時の走査間隔（秒）")
+    workers: int = Field(default=1, ge=1, description="同時に処理するファイル数")
+    concurrency: StageConcurrency = Field(default_factory=StageConcurrency)
+
+
+def scan(directory: Path, suffixes: tuple = WATCH_SUFFIXES) -> dict[Path, tuple[int, int]]:
+    """ディレクトリ直下の対象ファイルの(更新時刻, サイズ)"""
+    snapshot = {}
+    for path in directory.iterdir():
+        if path.suffix in suffixes and path.is_file():
+            try:
+                stat = path.stat()
+            except FileNotFoundError:  # 走査中に削除された
+                continue
+            snapshot[path] = (stat.st_mtime_ns, stat.st_size)
+    return snapshot
+
+
+def changed_paths(previous: dict, current: dict) -> list[Path]:
+    """追加・更新されたファイル（削除は無視）"""
+    return [path for path, signature in current.items() if previous.get(path) != signature]
+
+
+class Debouncer:
+    """書き込み途中のファイルを処理しないよう、変更が落ち着いたパスだけを返す"""
+
+    def __init__(self, seconds: float):
+        self.seconds = seconds
+        self.pending: dict[Path, float] = {}
+
+    def touch(self, path: Path, now: float) -> None:
+        self.pending[path] = now
+
+    def due(self, now: float) -> list[Path]:
+        ready = [path for path, last in self.pending.items() if now - last >= self.seconds]
+        for path in ready:
+            del self.pending[path]
+        return ready
+
+
+class DirectoryWatcher:
+    """input_dirを監視し、変更が落ち着いたファイルを作業キューへ積む
+
+    watchdogがインストールされていればOSの変更通知（inotify等）を使い、なければポーリングで検知する。
+    """
+
+    def __init__(self, directory: Path, settings: WatchSettings, force_polling: bool = False):
+        self.directory = directory
+        self.settings = settings
+        self.force_polling = force_polling
+        self.queue: asyncio.Queue[Path] = asyncio.Queue()
+        self.debouncer = Debouncer(settings.debounce_seconds)
+        self._queued: set[Path] = set()  # 同じファイルを重複して積まない
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._observer = None
+
+    def notify(self, path: Path) -> None:
+        """ファイルの変更を通知（イベントループのスレッドから呼び出す）"""
+        if path.suffix in WATCH_SUFFIXES:
+            self.debouncer.touch(path, time.monotonic())
+
+    def _start_observer(self) -> bool:
+        if self.force_polling:
+            return False
+        try:
+            from watchdog.events import FileSystemEventHandler
+            from watchdog.observers import Observer
+        except ImportError:
+            logger.debug("watchdogがインストールされていないため、ポーリングで監視します")
+            return False
+
+        watcher = self
+
+        class _Handler(FileSystemEventHandler):
+            def on_any_event(self, event):
+                if event.is_directory or event.event_type not in ("created", "modified", "moved"):
+                    return
+                path = Path(getattr(event, "dest_path", "") or event.src_path)
+                watcher._loop.call_soon_threadsafe(watcher.notify, path)
+
+        self._observer = Observer()
+        self._observer.schedule(_Handler(), str(self.directory), recursive=False)
+        self._observer.start()
+        return True
+
+    async def _poll(self) -> None:
+        snapshot = scan(self.directory)
+        while True:
+            await asyncio.sleep(self.settings.poll_interval)
+            current = scan(self.directory)
+            for path in changed_paths(snapshot, current):
+                self.notify(path)
+            snapshot = current
+
+    async def _dispatch(self) -> None:
+        """変更が落ち着いたファイルをキューへ"""
+        tick = min(1.0, max(self.settings.debounce_seconds / 2, 0.01))
+        while True:
+            await asyncio.sleep(tick)
+            for path in self.debouncer.due(time.monotonic()):
+                if path in self._queued or not path.exists():
+                    continue
+                self._queued.add(path)
+                await self.queue.put(path)
+                logger.warning(f"変更を検知しました: {path.name}")
+
+    async def next_path(self) -> Path:
+        path = await self.queue.get()
+        # 処理中に再度変更された場合は、あらためてキューへ積めるようにする
+        self._queued.discard(path)
+        return path
+
+    async def run(self) -> None:
+        self._loop = asyncio.get_running_loop()
+        tasks = [asyncio.create_task(self._dispatch())]
+        if self._start_observer():
+            logger.warning(f"フォルダの監視を開始しました（変更通知）: {self.directory}")
+        else:
+            interval = self.settings.poll_interval
+            logger.warning(f"フォルダの監視を開始しました（{interval}秒ごとのポーリング）: {self.directory}")
+            tasks.append(asyncio.create_task(self._poll()))
+        try:
+            await asyncio.gather(*tasks)
+        finally:
+            for task in tasks:
+                task.cancel()
+            if self._observer is not None:
+                self._observer.stop()
+                self._observer.join()
+
+
+async def _worker(watcher: DirectoryWatcher, runner: BatchRunner, busy: set[Path]) -> None:
+    while True:
+        path = await watcher.next_path()
+        if path in busy:  # 別のワーカーが処理中の場合は後回し
+            watcher.notify(path)
+            continue
+        busy.add(path)
+        try:
+            runner.refresh_dy_rate()
+            await runner.run_job(BatchJob(name=path.name, paths=[path]))
+            await runner.flush()
+        finally:
+            busy.discard(path)
+
+
+async def watch(directory: Path, settings: WatchSettings, runner: BatchRunner, force_polling: bool = False) -> None:
+    """監視とワーカーを起動（キャンセルされるまで常駐）"""
+    watcher = DirectoryWatcher(directory, settings, force_polling)
+    busy: set[Path] = set()
+    workers = [asyncio.create_task(_worker(watcher, runner, busy)) for _ in range(settings.workers)]
+    try:
+        await watcher.run()
+    finally:
+        for worker in workers:
+            worker.cancel()
+
+
+def run_watch(directory: Path | None = None, use_cache: bool = True, force_polling: bool = False) -> int:
+    """常駐モードのエントリーポイント。Ctrl+Cで終了"""
+    config = app.app_context().config
+    directory = directory or Path(config["paths"]["input_dir"].strip())
+    if not directory.is_dir():
+        logger.error(f"監視するフォルダが見つかりません: {directory}")
+        return 1
+
+    settings = WatchSettings.model_validate(config.get("watch") or {})
+    # 同じファイルの更新ごとに投稿するため、前回要約した以降のメッセージだけを取り込む
+    runner = BatchRunner(
+        settings.concurrency,
+        is_draft=app.app_context().debug,
+        cache=app.build_summary_cache(use_cache),
+        incremental=True,
+    )
+    try:
+        asyncio.run(watch(directory, settings, runner, force_polling))
+    except KeyboardInterrupt:
+        logger.warning("監視を終了しました。")
+    return 0
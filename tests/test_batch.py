@@ -0,0 +1,137 @@
+import asyncio
+import threading
+import time
+from pathlib import Path
+from types import SimpleNamespace
+
+from cha2hatena import batch
+from cha2hatena.llm.conversational_ai import LlmConfig
+from cha2hatena.llm.llm_stats import TokenStats
+
+
+def test_load_manifest():
+    manifest = batch.load_manifest(Path("sample/batch_manifest.yaml"))
+
+    assert [job.name for job in manifest.jobs] == ["claude", "chatgpt-and-notes"]
+    assert manifest.jobs[0].paths == [Path("sample/Claude-sample.json")]
+    assert manifest.concurrency.sheets == 1
+
+
+def test_batch_runner_limits_concurrency_and_isolates_failures(monkeypatch, tmp_path):
+    monkeypatch.chdir(tmp_path)  # ログなどを作業ディレクトリに書き込まない
+    active = {"llm": 0, "max_llm": 0}
+    lock = threading.Lock()
+
+    def fake_summarize(conversation, llm_config, cache=None):
+        with lock:
+            active["llm"] += 1
+            active["max_llm"] = max(active["max_llm"], active["llm"])
+        time.sleep(0.05)
+        with lock:
+            active["llm"] -= 1
+        if conversation == "broken.json":
+            raise SystemExit(1)
+        outputs = {"title": Path(conversation).stem, "content": "本文", "categories": []}
+        return outputs, TokenStats(10, 0, 5, 100, 10, "gemini-2.5-flash")
+
+    def fake_post(llm_outputs, is_draft, conversation_key=None):
+        return {**llm_outputs, "status_code": 201, "link_alternate": f"https://example.com/{llm_outputs['title']}"}
+
+    records, sheet_rows, flushes = [], [], []
+    # 設定ファイル・APIキーを読み込まない
+    llm_config = LlmConfig(prompt="p", model="gemini-2.5-flash", api_key="key12345", conversation="")
+    monkeypatch.setattr(batch.app, "app_context", lambda: SimpleNamespace(llm_config=llm_config, debug=True))
+    monkeypatch.setattr(batch.app, "load_conversation", lambda paths, state=None: paths[0].name)
+    monkeypatch.setattr(batch.app, "summarize_conversation", fake_summarize)
+    monkeypatch.setattr(batch.app, "post_to_hatena", fake_post)
+    monkeypatch.setattr(batch.app, "fetch_usd_jpy", lambda: 150.0)
+    handlers = {
+        "line": lambda line_text: None,
+        "outputs": lambda csv_data, title, content: records.append(csv_data),
+        "history": lambda csv_data, latency_seconds=None: None,
+    }
+    monkeypatch.setattr(batch.app, "SIDE_EFFECT_HANDLERS", handlers)
+    monkeypatch.setattr(batch.app, "record_to_spreadsheet", lambda csv_data, flush=True: sheet_rows.append(csv_data))
+    monkeypatch.setattr(batch.app, "flush_spreadsheet", lambda: flushes.append(len(sheet_rows)) or [])
+
+    jobs = [batch.BatchJob(name=f"job{i}", paths=[Path(f"Claude-{i}.json")]) for i in range(5)]
+    jobs.append(batch.BatchJob(name="broken", paths=[Path("broken.json")]))
+    runner = batch.BatchRunner(batch.StageConcurrency(llm=2))
+
+    results = asyncio.run(runner.run(jobs))
+
+    assert active["max_llm"] == 2
+    assert [r["ok"] for r in results] == [True] * 5 + [False]
+    assert results[0]["url"] == "https://example.com/Claude-0"
+    assert len(records) == 5
+    assert records[0]["total_fee (JPY)"] == records[0]["total_fee (USD)"] * 150.0
+    assert flushes == [5]  # スプレッドシートへはバッチの最後に1回だけ送信
+
+
+def test_failures_after_posting_are_deferred_not_failed(monkeypatch, tmp_path):
+    monkeypatch.chdir(tmp_path)
+    llm_config = LlmConfig(prompt="p", model="gemini-2.5-flash", api_key="key12345", conversation="")
+    monkeypatch.setattr(batch.app, "app_context", lambda: SimpleNamespace(llm_config=llm_config, debug=True))
+    monkeypatch.setattr(batch.app, "load_conversation", lambda paths, state=None: "会話")
+    outputs = {"title": "t", "content": "c", "categories": []}
+    stats = TokenStats(1, 0, 1, 1, 1, "gemini-2.5-flash")
+    monkeypatch.setattr(batch.app, "summarize_conversation", lambda conversation, config, cache=None: (outputs, stats))
+    posts = []
+
+    def post(*args):
+        posts.append(args)
+        return {**outputs, "status_code": 201}
+
+    monkeypatch.setattr(batch.app, "post_to_hatena", post)
+    monkeypatch.setattr(batch.app, "fetch_usd_jpy", lambda: 150.0)
+
+    def broken_history(csv_data, latency_seconds=None):
+        raise OSError("disk full")
+
+    handlers = {"line": lambda line_text: None, "outputs": lambda **kwargs: None, "history": broken_history}
+    monkeypatch.setattr(batch.app, "SIDE_EFFECT_HANDLERS", handlers)
+    monkeypatch.setattr(batch.app, "record_to_spreadsheet", lambda csv_data, flush=True: None)
+    monkeypatch.setattr(batch.app, "flush_spreadsheet", lambda: [{"row": 1}])  # 送信に失敗した行
+    saved = []
+    monkeypatch.setattr(batch.app, "defer_side_effects", saved.extend)
+
+    results = asyncio.run(batch.BatchRunner(batch.StageConcurrency()).run([batch.BatchJob(paths=[Path("a.json")])]))
+
+    # 投稿済みのため失敗にしない（再実行で二重投稿しない）。失敗した処理は再試行キューへ
+    assert len(posts) == 1
+    assert results[0]["ok"] and results[0]["deferred"] == ["history"]
+    assert [(task.name, task.attempts) for task in saved] == [("history", 1), ("sheets", 1)]
+    assert saved[1].payload == {"csv_data": {"row": 1}}
+
+
+def test_llm_stage_retries_each_api_call_without_reloading(monkeypatch, tmp_path):
+    from cha2hatena import retry
+
+    class ConnectionError(Exception):
+        """requests.exceptions.ConnectionErrorと同じ名前（一時的なエラー）"""
+
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(retry, "_policy", retry.RetryPolicy(retry.RetrySettings(base_delay=0)))
+    llm_config = LlmConfig(prompt="p", model="gemini-2.5-flash", api_key="key12345", conversation="")
+    monkeypatch.setattr(batch.app, "app_context", lambda: SimpleNamespace(llm_config=llm_config, debug=True))
+    calls = []
+
+    def api(name):
+        calls.append(name)
+        if calls.count(name) == 1 and name == "reduce":
+            raise ConnectionError("reset")
+        return name
+
+    def fake_summarize(conversation, config, cache=None):
+        # 分割した要約と同じく、1回の要約で複数回APIを呼ぶ
+        retry.call(api, "map")
+        retry.call(api, "reduce")
+        return {"title": "t", "content": "c", "categories": []}, TokenStats(1, 0, 1, 1, 1, "gemini-2.5-flash")
+
+    monkeypatch.setattr(batch.app, "load_conversation", lambda paths, state=None: calls.append("load") or "会話")
+    monkeypatch.setattr(batch.app, "summarize_conversation", fake_summarize)
+    runner = batch.BatchRunner(batch.StageConcurrency())
+
+    asyncio.run(runner.in_stage("llm", runner.summarize, [Path("a.json")], None))
+
+    assert calls == ["load", "map", "reduce", "reduce"]  # 失敗した呼び出しだけを再試行
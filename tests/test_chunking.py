@@ -0,0 +1,98 @@
+import threading
+
+import pytest
+
+from cha2hatena.json_loader import MESSAGE_SEPARATOR
+from cha2hatena.llm.chunking import (
+    MERGE_PROMPT,
+    CostLimitError,
+    MapReduceSummarizer,
+    estimate_tokens,
+    split_into_chunks,
+)
+from cha2hatena.llm.conversational_ai import ConversationalAi, LlmConfig
+from cha2hatena.llm.llm_stats import TokenStats
+
+
+def _conversation(count: int, size: int) -> str:
+    return "\n".join(f"date: x \nagent: You\n[message]\n{'あ' * size}{MESSAGE_SEPARATOR}" for _ in range(count))
+
+
+def test_split_into_chunks_respects_budget_and_message_boundaries():
+    conversation = _conversation(10, 100)
+
+    chunks = split_into_chunks(conversation, max_tokens=400)
+
+    assert "".join(chunks) == conversation
+    assert all(estimate_tokens(chunk) <= 400 for chunk in chunks)
+    assert all(chunk.endswith(MESSAGE_SEPARATOR) for chunk in chunks)
+    assert len(chunks) == 4
+
+
+def test_split_into_chunks_cuts_oversized_message():
+    conversation = _conversation(1, 1000)
+
+    chunks = split_into_chunks(conversation, max_tokens=300)
+
+    assert "".join(chunks) == conversation
+    assert all(estimate_tokens(chunk) <= 300 for chunk in chunks)
+
+
+class _FakeAi(ConversationalAi):
+    prompts = []
+    lock = threading.Lock()
+
+    def get_summary(self) -> tuple[dict, TokenStats]:
+        with self.lock:
+            self.prompts.append(self.prompt)
+        data = {"title": f"part{len(self.prompts)}", "content": "- メモ", "categories": ["Python"]}
+        return data, TokenStats(estimate_tokens(self.prompt), 0, 100, len(self.prompt), 10, self.model)
+
+
+def _config(conversation: str) -> LlmConfig:
+    return LlmConfig(prompt="記事にして", model="gemini-2.5-flash", api_key="dummy", conversation=conversation)
+
+
+def test_map_reduce_summarizer_reports_per_chunk_stats():
+    _FakeAi.prompts = []
+    summarizer = MapReduceSummarizer(_config(_conversation(10, 100)), _FakeAi, max_chunk_tokens=400)
+
+    assert summarizer.needs_chunking()
+    data, stats = summarizer.summarize()
+
+    assert len(_FakeAi.prompts) == 11  # map 10回（指示文の分を差し引いた大きさで分割）+ reduce 1回
+    assert all(estimate_tokens(prompt) <= 400 for prompt in _FakeAi.prompts)
+    assert "自動生成されています" in _FakeAi.prompts[-1]
+    assert all("自動生成されています" not in prompt for prompt in _FakeAi.prompts[:-1])
+    assert len(stats.parts) == 11
+    assert stats.total_fee == pytest.approx(sum(p.total_fee for p in stats.parts))
+    assert data["title"].startswith("part")
+
+
+def test_map_reduce_summarizer_stops_before_request_when_over_budget():
+    _FakeAi.prompts = []
+    summarizer = MapReduceSummarizer(_config(_conversation(10, 100)), _FakeAi, max_chunk_tokens=400, max_total_fee=1e-9)
+
+    with pytest.raises(CostLimitError):
+        summarizer.summarize()
+    assert _FakeAi.prompts == []
+
+
+def test_map_reduce_summarizer_merges_notes_within_budget():
+    _FakeAi.prompts = []
+    summarizer = MapReduceSummarizer(_config(_conversation(40, 100)), _FakeAi, max_chunk_tokens=400)
+
+    data, stats = summarizer.summarize()
+
+    # 指示文を含めた各リクエストの入力が上限以内。下書きメモは統合の段を挟んでから1本にまとめる
+    assert all(estimate_tokens(prompt) <= 400 for prompt in _FakeAi.prompts)
+    merges = [prompt for prompt in _FakeAi.prompts if prompt.startswith(MERGE_PROMPT[:20])]
+    assert 1 < len(merges) < len(_FakeAi.prompts) - 1
+    assert "自動生成されています" in _FakeAi.prompts[-1]
+    assert len(stats.parts) == len(_FakeAi.prompts)
+    assert summarizer.estimate_fee(split_into_chunks(summarizer.llm_config.conversation, summarizer.chunk_tokens)) > 0
+
+
+def test_map_reduce_summarizer_rejects_budget_smaller_than_instructions():
+    with pytest.raises(ValueError):
+        MapReduceSummarizer(_config("会話"), _FakeAi, max_chunk_tokens=100)
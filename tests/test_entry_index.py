@@ -0,0 +1,115 @@
+from types import SimpleNamespace
+
+import pytest
+
+from cha2hatena import hatenablog_poster, http_pool
+from cha2hatena import main as app
+from cha2hatena.entry_index import EntryIndex, content_digest
+
+ENTRY_XML = """<?xml version="1.0" encoding="utf-8"?>
+<entry xmlns="http://www.w3.org/2005/Atom" xmlns:app="http://www.w3.org/2007/app">
+  <title>更新後</title>
+  <link rel="edit" href="https://blog.hatena.ne.jp/user/blog/atom/entry/1"/>
+  <link rel="alternate" type="text/html" href="https://user.hatenablog.com/entry/1"/>
+  <author><name>user</name></author>
+  <updated>2026-01-01T10:00:00+09:00</updated>
+  <content type="text/x-markdown">本文</content>
+  <app:control><app:draft>yes</app:draft></app:control>
+</entry>"""
+
+
+def _result(n, title="t"):
+    return {
+        "status_code": 201,
+        "title": title,
+        "link_edit": f"https://blog.hatena.ne.jp/user/blog/atom/entry/{n}",
+        "link_alternate": f"https://user.hatenablog.com/entry/{n}",
+    }
+
+
+def test_index_finds_entries_by_content_and_conversation(tmp_path):
+    index = EntryIndex(tmp_path / "entries.json")
+    first = content_digest("t", "本文", ["b", "a"], True)
+    index.record(_result(1), first, "conv")
+
+    assert index.find_content(content_digest("t", "本文", ["a", "b"], True))["link_edit"].endswith("/1")
+    assert index.find_content(content_digest("t", "本文", ["a", "b"], False)) is None
+
+    # 更新すると古い内容では見つからなくなる。別のプロセスからも読める
+    second = content_digest("t", "修正後", [], True)
+    index.record(_result(1, "修正後"), second, "conv")
+    reloaded = EntryIndex(tmp_path / "entries.json")
+    assert reloaded.find_content(first) is None
+    assert reloaded.find_content(second)["title"] == "修正後"
+    assert reloaded.find_conversation("conv")["link_edit"].endswith("/1")
+    assert reloaded.find_conversation("other") is None
+
+
+@pytest.fixture
+def poster(monkeypatch, tmp_path):
+    """blog_postを記録だけする偽物に置き換え、呼び出し時のlink_editを返す"""
+    calls = []
+    config = {"blog": {"update_existing": True}}
+    context = SimpleNamespace(config=config, preset_categories=["自動投稿"], hatena_secret_keys={})
+
+    def fake_blog_post(title, content, categories, link_edit=None, **kwargs):
+        calls.append(link_edit)
+        result = _result(len(calls), title)
+        if link_edit:
+            result.update(status_code=200, link_edit=link_edit)
+        return result
+
+    monkeypatch.setattr(app, "app_context", lambda: context)
+    monkeypatch.setattr(app, "entry_index", lambda: index)
+    monkeypatch.setattr(hatenablog_poster, "blog_post", fake_blog_post)
+    index = EntryIndex(tmp_path / "entries.json")
+    return calls, config
+
+
+def test_post_skips_duplicates_and_updates_same_conversation(poster):
+    calls, _ = poster
+    outputs = {"title": "t", "content": "本文", "categories": []}
+
+    first = app.post_to_hatena(outputs, is_draft=True, conversation_key="conv")
+    assert app.post_to_hatena(outputs, is_draft=True, conversation_key="conv") == first  # 再試行などで同じ内容
+    assert calls == [None]
+
+    updated = app.post_to_hatena({**outputs, "content": "誤字を修正"}, is_draft=True, conversation_key="conv")
+    assert calls == [None, first["link_edit"]]  # 新規投稿せずにPUTで更新
+    assert updated["status_code"] == 200
+
+    app.post_to_hatena({**outputs, "content": "別の会話"}, is_draft=True, conversation_key="other")
+    assert calls[-1] is None
+
+
+def test_post_creates_new_entry_when_update_is_disabled(poster):
+    calls, config = poster
+    config["blog"]["update_existing"] = False
+    outputs = {"title": "t", "content": "本文", "categories": []}
+
+    app.post_to_hatena(outputs, is_draft=True, conversation_key="conv")
+    app.post_to_hatena({**outputs, "content": "修正"}, is_draft=True, conversation_key="conv")
+
+    assert calls == [None, None]
+
+
+def test_blog_post_with_link_edit_sends_put_to_member_uri(monkeypatch):
+    requests = []
+
+    class _Session:
+        def put(self, url, data, headers, timeout):
+            requests.append(("PUT", url, data))
+            return SimpleNamespace(status_code=200, content=ENTRY_XML.encode("utf-8"))
+
+        def post(self, *args, **kwargs):
+            pytest.fail("新規投稿してはいけない")
+
+    monkeypatch.setattr(http_pool, "get_oauth_session", lambda **keys: _Session())
+    link_edit = "https://blog.hatena.ne.jp/user/blog/atom/entry/1"
+    keys = {"hatena_entry_url": "https://blog.hatena.ne.jp/user/blog/atom/entry", "client_key": "k"}
+
+    result = hatenablog_poster.blog_post("更新後", "本文", [], keys, is_draft=True, link_edit=link_edit)
+
+    assert requests[0][:2] == ("PUT", link_edit)
+    assert "<title>更新後</title>" in requests[0][2].decode("utf-8")
+    assert (result["status_code"], result["link_edit"], result["title"]) == (200, link_edit, "更新後")
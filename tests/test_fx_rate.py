@@ -0,0 +1,90 @@
+import json
+import threading
+import time
+
+import pytest
+
+from cha2hatena.fx_rate import ENV_OVERRIDE, FxRateProvider, FxSettings
+
+
+@pytest.fixture(autouse=True)
+def _no_env_override(monkeypatch):
+    monkeypatch.delenv(ENV_OVERRIDE, raising=False)
+
+
+def _write_cache(path, rate, hours_ago):
+    path.write_text(json.dumps({"rate": rate, "fetched_at": time.time() - hours_ago * 3600}), encoding="utf-8")
+
+
+def test_fresh_cache_is_used_without_network(tmp_path):
+    cache_path = tmp_path / "fx_rate.json"
+    _write_cache(cache_path, 150.0, hours_ago=1)
+    provider = FxRateProvider(cache_path, remote=lambda: pytest.fail("通信しないはず"))
+
+    assert provider.get() == 150.0
+
+
+def test_stale_cache_returns_immediately_and_refreshes_in_background(tmp_path):
+    cache_path = tmp_path / "fx_rate.json"
+    _write_cache(cache_path, 150.0, hours_ago=24)
+    release = threading.Event()
+
+    def slow_remote():
+        release.wait(5)
+        return 155.0
+
+    provider = FxRateProvider(cache_path, FxSettings(ttl_hours=12), remote=slow_remote)
+
+    assert provider.get() == 150.0  # 取得の完了を待たない
+    release.set()
+    provider.refresh_async().join(5)
+    assert provider.get() == 155.0
+
+
+def test_missing_cache_waits_for_first_fetch(tmp_path):
+    provider = FxRateProvider(tmp_path / "fx_rate.json", remote=lambda: 148.5)
+    provider.prefetch()
+
+    assert provider.get(wait=5) == 148.5
+    assert json.loads((tmp_path / "fx_rate.json").read_text(encoding="utf-8"))["rate"] == 148.5
+
+
+def test_offline_without_cache_returns_none(tmp_path):
+    def offline():
+        raise ConnectionError("offline")
+
+    provider = FxRateProvider(tmp_path / "fx_rate.json", FxSettings(max_stale_days=1), remote=offline)
+    assert provider.get(wait=5) is None
+
+    _write_cache(tmp_path / "fx_rate.json", 140.0, hours_ago=24 * 3)  # 期限切れの古いレートは使わない
+    assert provider.get(wait=5) is None
+
+
+def test_env_and_file_override_remote(tmp_path, monkeypatch):
+    rate_file = tmp_path / "rate.txt"
+    rate_file.write_text("151.25\n", encoding="utf-8")
+    provider = FxRateProvider(
+        tmp_path / "fx_rate.json", FxSettings(rate_file=str(rate_file)), remote=lambda: pytest.fail("通信しないはず")
+    )
+
+    assert provider.get() == 151.25
+    monkeypatch.setenv(ENV_OVERRIDE, "149")
+    assert provider.get() == 149.0
+
+
+def test_invalid_override_falls_back_to_cache(tmp_path, monkeypatch, caplog):
+    cache_path = tmp_path / "fx_rate.json"
+    _write_cache(cache_path, 150.0, hours_ago=1)
+    rate_file = tmp_path / "rate.txt"
+    rate_file.write_text("約150円\n", encoding="utf-8")
+    provider = FxRateProvider(
+        cache_path, FxSettings(rate_file=str(rate_file)), remote=lambda: pytest.fail("通信しないはず")
+    )
+    monkeypatch.setenv(ENV_OVERRIDE, "abc")
+
+    assert provider.get() == 150.0
+    assert ENV_OVERRIDE in caplog.text and "rate.txt" in caplog.text
+
+    cache_path.unlink()
+    provider.remote = lambda: 148.5  # キャッシュもなければ取得したレート
+    assert provider.get(wait=5) == 148.5
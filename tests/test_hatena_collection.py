@@ -0,0 +1,151 @@
+import io
+import xml.etree.ElementTree as ET
+from types import SimpleNamespace
+
+import pytest
+
+from cha2hatena.entry_index import EntryIndex, content_digest
+from cha2hatena.hatena_collection import (
+    CollectionClient,
+    CollectionFetchError,
+    PageCache,
+    category_counts,
+    parse_page,
+    sync_index,
+)
+
+BASE = "https://blog.hatena.ne.jp/user/blog.hatenablog.com/atom/entry"
+
+
+def _entry(n, categories=("Python",), draft="no"):
+    terms = "".join(f'<category term="{c}" />' for c in categories)
+    return f"""
+  <entry>
+    <id>tag:blog.hatena.ne.jp,2013:blog-user-1-{n}</id>
+    <link rel="edit" href="{BASE}/{n}"/>
+    <link rel="alternate" type="text/html" href="https://user.hatenablog.com/entry/{n}"/>
+    <author><name>user</name></author>
+    <title>記事{n}</title>
+    <updated>2026-01-0{n}T10:00:00+09:00</updated>
+    <content type="text/x-markdown">本文{n} &amp; &lt;コード&gt;</content>
+    {terms}
+    <app:control><app:draft>{draft}</app:draft></app:control>
+  </entry>"""
+
+
+def _feed(entries, next_url=None):
+    next_link = f'<link rel="next" href="{next_url}"/>' if next_url else ""
+    return f"""<?xml version="1.0" encoding="utf-8"?>
+<feed xmlns="http://www.w3.org/2005/Atom" xmlns:app="http://www.w3.org/2007/app">
+  <link rel="first" href="{BASE}"/>
+  {next_link}
+  <title>ブログ</title>
+  {"".join(entries)}
+</feed>""".encode("utf-8")
+
+
+class _Server:
+    """URLごとのフィードとETagを返し、If-None-Matchが一致すれば304を返す"""
+
+    def __init__(self, pages):
+        self.pages = pages  # url → (etag, body)
+        self.requests = []
+
+    def get(self, url, headers, timeout, stream):
+        self.requests.append((url, dict(headers)))
+        etag, body = self.pages[url]
+        if headers.get("If-None-Match") == etag:
+            status, body = 304, b""
+        else:
+            status = 200
+        return SimpleNamespace(
+            status_code=status,
+            headers={"ETag": etag, "Last-Modified": "Thu, 01 Jan 2026 00:00:00 GMT"},
+            raw=io.BytesIO(body),
+            close=lambda: None,
+        )
+
+
+def test_parse_page_streams_entries_and_next_link():
+    entries, next_url = parse_page(io.BytesIO(_feed([_entry(1, ("Python", "AtomPub"), "yes"), _entry(2)], "p2")))
+
+    assert next_url == "p2"
+    assert [e.title for e in entries] == ["記事1", "記事2"]
+    first = entries[0]
+    assert first.content == "本文1 & <コード>"
+    assert first.categories == ["Python", "AtomPub"]
+    assert first.is_draft and not entries[1].is_draft
+    assert first.link_edit == f"{BASE}/1"
+    assert first.link_edit_user.endswith("edit?entry=1")
+    assert first.time.isoformat() == "2026-01-01T10:00:00+09:00"
+
+
+def test_parse_page_accepts_empty_title_and_detaches_entries(monkeypatch):
+    roots = []
+    iterparse = ET.iterparse
+
+    def spy(source, events):
+        for event, elem in iterparse(source, events):
+            if not roots:
+                roots.append(elem)
+            yield event, elem
+
+    monkeypatch.setattr(ET, "iterparse", spy)
+    feed = _feed([_entry(1).replace("<title>記事1</title>", "<title/>"), _entry(2)])
+
+    entries, _ = parse_page(io.BytesIO(feed))
+
+    assert [e.title for e in entries] == ["", "記事2"]
+    assert len(roots[0]) == 0  # 読み終えた要素はfeedに残さない
+
+
+def test_client_follows_next_and_revalidates_cached_pages(tmp_path):
+    server = _Server(
+        {
+            BASE: ('"a"', _feed([_entry(3)], f"{BASE}?page=2")),
+            f"{BASE}?page=2": ('"b"', _feed([_entry(2), _entry(1)])),
+        }
+    )
+    cache_path = tmp_path / "collection.json"
+
+    client = CollectionClient(BASE, PageCache(cache_path), lambda: server)
+    assert [e.title for e in client.iter_entries()] == ["記事3", "記事2", "記事1"]
+    assert client.stats == {"fetched": 2}
+
+    # 先頭ページだけ更新された状態で再取得（別プロセスを想定してキャッシュを読み直す）
+    server.pages[BASE] = ('"a2"', _feed([_entry(4), _entry(3)], f"{BASE}?page=2"))
+    client = CollectionClient(BASE, PageCache(cache_path), lambda: server)
+    assert [e.title for e in client.iter_entries()] == ["記事4", "記事3", "記事2", "記事1"]
+    assert client.stats == {"fetched": 1, "not_modified": 1}
+    assert server.requests[-1][1] == {
+        "If-None-Match": '"b"',
+        "If-Modified-Since": "Thu, 01 Jan 2026 00:00:00 GMT",
+    }
+
+
+def test_max_pages_limits_requests(tmp_path):
+    server = _Server({BASE: ('"a"', _feed([_entry(2)], f"{BASE}?page=2"))})
+    client = CollectionClient(BASE, PageCache(tmp_path / "collection.json"), lambda: server)
+
+    assert len(list(client.iter_entries(max_pages=1))) == 1
+    assert len(server.requests) == 1
+
+
+def test_error_status_is_raised(tmp_path):
+    failing = SimpleNamespace(
+        get=lambda url, **kwargs: SimpleNamespace(status_code=401, headers={}, raw=None, close=lambda: None)
+    )
+    client = CollectionClient(BASE, PageCache(tmp_path / "collection.json"), lambda: failing)
+
+    with pytest.raises(CollectionFetchError):
+        list(client.iter_entries())
+
+
+def test_sync_index_enables_duplicate_detection_and_category_counts(tmp_path):
+    entries, _ = parse_page(io.BytesIO(_feed([_entry(1, ("Python", "AtomPub")), _entry(2)])))
+    index = EntryIndex(tmp_path / "entries.json")
+
+    assert sync_index(entries, index) == 2
+    digest = content_digest("記事1", "本文1 & <コード>", ["AtomPub", "Python"], False)
+    assert index.find_content(digest)["link_alternate"] == "https://user.hatenablog.com/entry/1"
+    assert category_counts(entries) == {"Python": 2, "AtomPub": 1}
@@ -1,7 +1,14 @@
+import html
 import json
 import os
+import re
+import xml.etree.ElementTree as ET
+from datetime import datetime, timedelta, timezone
 from pathlib import Path
+from types import SimpleNamespace
+from xml.sax.saxutils import escape
 
+import pytest
 from dotenv import load_dotenv
 
 from cha2hatena.hatenablog_poster import hatena_oauth, parse_response, xml_unparser
@@ -44,3 +51,124 @@ def test_uploader():
 
 if __name__ == "__main__":
     test_uploader()
+
+
+### 以下はネットワークを使わないテスト
+def _tree_unparser(title, content, categories, preset_categories=[], author=None, updated=None, is_draft=False):
+    """変更前のxml_unparser（ElementTreeで組み立ててET.tostring。比較用）"""
+    if updated.tzinfo is None:
+        updated = updated.replace(tzinfo=timezone(timedelta(hours=9)))
+    namespaces = {"xmlns": "http://www.w3.org/2005/Atom", "xmlns:app": "http://www.w3.org/2007/app"}
+    root = ET.Element("entry", attrib=namespaces)
+    title_elem = ET.SubElement(root, "title")
+    updated_elem = ET.SubElement(root, "updated")
+    name = ET.SubElement(ET.SubElement(root, "author"), "name")
+    content_elem = ET.SubElement(root, "content", attrib={"type": "text/x-markdown"})
+    control = ET.SubElement(root, "app:control")
+    draft = ET.SubElement(control, "app:draft")
+    preview = ET.SubElement(control, "app:preview")
+    for cat in categories + preset_categories:
+        ET.SubElement(root, "category", attrib={"term": cat})
+    title_elem.text = title
+    updated_elem.text = updated.isoformat()
+    name.text = author
+    content_elem.text = content
+    draft.text = "yes" if is_draft else "no"
+    preview.text = "no"
+    return ET.tostring(root, encoding="unicode")
+
+
+def _tree_parse_response(text):
+    """変更前のparse_response（XPathで要素ごとにfind。比較用）"""
+    ns = {"atom": "http://www.w3.org/2005/Atom", "app": "http://www.w3.org/2007/app"}
+    root = ET.fromstring(text)
+
+    def find(key, attr=None):
+        elem = root.find(key, ns)
+        return "" if elem is None else (elem.get(attr) if attr else elem.text)
+
+    link_edit = find("atom:link[@rel='edit']", "href")
+    return {
+        "title": find("atom:title"),
+        "author": find("atom:author/atom:name"),
+        "content": find("atom:content"),
+        "time": datetime.fromisoformat(find("atom:updated")),
+        "link_edit": link_edit,
+        "link_edit_user": str(link_edit).replace("atom/entry/", "edit?entry="),
+        "link_alternate": find("atom:link[@rel='alternate']", "href"),
+        "categories": [c.get("term") for c in root.findall("atom:category", ns) if c.get("term", "")],
+        "is_draft": find("app:control/app:draft") == "yes",
+    }
+
+
+def _sample_request() -> dict:
+    """sample/harena_request.xmlの値（1行目のリクエスト行と{yes | no}の記法を除く）"""
+    text = Path("sample/harena_request.xml").read_text(encoding="utf-8").split("\n", 2)[2]
+    root = ET.fromstring(text.replace("{yes | no}", "yes"))
+    atom = "{http://www.w3.org/2005/Atom}"
+    return {
+        "title": root.findtext(f"{atom}title"),
+        "content": root.findtext(f"{atom}content"),
+        "categories": [c.get("term") for c in root.findall(f"{atom}category")],
+        "author": root.findtext(f"{atom}author/{atom}name"),
+        "updated": datetime.fromisoformat(root.findtext(f"{atom}updated")),
+        "is_draft": True,
+    }
+
+
+@pytest.mark.parametrize(
+    "entry",
+    [
+        _sample_request(),
+        {
+            "title": "A & B <C> \"D\" 'E'",
+            "content": "## 見出し\n\n```python\nif a < b and c > d: print('&amp;')\n```\r\n\t終わり ]]>",
+            "categories": ['tag "quoted"', "改行\nあり", "tab\tand\rcr", "<&>"],
+            "preset_categories": ["自動投稿", "AtomPub"],
+            "author": "user",
+            "updated": datetime(2026, 1, 1, 10, 0, 0, 123456),
+        },
+        {"title": "", "content": "", "categories": [], "author": None, "updated": datetime(2026, 1, 1)},
+        {
+            "title": "😀 絵文字",
+            "content": "x" * 100_000,
+            "categories": [],
+            "updated": datetime(2026, 1, 1, tzinfo=timezone.utc),
+            "is_draft": True,
+        },
+    ],
+)
+def test_template_matches_element_tree_byte_for_byte(entry):
+    assert xml_unparser(**entry) == _tree_unparser(**entry).encode("utf-8")
+
+
+def _sample_response() -> bytes:
+    """sample/hatena_response_format.xmlを整形式に直したもの
+
+    サンプルは名前空間の宣言・閉じタグがなく、formatted-contentのHTMLもエスケープされていないため補う。
+    """
+    text = Path("sample/hatena_response_format.xml").read_text(encoding="utf-8").strip()
+    text = text.replace(
+        "<entry>", '<entry xmlns="http://www.w3.org/2005/Atom" xmlns:app="http://www.w3.org/2007/app">', 1
+    )
+    text = text[: text.rindex("<entry>")] + "</entry>"
+    text = re.sub(
+        r"(<hatena:formatted-content[^>]*>)(.*?)(</hatena:formatted-content>)",
+        lambda m: m[1] + escape(html.unescape(m[2])) + m[3],
+        text,
+        flags=re.S,
+    )
+    return text.encode("utf-8")
+
+
+def test_single_pass_parser_matches_find_based_parser():
+    for body in (_sample_response(), xml_unparser(**_sample_request())):
+        response = SimpleNamespace(status_code=201, content=body)
+        expected = {"status_code": 201, **_tree_parse_response(body)}
+        assert parse_response(response) == expected
+
+    result = parse_response(SimpleNamespace(status_code=201, content=_sample_response()))
+    assert result["link_edit"].endswith("/atom/entry/2500000000")
+    assert result["link_edit_user"].endswith("/edit?entry=2500000000")
+    assert result["link_alternate"] == "http://{ルートURL}/entry/2008-happy-new-year"
+    assert result["categories"] == ["Scala"] and result["is_draft"] is False
@@ -0,0 +1,83 @@
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from cha2hatena import http_pool
+from cha2hatena.retry import RetryPolicy, RetrySettings
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive
+    ports = []
+    statuses = []
+
+    def _reply(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        self.rfile.read(length)
+        self.ports.append(self.client_address[1])
+        status = self.statuses.pop(0) if self.statuses else 200
+        self.send_response(status)
+        self.send_header("Content-Length", "2")
+        self.end_headers()
+        self.wfile.write(b"ok")
+
+    do_GET = do_POST = _reply
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    _Handler.ports, _Handler.statuses = [], []
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), _Handler)
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    http_pool.configure(http_pool.HttpSettings())
+    yield f"http://127.0.0.1:{httpd.server_address[1]}"
+    http_pool.close_all()
+    httpd.shutdown()
+
+
+def test_session_reuses_connection(server):
+    assert http_pool.get_session() is http_pool.get_session()
+
+    for _ in range(3):
+        http_pool.get_session().post(server, json={}, timeout=http_pool.timeout())
+
+    assert len(_Handler.ports) == 3
+    assert len(set(_Handler.ports)) == 1
+
+
+def test_oauth_session_is_shared_per_credentials():
+    keys = {"client_key": "a", "client_secret": "b", "resource_owner_key": "c", "resource_owner_secret": "d"}
+
+    first = http_pool.get_oauth_session(**keys)
+
+    assert http_pool.get_oauth_session(**dict(reversed(keys.items()))) is first
+    assert http_pool.get_oauth_session(**{**keys, "client_key": "x"}) is not first
+    http_pool.close_all()
+
+
+def test_retries_are_left_to_retry_policy(server):
+    policy = RetryPolicy(RetrySettings(max_attempts=3), sleep=lambda _: None)
+    _Handler.statuses = [503] * 10
+
+    response = policy.call(http_pool.get_session().get, server, timeout=http_pool.timeout(), check_status=True)
+
+    # セッション側では再送せず、RetryPolicyの試行回数だけ送る
+    assert response.status_code == 503
+    assert len(_Handler.ports) == policy.settings.max_attempts
+
+    _Handler.ports, _Handler.statuses = [], [503, 200]
+    assert http_pool.get_session().post(server, timeout=http_pool.timeout()).status_code == 503
+    assert len(_Handler.ports) == 1
+
+
+def test_configure_applies_pool_settings():
+    http_pool.configure(http_pool.HttpSettings(pool_maxsize=3))
+    adapter = http_pool.get_session().get_adapter("https://example.com")
+
+    assert adapter._pool_maxsize == 3
+    assert adapter.max_retries.total == 0
+    http_pool.configure(http_pool.HttpSettings())
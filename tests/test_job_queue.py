@@ -0,0 +1,178 @@
+import sqlite3
+import time
+from pathlib import Path
+from types import SimpleNamespace
+
+import pytest
+
+from cha2hatena import job_queue
+from cha2hatena.job_queue import JobBusyError, JobQueue, JobSettings
+from cha2hatena.llm.conversational_ai import LlmConfig
+from cha2hatena.llm.llm_stats import TokenStats
+
+
+@pytest.fixture
+def pipeline(monkeypatch):
+    """パイプラインの各段階を記録するだけの偽物に置き換え、failsに入れた段階は失敗させる"""
+    calls, fails = [], set()
+    app = job_queue.app
+
+    def stage(name, result):
+        def run(*args, **kwargs):
+            calls.append(name)
+            if name in fails:
+                fails.discard(name)
+                raise SystemExit(1)  # 既存のクライアントは致命的なエラーでsys.exitする
+            return result(*args) if callable(result) else result
+
+        return run
+
+    llm_config = LlmConfig(prompt="p", model="deepseek-chat", api_key="key12345", conversation="")
+    monkeypatch.setattr(app, "app_context", lambda: SimpleNamespace(llm_config=llm_config))
+    monkeypatch.setattr(app, "build_ingest_state", lambda incremental: None)
+    monkeypatch.setattr(app, "build_summary_cache", lambda use_cache: None)
+    monkeypatch.setattr(app, "load_conversation", stage("load", "会話"))
+    outputs = {"title": "タイトル", "content": "本文", "categories": []}
+    stats = TokenStats(10, 0, 5, 100, 10, "deepseek-chat")
+    monkeypatch.setattr(app, "summarize_conversation", stage("summarize", (outputs, stats)))
+    result = {**outputs, "status_code": 201, "link_alternate": "https://example.com/1", "is_draft": True}
+    monkeypatch.setattr(app, "post_to_hatena", stage("post", result))
+    monkeypatch.setattr(app, "fetch_usd_jpy", lambda: 150.0)
+    monkeypatch.setattr(app, "build_record", stage("record", lambda paths, res, llm_stats, rate: {"fee": rate}))
+    monkeypatch.setattr(app, "run_side_effects", stage("side_effects", []))
+    return calls, fails
+
+
+def _queue(tmp_path, **settings):
+    return JobQueue(tmp_path / "jobs.sqlite3", JobSettings(**settings))
+
+
+def test_resumes_after_failure_without_resummarizing(tmp_path, pipeline):
+    calls, fails = pipeline
+    queue = _queue(tmp_path)
+    job = queue.add([Path("a.json")])
+    fails.add("post")
+
+    assert not job_queue.run_claimed(queue, queue.claim(job.id))
+    saved = queue.get(job.id)
+    assert (saved.status, saved.stage, saved.llm_outputs["title"]) == ("queued", "summarized", "タイトル")
+
+    # 同じ会話ログで再実行すると同じジョブを続きから実行
+    assert queue.add([Path("a.json")]).id == job.id
+    assert job_queue.run_claimed(queue, queue.claim(job.id))
+
+    assert calls == ["load", "summarize", "post", "post", "record", "side_effects"]
+    done = queue.get(job.id)
+    assert (done.status, done.stage, done.csv_data) == ("done", "done", {"fee": 150.0})
+    assert queue.add([Path("a.json")]).id != job.id  # 完了後は新しいジョブ
+
+
+def test_rerun_updates_options_of_unfinished_job(tmp_path):
+    queue = _queue(tmp_path)
+    job = queue.add([Path("a.json")])
+
+    # 失敗後に--no-cache・デバッグモードで再実行した場合も、今回の指定で実行する
+    rerun = queue.add([Path("a.json")], incremental=True, use_cache=False, is_draft=True)
+
+    assert rerun.id == job.id
+    saved = queue.get(job.id)
+    assert (saved.incremental, saved.use_cache, saved.is_draft) == (True, False, True)
+    assert saved.paths == job.paths
+
+
+def test_edited_export_is_resummarized_before_posting(tmp_path, pipeline, monkeypatch):
+    calls, fails = pipeline
+    path = tmp_path / "Claude-a.json"
+    path.write_text("[]", encoding="utf-8")
+    queue = _queue(tmp_path)
+    job = queue.add([path])
+    fails.add("post")
+    assert not job_queue.run_claimed(queue, queue.claim(job.id))
+
+    # 投稿に失敗した後、会話ログを追記してから再実行すると、古い要約・取り込み位置は使わない
+    path.write_text('[{"say": "追記"}]', encoding="utf-8")
+    assert queue.add([path]).id == job.id
+
+    def load(paths, state=None):
+        calls.append("load")
+        return "新しい会話"
+
+    monkeypatch.setattr(job_queue.app, "load_conversation", load)
+    assert job_queue.run_claimed(queue, queue.claim(job.id))
+
+    assert calls == ["load", "summarize", "post", "load", "summarize", "post", "record", "side_effects"]
+    assert queue.get(job.id).conversation_hash != job.conversation_hash
+
+
+def test_does_not_repost_when_recording_fails(tmp_path, pipeline):
+    calls, fails = pipeline
+    queue = _queue(tmp_path)
+    job = queue.add([Path("a.json")])
+    fails.add("side_effects")
+
+    assert not job_queue.run_claimed(queue, queue.claim(job.id))
+    assert queue.get(job.id).stage == "posted"
+    assert job_queue.run_claimed(queue, queue.claim(job.id))
+
+    assert calls.count("post") == 1
+    assert calls.count("record") == 1  # 記録内容（時刻）も保存済みのものを使う
+    assert calls.count("side_effects") == 2
+
+
+def test_crashed_worker_lease_expires_and_another_process_resumes(tmp_path, pipeline):
+    calls, _ = pipeline
+    crashed = _queue(tmp_path, lease_seconds=0.2)
+    job = crashed.claim(crashed.add([Path("a.json")]).id)
+    outputs = {"title": "t", "content": "c", "categories": []}
+    stats = TokenStats(1, 0, 1, 1, 1, "deepseek-chat").to_dict()
+    fingerprint = job_queue.input_fingerprint(job.input_paths)
+    crashed.checkpoint(job, "summarized", input_fingerprint=fingerprint, llm_outputs=outputs, llm_stats=stats)
+    # ここでプロセスが異常終了した（failもleaseの延長もされない）
+
+    other = _queue(tmp_path, lease_seconds=0.2)
+    other.owner = "other-host:1"
+    with pytest.raises(JobBusyError):
+        other.claim(job.id)
+    assert other.claim() is None
+
+    time.sleep(0.3)
+    resumed = other.claim()
+    assert resumed.id == job.id and resumed.attempts == 2
+    assert job_queue.run_claimed(other, resumed)
+    assert calls == ["post", "record", "side_effects"]
+
+
+def test_worker_drains_queue_and_gives_up_after_max_attempts(tmp_path, pipeline):
+    calls, fails = pipeline
+    queue = _queue(tmp_path, max_attempts=1)
+    ids = [queue.add([Path(f"{name}.json")]).id for name in ("a", "b", "c")]
+    fails.add("summarize")
+
+    assert job_queue.run_worker(queue) == 1
+
+    statuses = [queue.get(job_id).status for job_id in ids]
+    assert statuses == ["failed", "done", "done"]
+    assert [job.id for job in queue.list_jobs()] == [ids[0]]
+    assert queue.claim() is None  # failedは取り出さない
+
+    assert job_queue.run_worker(queue, retry_failed=True) == 0
+    assert queue.get(ids[0]).status == "done"
+
+
+def test_lease_renewal_survives_a_failed_update(tmp_path, monkeypatch):
+    queue = _queue(tmp_path, lease_seconds=0.3)
+    job = queue.claim(queue.add([Path("a.json")]).id)
+    other = _queue(tmp_path, lease_seconds=0.3)
+    other.owner = "other-host:1"
+    renew_lease, failures = queue.renew_lease, []
+
+    def flaky_renew(job):
+        if not failures:
+            failures.append(1)
+            raise sqlite3.OperationalError("database is locked")
+        renew_lease(job)
+
+    monkeypatch.setattr(queue, "renew_lease", flaky_renew)
+    with queue.lease(job):
+        time.sleep(0.6)  # 1回目の延長に失敗しても、延長が止まらなければ期限切れにならない
+        assert failures and other.claim() is None
@@ -1,6 +1,10 @@
+import json
 from pathlib import Path
 
+import pytest
+
 from cha2hatena import json_loader as jl
+from cha2hatena.ingest_state import IngestState
 
 sample_paths = [
     Path(r"sample\ChatGPT-sample.json"),
@@ -22,3 +26,123 @@ def test_json_loader():
 if __name__ == "__main__":
     a = jl.json_loader(sample_paths)
     print(a[:200])
+
+
+def _write_export(path: Path, messages: list) -> Path:
+    data = {"metadata": {"link": "https://example.com/chat"}, "messages": messages}
+    path.write_text(json.dumps(data, ensure_ascii=False, indent=2), encoding="utf-8")
+    return path
+
+
+def test_load_tail_messages_matches_full_load(tmp_path):
+    messages = [
+        {"role": "Prompt", "time": "2025/11/18 10:00:00", "say": '古い会話 {"a": 1}'},
+        {"role": "Response", "time": "2025/11/18 10:01:00", "say": "}, {"},
+        {"role": "Prompt", "time": "2025/11/19 22:00:00", "say": "前日の深夜"},
+        {"role": "Response", "say": "時刻なし"},
+        {"role": "Prompt", "time": "2025/11/20 00:30:00", "say": "日付をまたいだ続き"},
+        {"role": "Response", "time": "2025/11/20 00:31:00", "say": 'code: {\n  "x": [1, {}]\n}'},
+    ]
+    path = _write_export(tmp_path / "Claude-test.json", messages)
+
+    window = jl.load_tail_messages(path)
+
+    assert window == messages[1:]
+    assert jl.convert_to_str(window, "Claude") == jl.convert_to_str(messages, "Claude")
+
+
+def test_load_messages_falls_back_when_messages_is_not_last(tmp_path):
+    messages = [{"role": "Prompt", "time": "2025/11/20 10:00:00", "say": "hello"}]
+    path = tmp_path / "Claude-test.json"
+    path.write_text(json.dumps({"messages": messages, "metadata": {}}), encoding="utf-8")
+
+    with pytest.raises(jl.TailScanError):
+        jl.load_tail_messages(path)
+    assert jl.load_messages(path) == messages
+
+
+def test_incremental_json_loader_reads_only_new_messages(tmp_path):
+    messages = [
+        {"role": "Prompt", "time": "2025/11/18 10:00:00", "say": "一昨日の質問"},
+        {"role": "Response", "time": "2025/11/18 10:01:00", "say": "一昨日の回答"},
+        {"role": "Prompt", "time": "2025/11/20 10:00:00", "say": "今日の質問"},
+    ]
+    path = _write_export(tmp_path / "Claude-test.json", messages)
+    state_path = tmp_path / "state" / "ingest.json"
+
+    # 初回は通常の範囲（当日分）を取り込み、commitまでは位置を保存しない
+    state = IngestState(state_path)
+    first = jl.json_loader([path], state)
+    assert "今日の質問" in first and "一昨日" not in first
+    assert not state_path.exists()
+    state.commit()
+
+    with pytest.raises(jl.NoNewMessagesError):
+        jl.json_loader([path], IngestState(state_path))
+
+    # 日をまたいで追加されたメッセージは区切りで打ち切らずにすべて取り込む
+    messages += [
+        {"role": "Response", "time": "2025/11/20 10:01:00", "say": "今日の回答"},
+        {"role": "Prompt", "time": "2025/11/22 09:00:00", "say": "明後日の質問"},
+    ]
+    _write_export(path, messages)
+    state = IngestState(state_path)
+    second = jl.json_loader([path], state)
+    assert "今日の回答" in second and "明後日の質問" in second and "今日の質問" not in second
+    state.commit()
+    assert IngestState(state_path).get(IngestState.key_for(path, {"link": "https://example.com/chat"}))
+
+
+def test_parallel_json_loader_keeps_order_and_separators(tmp_path, monkeypatch):
+    paths = []
+    for idx in range(4):
+        messages = [
+            {"role": "Prompt", "time": f"2025/11/20 1{idx}:00:00", "say": f"質問{idx}"},
+            {"role": "Response", "time": f"2025/11/20 1{idx}:01:00", "say": f"回答{idx}"},
+        ]
+        paths.append(_write_export(tmp_path / f"Claude-{idx}.json", messages))
+    notes = tmp_path / "notes.txt"
+    notes.write_text("メモ", encoding="utf-8")
+    paths.insert(2, notes)
+
+    serial = jl.json_loader(paths, max_workers=1)
+    monkeypatch.setattr(jl, "PARALLEL_MIN_BYTES", 0)
+    monkeypatch.setattr(jl, "PARALLEL_MIN_BYTES_PER_WORKER", 0)
+    parallel = jl.json_loader(paths, max_workers=2)
+
+    assert parallel == serial
+    assert [serial.index(f"{n}個目の会話") for n in range(1, 6)] == sorted(
+        serial.index(f"{n}個目の会話") for n in range(1, 6)
+    )
+    assert serial.index("質問1") < serial.index("メモ") < serial.index("質問2")
+
+
+def test_parallel_workers_stays_serial_below_thresholds(monkeypatch):
+    mb = 1024 * 1024
+    monkeypatch.setattr(jl, "available_cpus", lambda: 8)
+
+    assert jl.parallel_workers(1, 1024 * mb) == 1  # ファイルが1つ
+    assert jl.parallel_workers(16, 8 * mb) == 1  # 合計サイズが小さい
+    assert jl.parallel_workers(16, 40 * mb) == 2  # 1プロセスあたり16MB以上
+    assert jl.parallel_workers(3, 1024 * mb) == 3  # ファイル数まで
+    assert jl.parallel_workers(16, 1024 * mb) == 8  # CPU数まで
+    assert jl.parallel_workers(16, 1024 * mb, max_workers=4) == 4
+
+    monkeypatch.setattr(jl, "available_cpus", lambda: 1)
+    assert jl.parallel_workers(16, 1024 * mb) == 1
+
+
+def test_json_loader_layout_matches_joined_conversations(tmp_path):
+    messages = [
+        {"role": "Prompt", "time": "2025/11/20 10:00:00", "say": "質問"},
+        {"role": "Response", "time": "2025/11/20 10:01:00", "say": "回答"},
+    ]
+    path = _write_export(tmp_path / "Claude-a.json", messages)
+    notes = tmp_path / "notes.txt"
+    notes.write_text("メモ", encoding="utf-8")
+
+    logs, _ = jl.convert_to_str(messages, "Claude")
+    header = f"{'=' * 20} %d個目の会話 {'=' * 20}\n\n"
+    expected = "\n\n\n".join([header % 1 + "\n" + "\n".join(logs[::-1]), header % 2 + "メモ"])
+
+    assert jl.json_loader([path, notes]) == expected
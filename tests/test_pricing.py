@@ -0,0 +1,74 @@
+import math
+from datetime import date
+
+import pytest
+
+from cha2hatena.llm.llm_stats import TokenStats
+from cha2hatena.llm.pricing import PriceTable, PricingEngine, UnknownModelError, default_engine
+
+
+def test_tiers_are_selected_by_request_input_tokens():
+    engine = default_engine()
+
+    under = engine.fees("gemini-2.5-pro", 200_000, 1_000, 2_000)
+    over = engine.fees("gemini-2.5-pro", 200_001, 1_000, 2_000)
+
+    assert under.input == pytest.approx(200_000 * 1.25 / 1e6)
+    assert under.output == pytest.approx(2_000 * 10.0 / 1e6)
+    assert over.input == pytest.approx(200_001 * 2.5 / 1e6)
+    assert over.thoughts == pytest.approx(1_000 * 15.0 / 1e6)
+
+
+def test_deepseek_cache_hit_tokens_use_cache_price():
+    stats = TokenStats(1_000_000, 0, 1_000, 10, 10, "deepseek-chat", cache_hit_tokens=600_000)
+
+    assert stats.input_fee == pytest.approx(0.4 * 0.28 + 0.6 * 0.028)
+    assert stats.total_fee == pytest.approx(stats.input_fee + 1_000 * 0.42 / 1e6)
+    assert TokenStats.from_dict(stats.to_dict()).input_fee == stats.input_fee
+
+
+def test_effective_dates_select_price_version():
+    engine = PricingEngine(
+        PriceTable.model_validate(
+            {
+                "version": "test",
+                "prices": [
+                    {"model": "m", "effective": "2025-07-01", "tiers": [{"input": 2.0, "output": 2.0}]},
+                    {"model": "m", "effective": "2025-01-01", "tiers": [{"input": 1.0, "output": 1.0}]},
+                ],
+            }
+        )
+    )
+
+    assert engine.fees("m", 1_000_000, day=date(2024, 12, 31)).input == 1.0  # 最初の適用日より前
+    assert engine.fees("m", 1_000_000, day=date(2025, 6, 30)).input == 1.0
+    assert engine.fees("m", 1_000_000, day=date(2025, 7, 1)).input == 2.0
+    with pytest.raises(UnknownModelError):
+        engine.fees("unknown", 1)
+
+
+def test_fee_arrays_match_single_run_pricing():
+    engine = default_engine()
+    runs = [
+        ("gemini-2.5-pro", 150_000, 500, 1_000, 0, "2025-08-01"),
+        ("gemini-2.5-pro", 250_000, 500, 1_000, 0, "2025-08-01"),
+        ("gemini-2.5-flash", 10_000, 0, 300, 0, "2025-08-01"),
+        ("deepseek-reasoner", 80_000, 700, 2_000, 50_000, "2025-10-01"),
+        ("gpt-unknown", 1_000, 0, 10, 0, "2025-10-01"),
+    ]
+    models, inputs, thoughts, outputs, hits, days = zip(*runs)
+
+    fees = engine.fee_arrays(models, inputs, thoughts, outputs, hits, days)
+
+    for i, (model, *tokens, day) in enumerate(runs[:-1]):
+        expected = engine.fees(model, *tokens, day=date.fromisoformat(day))
+        assert fees["input"][i] == pytest.approx(expected.input)
+        assert fees["thoughts"][i] == pytest.approx(expected.thoughts)
+        assert fees["total"][i] == pytest.approx(expected.total)
+    assert math.isnan(fees["total"][-1])
+
+
+def test_unknown_model_fee_is_nan_instead_of_other_model_price():
+    stats = TokenStats(1_000, 0, 100, 10, 10, "gemini-9-ultra")
+
+    assert math.isnan(stats.total_fee)
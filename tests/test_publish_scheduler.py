@@ -0,0 +1,172 @@
+import asyncio
+import sqlite3
+import threading
+import time
+from datetime import datetime, timedelta
+
+from cha2hatena.llm.conversational_ai import BlogPost
+from cha2hatena.publish_scheduler import JST, Publisher, PublishSchedule, PublishSettings, TokenBucket, run_publisher
+
+START = datetime(2026, 1, 1, 9, 0, tzinfo=JST)
+
+
+def _posts(n):
+    return [BlogPost(title=f"記事{i}", content="本文", categories=["Python"]) for i in range(n)]
+
+
+def _result(status_code=201):
+    return {"status_code": status_code, "link_alternate": "https://user.hatenablog.com/entry/1"}
+
+
+def test_add_assigns_spaced_publish_times_after_existing_schedule(tmp_path):
+    schedule = PublishSchedule(tmp_path / "publish.sqlite3", PublishSettings(spacing_minutes=30))
+
+    first = schedule.add(_posts(2), start=START)
+    assert [item.publish_at for item in first] == [START, START + timedelta(minutes=30)]
+
+    # 既存の予定より前のstartでも、最後の予定の次から割り当てる。timezoneなしはJST
+    second = schedule.add(_posts(1), start=datetime(2026, 1, 1, 8, 0))
+    assert second[0].publish_at == START + timedelta(minutes=60)
+    assert second[0].post.title == "記事0"
+
+
+def test_schedule_survives_restart_and_recovers_expired_posts(tmp_path):
+    path = tmp_path / "publish.sqlite3"
+    schedule = PublishSchedule(path, PublishSettings(lease_seconds=60))
+    schedule.add(_posts(3), start=START)
+
+    # 1件目を送信中に終了した状態（期限の延長もされない）
+    claimed = schedule.claim_due(START.timestamp())
+    assert [item.id for item in claimed] == [1]
+    assert schedule.claim_due(START.timestamp()) == []
+
+    # 期限内は他のプロセスが送信中の可能性があるため、戻さず取り出さない
+    other = PublishSchedule(path, PublishSettings(lease_seconds=60))
+    other.owner = "other-host:1"
+    assert other.recover(START.timestamp() + 30) == 0
+    assert other.claim_due(START.timestamp() + 30) == []
+
+    assert other.recover(START.timestamp() + 61) == 1
+    posts = other.list_posts()
+    assert [(item.status, item.attempts) for item in posts] == [("queued", 1), ("queued", 0), ("queued", 0)]
+    assert other.next_publish_at() == START.timestamp()
+    assert [item.id for item in other.claim_due(START.timestamp() + 61)] == [1]
+
+
+def test_lease_is_renewed_while_posting(tmp_path):
+    schedule = PublishSchedule(tmp_path / "publish.sqlite3", PublishSettings(lease_seconds=0.3))
+    schedule.add(_posts(1), start=START)
+    other = PublishSchedule(tmp_path / "publish.sqlite3", PublishSettings(lease_seconds=0.3))
+    other.owner = "other-host:1"
+
+    with schedule.lease():
+        schedule.claim_due()
+        time.sleep(0.5)  # 延長されなければ期限切れになる時間
+        assert other.recover() == 0
+        assert other.claim_due() == []
+
+    time.sleep(0.4)
+    assert other.recover() == 1
+
+
+def test_lease_renewal_survives_a_failed_update(tmp_path, monkeypatch):
+    schedule = PublishSchedule(tmp_path / "publish.sqlite3", PublishSettings(lease_seconds=0.3))
+    schedule.add(_posts(1), start=START)
+    other = PublishSchedule(tmp_path / "publish.sqlite3", PublishSettings(lease_seconds=0.3))
+    other.owner = "other-host:1"
+    renew_lease, failures = schedule.renew_lease, []
+
+    def flaky_renew():
+        if not failures:
+            failures.append(1)
+            raise sqlite3.OperationalError("database is locked")
+        renew_lease()
+
+    monkeypatch.setattr(schedule, "renew_lease", flaky_renew)
+    with schedule.lease():
+        schedule.claim_due()
+        time.sleep(0.6)  # 1回目の延長に失敗しても、延長が止まらなければ期限切れにならない
+        assert failures and other.recover() == 0
+
+
+def test_migrates_schema_version_1(tmp_path):
+    path = tmp_path / "publish.sqlite3"
+    with sqlite3.connect(path) as conn:
+        conn.executescript(
+            "CREATE TABLE posts (id INTEGER PRIMARY KEY, publish_at REAL NOT NULL, status TEXT NOT NULL, "
+            "post TEXT NOT NULL, is_draft INTEGER NOT NULL, attempts INTEGER NOT NULL DEFAULT 0, result TEXT, "
+            "error TEXT, created_at TEXT NOT NULL, updated_at TEXT NOT NULL); PRAGMA user_version = 1;"
+        )
+    conn.close()
+
+    schedule = PublishSchedule(path)
+    schedule.add(_posts(1), start=START)
+    assert [item.id for item in schedule.claim_due(START.timestamp())] == [1]
+
+
+def test_token_bucket_limits_rate_after_burst():
+    now = [0.0]
+    waits = []
+
+    async def fake_sleep(seconds):
+        waits.append(seconds)
+        now[0] += seconds
+
+    async def run():
+        bucket = TokenBucket(rate=0.5, capacity=2, clock=lambda: now[0], sleep=fake_sleep)
+        times = []
+        for _ in range(4):
+            await bucket.acquire()
+            times.append(now[0])
+        return times
+
+    assert asyncio.run(run()) == [0.0, 0.0, 2.0, 4.0]
+    assert waits == [2.0, 2.0]
+
+
+def test_publisher_posts_due_items_within_concurrency(tmp_path):
+    schedule = PublishSchedule(tmp_path / "publish.sqlite3", PublishSettings(concurrency=2, rate_per_minute=6000))
+    schedule.add(_posts(5), start=START)
+    schedule.add(_posts(1), start=datetime.now(JST) + timedelta(days=1))  # まだ公開時刻ではない
+    lock = threading.Lock()
+    active, peak, calls = [0], [0], []
+
+    def post(llm_outputs, is_draft, updated):
+        with lock:
+            active[0] += 1
+            peak[0] = max(peak[0], active[0])
+            calls.append((llm_outputs["title"], updated))
+        time.sleep(0.05)
+        with lock:
+            active[0] -= 1
+        return _result()
+
+    assert run_publisher(schedule, post) == 0
+
+    assert peak[0] == 2
+    assert len(calls) == 5
+    assert dict(calls)["記事4"] == START + timedelta(minutes=60 * 4)  # 公開時刻を投稿の日時にする
+    assert [item.status for item in schedule.list_posts(("queued", "done"))] == ["done"] * 5 + ["queued"]
+
+
+def test_failed_posts_are_retried_until_max_attempts(tmp_path):
+    schedule = PublishSchedule(tmp_path / "publish.sqlite3", PublishSettings(max_attempts=2))
+    schedule.add(_posts(1), start=START)
+
+    def post(llm_outputs, is_draft, updated):
+        raise SystemExit(1)  # 既存のクライアントは致命的なエラーでsys.exitする
+
+    publisher_runs = [asyncio.run(Publisher(schedule, post).run_due()) for _ in range(3)]
+
+    assert publisher_runs == [(0, 1), (0, 1), (0, 0)]
+    item = schedule.get(1)
+    assert (item.status, item.attempts) == ("failed", 2)
+    assert "SystemExit" in item.error
+
+
+def test_error_status_is_recorded_as_failure(tmp_path):
+    schedule = PublishSchedule(tmp_path / "publish.sqlite3")
+    schedule.add(_posts(1), start=START)
+
+    assert run_publisher(schedule, lambda *args, **kwargs: _result(401)) == 1
+    assert schedule.get(1).status == "queued"
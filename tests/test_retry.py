@@ -0,0 +1,182 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+from email.utils import format_datetime
+from types import SimpleNamespace
+
+import pytest
+
+from cha2hatena import retry
+from cha2hatena.retry import RetryPolicy, RetrySettings
+
+
+class _HttpError(Exception):
+    def __init__(self, status, headers=None):
+        super().__init__(f"status {status}")
+        self.response = SimpleNamespace(status_code=status, headers=headers or {})
+
+
+class ConnectTimeout(Exception):
+    """requests.exceptions.ConnectTimeoutと同じ名前（接続前の失敗）"""
+
+
+class ReadTimeout(Exception):
+    """requests.exceptions.ReadTimeoutと同じ名前（送信後の失敗）"""
+
+
+def _policy(**settings):
+    sleeps = []
+    policy = RetryPolicy(RetrySettings(**settings), sleep=sleeps.append, rng=lambda: 1.0)
+    return policy, sleeps
+
+
+def _failing(errors, result="ok"):
+    calls = []
+
+    def func():
+        calls.append(1)
+        if len(calls) <= len(errors):
+            raise errors[len(calls) - 1]
+        return result
+
+    return func, calls
+
+
+@pytest.mark.parametrize(
+    "error, idempotent, expected",
+    [
+        (_HttpError(503), True, True),
+        (_HttpError(429), True, True),
+        (_HttpError(400), True, False),
+        (_HttpError(401), True, False),
+        (_HttpError(503), False, False),  # POSTは処理済みかもしれないため再送しない
+        (_HttpError(429), False, True),
+        (ConnectTimeout(), False, True),
+        (ReadTimeout(), True, True),
+        (ReadTimeout(), False, False),
+        (ValueError(), True, False),
+    ],
+)
+def test_is_retryable_classifies_by_status_and_idempotency(error, idempotent, expected):
+    assert retry.is_retryable(error, idempotent) is expected
+
+
+def test_status_of_reads_sdk_and_requests_errors():
+    assert retry.status_of(SimpleNamespace(status_code=429)) == 429  # openai
+    assert retry.status_of(SimpleNamespace(code=503)) == 503  # google-genai
+    assert retry.status_of(_HttpError(502)) == 502  # requests・gspread
+    assert retry.status_of(ValueError()) is None
+
+
+def test_retries_with_exponential_backoff_then_succeeds():
+    policy, sleeps = _policy(base_delay=1, max_delay=60)
+    func, calls = _failing([_HttpError(503), _HttpError(502)])
+
+    assert policy.call(func) == "ok"
+    assert len(calls) == 3
+    assert sleeps == [1.0, 2.0]  # rng=1.0で上限いっぱい
+
+
+def test_full_jitter_stays_within_bounds():
+    policy = RetryPolicy(RetrySettings(base_delay=1, max_delay=5), rng=lambda: 0.5)
+    assert [policy.delay(attempt, ValueError()) for attempt in range(5)] == [0.5, 1.0, 2.0, 2.5, 2.5]
+
+
+@pytest.mark.parametrize(
+    "value, low, high",
+    [
+        ("7", 7, 7),
+        (timedelta(seconds=30), 25, 30),  # HTTP日付（テストの実行時に現在時刻から作る）
+        ("3600", 60, 60),  # max_delayで打ち切り
+        ("invalid", 0, 1),  # 解釈できなければ通常のバックオフ
+    ],
+)
+def test_retry_after_header_overrides_backoff(value, low, high):
+    if isinstance(value, timedelta):
+        value = format_datetime(datetime.now(timezone.utc) + value, usegmt=True)
+    policy = RetryPolicy(RetrySettings(base_delay=1, max_delay=60), rng=lambda: 1.0)
+    assert low <= policy.delay(0, _HttpError(429, {"Retry-After": value})) <= high
+
+
+def test_non_retryable_error_is_raised_immediately():
+    policy, sleeps = _policy()
+    func, calls = _failing([_HttpError(401)])
+
+    with pytest.raises(_HttpError):
+        policy.call(func)
+    assert len(calls) == 1 and sleeps == []
+
+
+def test_gives_up_after_max_attempts():
+    policy, sleeps = _policy(max_attempts=3)
+    func, calls = _failing([_HttpError(503)] * 5)
+
+    with pytest.raises(_HttpError):
+        policy.call(func)
+    assert len(calls) == 3 and len(sleeps) == 2
+
+
+def test_budget_limits_retries_across_calls():
+    policy, sleeps = _policy(max_attempts=10, budget_initial=2, budget_ratio=0)
+    func, calls = _failing([_HttpError(503)] * 10)
+
+    with pytest.raises(_HttpError):
+        policy.call(func)
+    assert len(calls) == 3  # 枠の2回だけ再試行
+
+    func, calls = _failing([_HttpError(503)])
+    with pytest.raises(_HttpError):
+        policy.call(func)  # 枠を使い切ったので再試行しない
+    assert len(calls) == 1
+
+
+def test_check_status_retries_response_and_returns_last_one():
+    policy, sleeps = _policy(max_attempts=2)
+    responses = iter([SimpleNamespace(status_code=429), SimpleNamespace(status_code=429)])
+
+    response = policy.call(lambda: next(responses), idempotent=False, check_status=True)
+
+    assert response.status_code == 429  # 呼び出し元でエラーとして扱う
+    assert len(sleeps) == 1
+
+    server_error = SimpleNamespace(status_code=500)
+    assert policy.call(lambda: server_error, idempotent=False, check_status=True) is server_error
+    assert len(sleeps) == 1  # POSTの5xxは再送しない
+
+
+def test_discarded_responses_are_closed():
+    policy, _ = _policy(max_attempts=3)
+    closed = []
+
+    def response(status):
+        return SimpleNamespace(status_code=status, close=lambda: closed.append(status))
+
+    responses = iter([response(503), response(502), response(503)])
+
+    last = policy.call(lambda: next(responses), check_status=True)
+
+    assert closed == [503, 502]  # 再試行で捨てたレスポンスのみ。最後のレスポンスは呼び出し元が使う
+    assert last.status_code == 503
+
+
+def test_call_async_waits_without_blocking_other_jobs():
+    policy = RetryPolicy(RetrySettings(base_delay=0.2, max_delay=0.2), sleep=pytest.fail, rng=lambda: 1.0)
+    func, calls = _failing([_HttpError(503)])
+    progress = []
+
+    async def job():
+        # 実際の使い方と同じく、スレッドで実行される同期処理の中でcallする
+        return await asyncio.to_thread(policy.call, func)
+
+    async def other():
+        for _ in range(3):
+            await asyncio.sleep(0.05)
+            progress.append(len(calls))
+
+    async def run():
+        return await asyncio.gather(policy.call_async(job, name="test"), other())
+
+    result, _ = asyncio.run(run())
+
+    assert result == "ok"
+    assert len(calls) == 2
+    assert progress == [1, 1, 1]  # 待機中も他のジョブが進む
@@ -0,0 +1,166 @@
+import subprocess
+import sys
+import textwrap
+import threading
+import time
+
+import pytest
+
+from cha2hatena.llm.conversational_ai import ConversationalAi, LlmConfig
+from cha2hatena.llm.llm_stats import TokenStats
+from cha2hatena.llm.router import AllProvidersFailedError, ProviderHealth, Router, RouterSettings
+
+
+def _config(model):
+    return LlmConfig(prompt="p", model=model, api_key="key", conversation="c")
+
+
+class _FakeAi:
+    """モデルごとの挙動（遅延・失敗）を指定できる要約クライアント"""
+
+    behaviors: dict = {}
+    calls: list = []
+
+    def __init__(self, config):
+        self.model = config.model
+        self.cancelled = threading.Event()
+
+    def cancel(self):
+        self.cancelled.set()
+
+    def get_summary(self):
+        self.calls.append(self.model)
+        delay, error = self.behaviors.get(self.model, (0, None))
+        time.sleep(delay)
+        if error == "exit":
+            sys.exit(1)  # 既存のクライアントは過負荷時にsys.exitする
+        if error:
+            raise RuntimeError(error)
+        return {"title": self.model, "content": "", "categories": []}, TokenStats(1, 0, 1, 1, 1, self.model)
+
+    def get_summary_cached(self, cache):
+        return self.get_summary()
+
+
+@pytest.fixture(autouse=True)
+def _reset():
+    _FakeAi.behaviors = {}
+    _FakeAi.calls = []
+
+
+def _router(settings=None, provider_health=None):
+    settings = settings or RouterSettings(fallback_model="gemini-2.5-flash")
+    configs = [_config("deepseek-chat"), _config("gemini-2.5-flash")]
+    return Router(configs, _FakeAi, settings, provider_health or ProviderHealth())
+
+
+def test_fails_over_to_secondary_model_on_exit_or_error():
+    _FakeAi.behaviors = {"deepseek-chat": (0, "exit")}
+    health = ProviderHealth()
+
+    data, stats = _router(provider_health=health).get_summary()
+
+    assert data["title"] == "gemini-2.5-flash"
+    assert _FakeAi.calls == ["deepseek-chat", "gemini-2.5-flash"]
+    assert health.snapshot()["deepseek-chat"]["errors"] == 1
+
+
+def test_raises_when_all_providers_fail():
+    _FakeAi.behaviors = {"deepseek-chat": (0, "overloaded"), "gemini-2.5-flash": (0, "quota")}
+
+    with pytest.raises(AllProvidersFailedError, match="quota"):
+        _router().get_summary()
+
+
+def test_hedges_slow_primary_and_takes_first_result():
+    _FakeAi.behaviors = {"deepseek-chat": (1.0, None)}
+    settings = RouterSettings(fallback_model="gemini-2.5-flash", hedge_after_seconds=0.1)
+
+    started = time.perf_counter()
+    data, _ = _router(settings).get_summary()
+
+    assert data["title"] == "gemini-2.5-flash"
+    assert time.perf_counter() - started < 0.8  # 遅い主モデルの完了を待たない
+    assert _FakeAi.calls == ["deepseek-chat", "gemini-2.5-flash"]
+
+
+def test_health_orders_fastest_healthy_provider_first():
+    health = ProviderHealth(RouterSettings(unhealthy_after_failures=2, cooldown_seconds=60))
+    models = ["deepseek-chat", "gemini-2.5-flash", "gemini-2.5-pro"]
+    health.record("deepseek-chat", 30.0, ok=True)
+    health.record("gemini-2.5-flash", 5.0, ok=True)
+    health.record("gemini-2.5-pro", 1.0, ok=False)
+    health.record("gemini-2.5-pro", 1.0, ok=False)
+
+    assert health.order(models) == ["gemini-2.5-flash", "deepseek-chat", "gemini-2.5-pro"]
+
+    data, _ = _router(provider_health=health).get_summary()
+    assert data["title"] == "gemini-2.5-flash"  # 計測済みで速いモデルから試す
+
+
+def test_no_hedge_when_primary_answers_in_time():
+    settings = RouterSettings(fallback_model="gemini-2.5-flash", hedge_after_seconds=5)
+
+    data, _ = _router(settings).get_summary()
+
+    assert data["title"] == "deepseek-chat"
+    assert _FakeAi.calls == ["deepseek-chat"]
+
+
+class _SlowCachedAi(ConversationalAi):
+    """deepseek-chatだけ遅い要約クライアント（キャッシュ・打ち切りはConversationalAiのまま）"""
+
+    finished = threading.Event()
+
+    def get_summary(self):
+        if self.model == "deepseek-chat":
+            time.sleep(0.5)
+            self.finished.set()
+        return {"title": self.model, "content": "", "categories": []}, TokenStats(1, 0, 1, 1, 1, self.model)
+
+
+def test_hedge_loser_is_cancelled_and_not_cached(tmp_path):
+    from cha2hatena.llm.summary_cache import SummaryCache
+
+    cache = SummaryCache(tmp_path)
+    settings = RouterSettings(fallback_model="gemini-2.5-flash", hedge_after_seconds=0.1)
+    health = ProviderHealth()
+    configs = [_config("deepseek-chat"), _config("gemini-2.5-flash")]
+
+    data, _ = Router(configs, _SlowCachedAi, settings, health).get_summary_cached(cache)
+    assert data["title"] == "gemini-2.5-flash"
+    assert _SlowCachedAi.finished.wait(2)
+    time.sleep(0.1)
+
+    assert len(list(tmp_path.glob("*.json"))) == 1  # 負けたリクエストの結果はキャッシュしない
+    assert "deepseek-chat" not in health.snapshot()  # 打ち切りはモデルの失敗として記録しない
+
+
+def test_interpreter_does_not_wait_for_hedge_loser():
+    script = textwrap.dedent(
+        """
+        import time
+        from cha2hatena.llm.conversational_ai import LlmConfig
+        from cha2hatena.llm.llm_stats import TokenStats
+        from cha2hatena.llm.router import ProviderHealth, Router, RouterSettings
+
+        class Ai:
+            def __init__(self, config):
+                self.model = config.model
+            def cancel(self):
+                pass
+            def get_summary(self):
+                time.sleep(30 if self.model == "deepseek-chat" else 0)
+                return {"title": self.model}, TokenStats(1, 0, 1, 1, 1, self.model)
+
+        configs = [LlmConfig(prompt="p", model=m, api_key="k", conversation="c")
+                   for m in ("deepseek-chat", "gemini-2.5-flash")]
+        settings = RouterSettings(fallback_model="gemini-2.5-flash", hedge_after_seconds=0.1)
+        print(Router(configs, Ai, settings, ProviderHealth()).get_summary()[0]["title"])
+        """
+    )
+    started = time.perf_counter()
+    result = subprocess.run([sys.executable, "-c", script], capture_output=True, text=True, timeout=20)
+
+    assert result.stdout.strip() == "gemini-2.5-flash"
+    assert time.perf_counter() - started < 10  # 遅いリクエスト（30秒）の完了を待たずに終了
@@ -0,0 +1,92 @@
+import csv
+import sqlite3
+from datetime import date
+
+import pytest
+
+from cha2hatena.run_history import RECORD_COLUMNS, RunHistory, SchemaMismatchError
+
+
+def _record(timestamp, model="deepseek-chat", fee=0.01):
+    record = {key: None for key in RECORD_COLUMNS}
+    record.update(
+        {
+            "timestamp": timestamp,
+            "model": model,
+            "entry_URL": f"https://example.hatenablog.com/{timestamp}",
+            "is_draft": True,
+            "input_tokens": 1000,
+            "total_fee (USD)": fee,
+        }
+    )
+    return record
+
+
+def test_add_and_query_by_day_and_model(tmp_path):
+    history = RunHistory(tmp_path / "history.sqlite3")
+    history.add(_record("2026-01-01T10:00:00"), latency_seconds=12.5)
+    history.add(_record("2026-01-02T10:00:00", model="gemini-2.5-flash"))
+    history.add(_record("2026-01-03T10:00:00"))
+    history.add(_record("2026-01-03T10:00:00"))  # 再試行による重複は無視
+
+    rows = history.query(start=date(2026, 1, 1), end=date(2026, 1, 2))
+    assert [row["day"] for row in rows] == ["2026-01-01", "2026-01-02"]
+    assert rows[0]["latency_seconds"] == 12.5
+    assert rows[0]["is_draft"] == 1
+    assert rows[0]["total_fee_usd"] == 0.01
+    assert len(history.query(model="deepseek-chat")) == 2
+
+
+def test_unknown_columns_are_rejected(tmp_path):
+    history = RunHistory(tmp_path / "history.sqlite3")
+    record = _record("2026-01-01T10:00:00") | {"new_column": 1}
+
+    with pytest.raises(SchemaMismatchError):
+        history.add(record)
+    assert history.query() == []
+
+
+def test_import_csv_is_idempotent(tmp_path):
+    csv_path = tmp_path / "record.csv"
+    with csv_path.open("w", newline="", encoding="utf-8") as f:
+        writer = csv.DictWriter(f, fieldnames=list(RECORD_COLUMNS))
+        writer.writeheader()
+        writer.writerow(_record("2026-01-01T10:00:00"))
+        writer.writerow(_record("2026-01-02T10:00:00", fee=0.02) | {"is_draft": False})
+
+    history = RunHistory(tmp_path / "history.sqlite3")
+    assert history.import_csv(csv_path) == 2
+    assert history.import_csv(csv_path) == 0
+
+    rows = history.query()
+    assert [row["total_fee_usd"] for row in rows] == [0.01, 0.02]
+    assert [row["is_draft"] for row in rows] == [1, 0]
+    assert rows[0]["temperature"] is None  # 空欄はNULL
+
+    history.compact()
+    assert len(history.query()) == 2
+
+
+@pytest.mark.parametrize("added", [[], ["cache_hit_tokens"]])  # 列の追加の途中で異常終了した場合も含む
+def test_migrates_schema_version_1(tmp_path, added):
+    path = tmp_path / "history.sqlite3"
+    old_columns = [
+        f"{name} {sql_type}"
+        for key, (name, sql_type) in RECORD_COLUMNS.items()
+        if name not in ("cache_hit_tokens", "api_requests") or name in added
+    ]
+    with sqlite3.connect(path) as conn:
+        conn.executescript(
+            f"CREATE TABLE runs (id INTEGER PRIMARY KEY, {', '.join(old_columns)}, day TEXT NOT NULL, "
+            "latency_seconds REAL, UNIQUE (timestamp, model, entry_url)); PRAGMA user_version = 1;"
+        )
+        conn.execute(
+            "INSERT INTO runs (timestamp, model, day) VALUES ('2026-01-01T10:00:00', 'deepseek-chat', '2026-01-01')"
+        )
+    conn.close()
+
+    history = RunHistory(path)
+    history.add(_record("2026-01-02T10:00:00") | {"cache_hit_tokens": 800, "api_requests": 1})
+
+    rows = history.query()
+    assert [(row["cache_hit_tokens"], row["api_requests"]) for row in rows] == [(None, None), (800, 1)]
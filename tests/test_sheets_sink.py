@@ -0,0 +1,141 @@
+import json
+from pathlib import Path
+from types import SimpleNamespace
+
+import gspread
+import pytest
+
+from cha2hatena import main
+from cha2hatena.llm.conversational_ai import LlmConfig
+from cha2hatena.llm.llm_stats import TokenStats
+from cha2hatena.sheets_sink import SheetsSink
+
+
+class FakeWorksheet:
+    """gspreadのWorksheetの代わり（呼び出し回数を記録）"""
+
+    def __init__(self, rows=None):
+        self.rows = [list(row) for row in rows or []]
+        self.calls = {"row_values": 0, "append_rows": 0, "get_all_values": 0}
+        self.fail = False
+
+    def row_values(self, row):
+        self.calls["row_values"] += 1
+        return list(self.rows[row - 1]) if len(self.rows) >= row else []
+
+    def get_all_values(self):
+        self.calls["get_all_values"] += 1
+        return [list(row) for row in self.rows]
+
+    def append_rows(self, values, value_input_option="RAW"):
+        self.calls["append_rows"] += 1
+        json.dumps(values, allow_nan=False)  # APIはJSONで送るため、NaNなどは送れない
+        if self.fail:
+            raise gspread.exceptions.GSpreadException("quota exceeded")
+        self.rows += [list(row) for row in values]
+
+
+class FakeClient:
+    def __init__(self, sheets=None):
+        self.sheets = sheets or {}
+        self.opened = 0
+
+    def open(self, name):
+        self.opened += 1
+        if name not in self.sheets:
+            raise gspread.exceptions.SpreadsheetNotFound
+        return type("Spreadsheet", (), {"sheet1": self.sheets[name]})()
+
+    def create(self, name):
+        self.sheets[name] = FakeWorksheet()
+        return type("Spreadsheet", (), {"sheet1": self.sheets[name]})()
+
+
+def _factory(client):
+    calls = []
+
+    def factory():
+        calls.append(1)
+        return client
+
+    return factory, calls
+
+
+def test_new_spreadsheet_gets_header_and_rows_in_one_batch():
+    client = FakeClient()
+    factory, auth_calls = _factory(client)
+    sink = SheetsSink("record", factory)
+
+    sink.append({"timestamp": "t1", "fee": 0.1})
+    sink.append({"timestamp": "t2", "fee": 0.2})
+    assert sink.flush() == 2
+    sink.append({"timestamp": "t3", "fee": 0.3})
+    sink.flush()
+
+    sheet = client.sheets["record"]
+    assert sheet.rows == [["timestamp", "fee"], ["t1", 0.1], ["t2", 0.2], ["t3", 0.3]]
+    assert sheet.calls == {"row_values": 1, "append_rows": 2, "get_all_values": 0}
+    assert len(auth_calls) == 1 and client.opened == 1  # 認証・シートの取得は1回だけ
+
+
+def test_existing_header_orders_columns():
+    sheet = FakeWorksheet([["fee", "timestamp"], [0.5, "t0"]])
+    sink = SheetsSink("record", _factory(FakeClient({"record": sheet}))[0])
+
+    sink.append({"timestamp": "t1", "fee": 0.1})
+    sink.flush()
+
+    assert sheet.rows[-1] == [0.1, "t1"]
+    assert len(sheet.rows) == 3
+
+
+def test_flush_size_and_failed_flush_keeps_rows():
+    sheet = FakeWorksheet([["n"]])
+    sink = SheetsSink("record", _factory(FakeClient({"record": sheet}))[0], flush_size=3)
+
+    sink.append({"n": 1})
+    sink.append({"n": 2})
+    assert sheet.calls["append_rows"] == 0
+    sink.append({"n": 3})
+    assert sheet.calls["append_rows"] == 1
+
+    sheet.fail = True
+    sink.append({"n": 4})
+    with pytest.raises(gspread.exceptions.GSpreadException):
+        sink.flush()
+    assert sink.pending == [{"n": 4}]
+
+    sheet.fail = False
+    sink.flush()
+    assert sheet.rows == [["n"], [1], [2], [3], [4]]
+
+
+def test_failed_write_is_left_to_retry_queue():
+    sheet = FakeWorksheet([["n"]])
+    sink = SheetsSink("record", _factory(FakeClient({"record": sheet}))[0])
+    sink.append({"n": 1})  # バッチで溜めていた行は送信待ちに残す
+
+    sheet.fail = True
+    with pytest.raises(gspread.exceptions.GSpreadException):
+        sink.write({"n": 2})
+    assert sink.pending == [{"n": 1}]
+
+    # 再試行キューから読み込んだ同じ内容の行（別のジョブの書き込みと同じプロセスで再試行）
+    sheet.fail = False
+    sink.write({"n": 2})
+    sink.write({"n": 3})
+    assert sheet.rows == [["n"], [1], [2], [3]]
+
+
+def test_unknown_model_fee_is_written_as_empty_cell(monkeypatch):
+    llm_config = LlmConfig(prompt="p", model="gemini-2.5-flash", api_key="key12345", conversation="")
+    monkeypatch.setattr(main, "app_context", lambda: SimpleNamespace(llm_config=llm_config))
+    result = {"title": "t", "content": "c", "categories": [], "link_alternate": "https://example.com/1"}
+
+    record = main.build_record([Path("Claude-a.json")], result, TokenStats(1000, 0, 100, 10, 10, "gemini-9"), 150.0)
+
+    assert record["total_fee (USD)"] is None and record["total_fee (JPY)"] is None
+    worksheet = FakeWorksheet()
+    sink = SheetsSink("record", _factory(FakeClient({"record": worksheet}))[0])
+    assert sink.write(record) == 1
+    assert worksheet.rows[1][list(record).index("input_tokens")] == 1000
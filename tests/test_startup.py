@@ -0,0 +1,43 @@
+import os
+import subprocess
+import sys
+
+# cha2hatena.mainのimportにかける時間の上限（ミリ秒）。CI等の遅い環境も考慮して余裕を持たせる
+IMPORT_BUDGET_MS = 500
+# 各段階で初めて読み込む重いライブラリ
+HEAVY_MODULES = ["gspread", "yfinance", "pandas", "numpy", "requests", "openai", "google.genai"]
+
+
+def _run(args: list[str], cwd) -> subprocess.CompletedProcess:
+    env = {k: v for k, v in os.environ.items() if k != "DEBUG"}
+    return subprocess.run([sys.executable, *args], cwd=cwd, env=env, capture_output=True, text=True, timeout=60)
+
+
+def _importtime(cwd) -> dict[str, int]:
+    """python -X importtimeの出力から、モジュールごとの累積時間（マイクロ秒）"""
+    result = _run(["-X", "importtime", "-c", "import cha2hatena.main"], cwd)
+    assert result.returncode == 0, result.stderr
+    times = {}
+    for line in result.stderr.splitlines():
+        if line.startswith("import time:") and "|" in line:
+            _, cumulative, name = line.split("|")
+            if cumulative.strip().isdigit():
+                times[name.strip()] = int(cumulative)
+    return times
+
+
+def test_import_main_is_fast_and_has_no_side_effects(tmp_path):
+    runs = [_importtime(tmp_path) for _ in range(3)]
+
+    best_ms = min(times["cha2hatena.main"] for times in runs) / 1000
+    assert best_ms < IMPORT_BUDGET_MS, f"import cha2hatena.main: {best_ms:.0f}ms"
+    assert not [name for name in HEAVY_MODULES if name in runs[0]]
+    assert not (tmp_path / "app.log").exists()  # import時にログファイルを作らない
+
+
+def test_help_does_not_load_config(tmp_path):
+    result = _run(["-m", "cha2hatena", "--help"], tmp_path)  # config.yamlのない場所で実行
+
+    assert result.returncode == 0
+    assert "usage: cha2hatena" in result.stdout
+    assert not (tmp_path / "app.log").exists()
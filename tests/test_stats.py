@@ -0,0 +1,102 @@
+from datetime import date
+
+import pytest
+
+from cha2hatena.run_history import RECORD_COLUMNS, RunHistory
+from cha2hatena.stats import (
+    LOAD_COLUMNS,
+    StatsSettings,
+    aggregate,
+    build_report,
+    burn_down,
+    percentiles,
+    reprice,
+)
+
+
+def _add(history, timestamp, model, ai_name, fee, latency):
+    record = {key: None for key in RECORD_COLUMNS}
+    record.update(
+        {"timestamp": timestamp, "model": model, "AI_name": ai_name, "input_tokens": 100, "total_fee (USD)": fee}
+    )
+    history.add(record, latency_seconds=latency)
+
+
+@pytest.fixture
+def history(tmp_path):
+    history = RunHistory(tmp_path / "history.sqlite3")
+    _add(history, "2026-03-01T09:00:00", "deepseek-chat", "Claude", 0.10, 10.0)
+    _add(history, "2026-03-01T10:00:00", "gemini-2.5-flash", "Gemini", 0.20, 20.0)
+    _add(history, "2026-03-03T10:00:00", "deepseek-chat", "Claude", 0.30, 30.0)
+    return history
+
+
+def test_aggregate_by_day_model_and_ai(history):
+    runs = history.read_frame(LOAD_COLUMNS)
+
+    by_day = aggregate(runs, "day")
+    assert by_day["runs"].tolist() == [2, 1]
+    assert by_day["total_fee_usd"].tolist() == pytest.approx([0.30, 0.30])
+
+    by_model = aggregate(runs, "model")
+    assert by_model.loc["deepseek-chat", "input_tokens"] == 200
+    assert by_model.loc["deepseek-chat", "mean_latency"] == pytest.approx(20.0)
+    assert aggregate(runs, "ai").loc["Gemini", "runs"] == 1
+
+
+def test_percentiles_skip_missing_latency(history):
+    _add(history, "2026-03-04T10:00:00", "deepseek-chat", "Claude", 0.40, None)  # CSVから取り込んだ行
+    runs = history.read_frame(["latency_seconds", "total_fee_usd"])
+
+    result = percentiles(runs, [50, 100])
+
+    assert result.loc["p50", "latency_seconds"] == pytest.approx(20.0)
+    assert result.loc["p100", "total_fee_usd"] == pytest.approx(0.40)
+
+
+def test_burn_down_fills_missing_days_and_projects_month_end(history):
+    runs = history.read_frame(["day", "total_fee_usd"])
+
+    table = burn_down(runs, budget=10.0, today=date(2026, 3, 4))
+
+    assert table.index.tolist() == ["2026-03-01", "2026-03-02", "2026-03-03", "2026-03-04"]
+    assert table["cumulative"].tolist() == pytest.approx([0.3, 0.3, 0.6, 0.6])
+    assert table["remaining"].iloc[-1] == pytest.approx(9.4)
+    assert table["projected"].iloc[-1] == pytest.approx(0.6 / 4 * 31)
+
+
+def test_build_report_filters_and_handles_empty(history):
+    settings = StatsSettings(monthly_budget_usd=1.0)
+
+    report = build_report(history, settings, ["model"], model="deepseek-chat", today=date(2026, 3, 3))
+
+    assert "実行回数: 2" in report
+    assert "gemini" not in report.split("■ 今月の予算消化")[0]
+    assert "消化率: 60.0%" in report
+    assert build_report(history, settings, ["day"], start=date(2027, 1, 1)) == "該当する実行履歴がありません。"
+
+
+def test_reprice_uses_token_breakdown_and_keeps_legacy_fees(history):
+    # 2回のAPI呼び出しで入力2000（うちキャッシュヒット1200）・出力1000。記録時は誤った料金
+    record = {key: None for key in RECORD_COLUMNS}
+    record.update(
+        {
+            "timestamp": "2026-03-04T10:00:00",
+            "model": "deepseek-chat",
+            "input_tokens": 2000,
+            "cache_hit_tokens": 1200,
+            "output_tokens": 1000,
+            "api_requests": 2,
+            "total_fee (USD)": 1.0,
+            "total_fee (JPY)": 150.0,
+        }
+    )
+    history.add(record)
+    history.add(record | {"timestamp": "2026-03-05T10:00:00", "model": "unknown-model"})
+    history.add(record | {"timestamp": "2026-03-06T10:00:00", "api_requests": 0, "total_fee (USD)": 0.0})
+
+    runs = reprice(history.read_frame(LOAD_COLUMNS))
+
+    fee = (800 * 0.28 + 1200 * 0.028 + 1000 * 0.42) / 1_000_000
+    assert runs["total_fee_usd"].tolist() == pytest.approx([0.10, 0.20, 0.30, fee, 1.0, 0.0])
+    assert runs["total_fee_jpy"].iloc[3] == pytest.approx(fee * 150)
@@ -0,0 +1,125 @@
+import json
+from types import SimpleNamespace
+
+import pytest
+
+from cha2hatena.llm import deepseek_client
+from cha2hatena.llm.conversational_ai import LlmConfig
+from cha2hatena.llm.streaming import IncrementalJsonParser, StreamFormatError
+
+POST = {
+    "title": "「引用」と {括弧} を含むタイトル",
+    "categories": ["Python", "JSON"],
+    "content": 'エスケープ \\" \\\\ と改行\n[リスト] {"a": 1}',
+}
+
+
+def test_parser_reports_fields_as_soon_as_each_value_closes():
+    text = json.dumps(POST, ensure_ascii=False, indent=1)
+    seen = []
+    parser = IncrementalJsonParser(lambda key, value: seen.append((key, len(parser.text))))
+
+    for char in text:  # 1文字ずつ届いても同じ結果
+        parser.feed(char)
+
+    assert parser.close() == POST
+    assert [key for key, _ in seen] == ["title", "categories", "content"]
+    assert seen[1][1] == text.index("]") + 1  # 本文を待たず、閉じ括弧が届いた時点で取得
+
+
+def test_parser_handles_scalars_and_empty_object():
+    parser = IncrementalJsonParser()
+    parser.feed('{"n": 12')
+    parser.feed('.5, "ok": true , "none":null}')
+    assert parser.close() == {"n": 12.5, "ok": True, "none": None}
+
+    empty = IncrementalJsonParser()
+    empty.feed(" {} ")
+    assert empty.close() == {}
+
+
+@pytest.mark.parametrize(
+    "chunks",
+    [
+        ["以下がJSONです: {"],  # 前置きの文章
+        ['{"title": "a", "summary"'],  # スキーマにないキー
+        ['{"title" "a"}'],
+        ['{"title": "a"} 以上です'],
+    ],
+)
+def test_parser_detects_malformed_output_early(chunks):
+    parser = IncrementalJsonParser(allowed_keys=POST)
+
+    with pytest.raises(StreamFormatError):
+        for chunk in chunks:
+            parser.feed(chunk)
+
+
+def test_parser_detects_truncated_output():
+    parser = IncrementalJsonParser()
+    parser.feed('{"title": "途中')
+
+    with pytest.raises(StreamFormatError):
+        parser.close()
+
+
+class _FakeStream:
+    def __init__(self, chunks):
+        self.chunks = chunks
+        self.sent = 0
+        self.closed = False
+
+    def __iter__(self):
+        for chunk in self.chunks:
+            self.sent += 1
+            yield chunk
+
+    def close(self):
+        self.closed = True
+
+
+def _chunk(content=None, reasoning=None, usage=None):
+    delta = SimpleNamespace(content=content, reasoning_content=reasoning)
+    choices = [] if usage is not None else [SimpleNamespace(delta=delta)]
+    return SimpleNamespace(choices=choices, usage=usage)
+
+
+def _client(monkeypatch, stream):
+    completions = SimpleNamespace(create=lambda **kwargs: stream)
+    fake = SimpleNamespace(chat=SimpleNamespace(completions=completions))
+    monkeypatch.setattr(deepseek_client, "_sdk_client", lambda api_key, timeout: fake)
+    config = LlmConfig(prompt="p", model="deepseek-reasoner", api_key="key", conversation="c", stream=True)
+    return deepseek_client.DeepseekClient(config)
+
+
+def test_deepseek_stream_collects_output_usage_and_timing(monkeypatch):
+    text = json.dumps(POST, ensure_ascii=False)
+    usage = SimpleNamespace(
+        prompt_tokens=100,
+        completion_tokens=50,
+        completion_tokens_details=SimpleNamespace(reasoning_tokens=20),
+        prompt_cache_hit_tokens=60,
+    )
+    chunks = [_chunk(content=""), _chunk(reasoning="考え中")]
+    chunks += [_chunk(content=text[i : i + 7]) for i in range(0, len(text), 7)]
+    stream = _FakeStream(chunks + [_chunk(usage=usage)])
+
+    data, stats = _client(monkeypatch, stream).get_summary()
+
+    assert data == POST
+    assert (stats.input_tokens, stats.thoughts_tokens, stats.output_tokens, stats.cache_hit_tokens) == (100, 20, 50, 60)
+    assert stats.ttft_seconds is not None and stats.ttft_seconds >= 0
+    assert stats.tokens_per_second > 0
+    assert stream.closed
+
+
+def test_deepseek_stream_stops_reading_malformed_output(monkeypatch, tmp_path):
+    monkeypatch.chdir(tmp_path)
+    stream = _FakeStream([_chunk(content="申し訳ありませんが"), *[_chunk(content="x") for _ in range(100)]])
+
+    with pytest.raises(SystemExit):
+        _client(monkeypatch, stream).get_summary()
+
+    assert stream.sent == 1  # 残りのチャンクは読まない
+    assert stream.closed
+    assert (tmp_path / "outputs" / "__summary.txt").read_text(encoding="utf-8") == "申し訳ありませんが"
@@ -0,0 +1,79 @@
+import os
+
+from cha2hatena.llm.conversational_ai import ConversationalAi, LlmConfig
+from cha2hatena.llm.deepseek_client import DeepseekClient
+from cha2hatena.llm.llm_stats import TokenStats
+from cha2hatena.llm.summary_cache import SummaryCache
+
+
+class _CountingAi(ConversationalAi):
+    calls = 0
+
+    def get_summary(self) -> tuple[dict, TokenStats]:
+        type(self).calls += 1
+        data = {"title": "タイトル", "content": "本文", "categories": ["テスト"]}
+        return data, TokenStats(1000, 200, 300, len(self.prompt), 2, self.model)
+
+
+def _config(**kwargs) -> LlmConfig:
+    params = {"prompt": "要約して", "model": "gemini-2.5-flash", "api_key": "dummy", "conversation": "会話ログ"}
+    return LlmConfig(**{**params, **kwargs})
+
+
+def test_get_summary_cached_skips_api_on_identical_prompt(tmp_path):
+    cache = SummaryCache(tmp_path)
+    _CountingAi.calls = 0
+
+    first_data, first_stats = _CountingAi(_config()).get_summary_cached(cache)
+    second_data, second_stats = _CountingAi(_config()).get_summary_cached(cache)
+    _CountingAi(_config(temperature=0.5)).get_summary_cached(cache)
+    _CountingAi(_config()).get_summary_cached(None)
+
+    assert _CountingAi.calls == 3
+    assert second_data == first_data
+    assert second_stats.from_cache and not first_stats.from_cache
+    assert second_stats.total_fee == first_stats.total_fee
+
+
+def test_deepseek_prompt_is_built_once_with_schema_prefix():
+    client = DeepseekClient(_config(model="deepseek-chat", append_statement=False))
+
+    assert client.prompt.startswith("次の行から示すプロンプトは")
+    assert client.prompt.endswith("要約して\n\n会話ログ")
+
+
+def test_evict_removes_least_recently_used(tmp_path):
+    stats = TokenStats(1, 0, 1, 1, 1, "gemini-2.5-flash")
+    cache = SummaryCache(tmp_path, max_bytes=10**6)
+    for idx, key in enumerate(["a", "b", "c"]):
+        cache.put(key, {"title": key, "content": "x" * 100, "categories": []}, stats)
+        os.utime(tmp_path / f"{key}.json", (idx, idx))
+    cache.get("a")  # 参照すると最新扱い
+
+    cache.max_bytes = 2 * (tmp_path / "a.json").stat().st_size
+    cache.evict()
+
+    assert sorted(p.stem for p in tmp_path.glob("*.json")) == ["a", "c"]
+
+
+def test_cached_rerun_is_recorded_without_cost(tmp_path, monkeypatch):
+    from types import SimpleNamespace
+
+    from cha2hatena import main as app
+    from cha2hatena.run_history import RunHistory
+
+    monkeypatch.setattr(app, "app_context", lambda: SimpleNamespace(llm_config=_config()))
+    cache = SummaryCache(tmp_path / "cache")
+    history = RunHistory(tmp_path / "history.sqlite3")
+    result = {"title": "タイトル", "content": "本文", "categories": [], "link_alternate": "https://example.com/1"}
+    paths = [tmp_path / "Claude-会話.json"]
+
+    for _ in range(2):  # 2回目は投稿の失敗などで再実行した場合
+        _, stats = _CountingAi(_config()).get_summary_cached(cache)
+        record = app.build_record(paths, result, stats, 150.0)
+        history.add(record)
+
+    first, second = history.query()
+    assert first["total_fee_usd"] > 0 and first["input_tokens"] == 1000
+    assert (second["total_fee_usd"], second["total_fee_jpy"], second["input_tokens"]) == (0, 0, 0)
+    assert second["input_letter_count"] == first["input_letter_count"]
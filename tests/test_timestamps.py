@@ -0,0 +1,64 @@
+import random
+from datetime import datetime, timedelta
+
+import pytest
+
+from cha2hatena import timestamps as ts
+from cha2hatena.json_loader import convert_to_str
+
+
+def _reference_start(stamps: list) -> int:
+    """strptimeで1件ずつ判定する従来の打ち切り位置"""
+    latest_dt = previous_dt = datetime.strptime(stamps[-1], ts.DT_FORMAT) if stamps[-1] else None
+    for i in range(len(stamps) - 1, -1, -1):
+        if not stamps[i]:
+            continue
+        msg_dt = datetime.strptime(stamps[i], ts.DT_FORMAT)
+        if ts.is_session_break(msg_dt, latest_dt, previous_dt):
+            return i + 1
+        previous_dt = msg_dt
+    return 0
+
+
+def _random_stamps(rng: random.Random, count: int) -> list:
+    dt = datetime(2025, 11, 1, 9, 0, 0)
+    stamps = []
+    for _ in range(count):
+        dt += timedelta(seconds=rng.choice([30, 600, 3 * 3600, 3 * 3600 + 1, 20 * 3600]))
+        stamps.append(None if rng.random() < 0.1 else dt.strftime(ts.DT_FORMAT))
+    return stamps
+
+
+@pytest.mark.parametrize("text", ["2025/11/20 09:05:07", "1999/01/31 23:59:59", "2025/1/2 3:04:05"])
+def test_parse_timestamp_matches_strptime(text):
+    assert ts.parse_timestamp(text) == datetime.strptime(text, ts.DT_FORMAT)
+
+
+def test_parse_timestamp_rejects_invalid():
+    with pytest.raises(ValueError):
+        ts.parse_timestamp("2025/13/01 00:00:00")
+
+
+@pytest.mark.parametrize("vectorize_min", [1, 10**9])  # NumPy / 1件ずつ
+def test_find_session_start_matches_reference(monkeypatch, vectorize_min):
+    monkeypatch.setattr(ts, "VECTORIZE_MIN", vectorize_min)
+    rng = random.Random(0)
+    for _ in range(200):
+        stamps = _random_stamps(rng, rng.randint(1, 40))
+        assert ts.find_session_start(stamps) == _reference_start(stamps)
+
+
+def test_convert_to_str_returns_break_message_time():
+    messages = [
+        {"role": "Prompt", "time": "2025/11/18 10:00:00", "say": "前日"},
+        {"role": "Response", "time": "2025/11/18 10:01:00", "say": "前日の回答"},
+        {"role": "Prompt", "time": "2025/11/20 09:00:00", "say": "当日"},
+        {"role": "Response", "say": "時刻なし"},
+    ]
+
+    logs, timestamp = convert_to_str(messages, "Claude")
+    assert len(logs) == 4  # 最新のメッセージに時刻がない場合はすべて取り込む
+
+    logs, timestamp = convert_to_str(messages[:3], "Claude")
+    assert len(logs) == 1 and "当日" in logs[0]
+    assert timestamp == "2025/11/18 10:01:00"
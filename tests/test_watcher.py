@@ -0,0 +1,68 @@
+import asyncio
+from pathlib import Path
+
+from cha2hatena import watcher
+
+
+def test_debouncer_waits_until_changes_settle():
+    debouncer = watcher.Debouncer(seconds=5)
+    path = Path("Claude-a.json")
+
+    debouncer.touch(path, now=0)
+    debouncer.touch(path, now=3)
+
+    assert debouncer.due(now=7) == []
+    assert debouncer.due(now=8) == [path]
+    assert debouncer.due(now=20) == []
+
+
+def test_scan_reports_new_and_modified_files(tmp_path):
+    first = tmp_path / "Claude-a.json"
+    first.write_text("{}", encoding="utf-8")
+    (tmp_path / "image.png").write_bytes(b"x")
+    before = watcher.scan(tmp_path)
+
+    first.write_text('{"messages": []}', encoding="utf-8")
+    second = tmp_path / "notes.txt"
+    second.write_text("メモ", encoding="utf-8")
+
+    assert list(before) == [first]
+    assert sorted(watcher.changed_paths(before, watcher.scan(tmp_path))) == sorted([first, second])
+
+
+class _FakeRunner:
+    def __init__(self):
+        self.jobs = []
+        self.done = asyncio.Event()
+
+    def refresh_dy_rate(self):
+        pass
+
+    async def flush(self):
+        pass
+
+    async def run_job(self, job):
+        self.jobs.append(job)
+        self.done.set()
+        return {"ok": True}
+
+
+def test_watch_pushes_settled_changes_through_runner(tmp_path):
+    settings = watcher.WatchSettings(debounce_seconds=0.1, poll_interval=0.02)
+    runner = _FakeRunner()
+    (tmp_path / "Claude-old.json").write_text("{}", encoding="utf-8")
+
+    async def scenario():
+        task = asyncio.create_task(watcher.watch(tmp_path, settings, runner, force_polling=True))
+        await asyncio.sleep(0.05)
+        path = tmp_path / "Claude-new.json"
+        for size in range(3):  # 書き込み途中の変更はまとめて1回
+            path.write_text("x" * (size + 1), encoding="utf-8")
+            await asyncio.sleep(0.03)
+        await asyncio.wait_for(runner.done.wait(), timeout=5)
+        await asyncio.sleep(0.3)
+        task.cancel()
+
+    asyncio.run(scenario())
+
+    assert [job.paths for job in runner.jobs] == [[tmp_path / "Claude-new.json"]]